@@ -0,0 +1,138 @@
+"""
+ASGI entry point served by uvicorn (``start.py`` and ``python main.py`` run ``asgi:app``).
+
+The server binds and answers ``/health`` straight away while ``main`` (FastAPI,
+NumPy, OpenCV and the image services) is imported on a background thread.
+Other requests wait for that import and are then handed to ``main.app``, whose
+startup hooks run as soon as it is loaded. Until then ``/ready`` answers 503.
+If the import or the startup hooks fail the process exits with status 1, as
+uvicorn does when it cannot load an app (Electron then installs dependencies).
+"""
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from config import ALLOWED_ORIGINS
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class DeferredApp:
+    """Serve the ASGI app ``module.attribute``, importing it in the background on startup"""
+
+    def __init__(self, module: str, attribute: str = "app"):
+        self.module = module
+        self.attribute = attribute
+        self.app = None
+        self.load_seconds = None
+        self._loaded = None
+        self._lifespan_scope = None
+        self._lifespan_events = None
+        self._lifespan_task = None
+        self._lifespan_done = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(scope, receive, send)
+            return
+        self._start_loading()
+        if not self._loaded.is_set():
+            if scope["type"] == "http" and scope["path"] == "/health":
+                await self._respond(scope, send, 200, {"status": "healthy"})
+                return
+            if scope["type"] == "http" and scope["path"] == "/ready":
+                await self._respond(scope, send, 503, {"ready": False, "stage": "loading"})
+                return
+            await self._loaded.wait()
+        await self.app(scope, receive, send)
+
+    def _start_loading(self):
+        if self._loaded is not None:
+            return
+        self._loaded = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._import, args=(loop,), name="visionforge-import", daemon=True).start()
+
+    def _import(self, loop):
+        started = time.perf_counter()
+        try:
+            app = getattr(importlib.import_module(self.module), self.attribute)
+            error = None
+        except Exception as e:
+            logger.exception("Could not import %s", self.module)
+            app, error = None, e
+        self.load_seconds = time.perf_counter() - started
+        loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._loaded_app(app, error)))
+
+    async def _loaded_app(self, app, error):
+        if error is None and self._lifespan_scope is not None:
+            try:
+                await self._start_lifespan(app)
+            except Exception as e:
+                logger.exception("Startup of %s failed", self.module)
+                error = e
+        if error is not None:
+            sys.stderr.flush()
+            os._exit(1)
+        self.app = app
+        logger.info("Loaded %s in %.0f ms", self.module, self.load_seconds * 1000)
+        self._loaded.set()
+
+    async def _lifespan(self, scope, receive, send):
+        """Answer the server's lifespan at once and run the app's own lifespan once it is imported"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._lifespan_scope = scope
+                self._start_loading()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._loaded is not None:
+                    await self._loaded.wait()
+                if self._lifespan_task is not None:
+                    await self._lifespan_events.put({"type": "lifespan.shutdown"})
+                    await asyncio.wait([self._lifespan_done, self._lifespan_task],
+                                       return_when=asyncio.FIRST_COMPLETED)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _start_lifespan(self, app):
+        loop = asyncio.get_running_loop()
+        self._lifespan_events = asyncio.Queue()
+        started = loop.create_future()
+        self._lifespan_done = loop.create_future()
+
+        async def send(message):
+            if message["type"] == "lifespan.startup.complete":
+                started.set_result(None)
+            elif message["type"] == "lifespan.startup.failed":
+                started.set_exception(RuntimeError(message.get("message", "")))
+            elif message["type"].startswith("lifespan.shutdown"):
+                self._lifespan_done.set_result(None)
+
+        self._lifespan_task = asyncio.ensure_future(app(self._lifespan_scope, self._lifespan_events.get, send))
+        await self._lifespan_events.put({"type": "lifespan.startup"})
+        await asyncio.wait([started, self._lifespan_task], return_when=asyncio.FIRST_COMPLETED)
+        if started.done():
+            started.result()
+        else:
+            # The app does not implement lifespan
+            self._lifespan_task = None
+
+    async def _respond(self, scope, send, status: int, body: dict):
+        headers = [(b"content-type", b"application/json")]
+        if status == 503:
+            headers.append((b"retry-after", b"1"))
+        origin = dict(scope["headers"]).get(b"origin")
+        if origin and ("*" in ALLOWED_ORIGINS or origin.decode("latin-1") in ALLOWED_ORIGINS):
+            headers += [(b"access-control-allow-origin", origin), (b"vary", b"Origin")]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+app = DeferredApp("main")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Time the blur engine per method and kernel size, exact vs. fast accuracy.
+
+Usage (from backend/):
+    python benchmarks/bench_blur.py [--megapixels 12] [--ksizes 5 9 13 17 21 31] [--repeat 3]
+
+For each method and window, prints the best wall time of ``accuracy="exact"``
+and ``accuracy="fast"`` and the PSNR of the fast output against the exact one.
+Gaussian and box blur must come out identical in both modes (and median and
+bilateral below their approximation thresholds); the script exits with status
+1 if they do not.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.bench_pipeline import synthetic_image  # noqa: E402
+from services.blur import apply_blur, approximates  # noqa: E402
+
+METHODS = ("gaussian", "box", "median", "bilateral")
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def psnr(reference: np.ndarray, image: np.ndarray) -> float:
+    mse = np.mean((reference.astype(np.float64) - image) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--ksizes", type=int, nargs="+", default=[5, 9, 13, 17, 21, 31])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    image = synthetic_image(args.megapixels)
+    print(f"{image.shape[1]}x{image.shape[0]}, best of {args.repeat}")
+
+    failures = 0
+    for method in METHODS:
+        for ksize in args.ksizes:
+            exact_t, exact = best_of(lambda: apply_blur(image, method, ksize), args.repeat)
+            fast_t, fast = best_of(lambda: apply_blur(image, method, ksize, fast=True), args.repeat)
+            quality = psnr(exact, fast)
+            approximate = approximates(method, ksize, True)
+            if not approximate and quality != float("inf"):
+                failures += 1
+            print(f"{method:9s} ksize {ksize:3d} exact {exact_t * 1000:8.1f} ms | "
+                  f"fast {fast_t * 1000:8.1f} ms{' (approx)' if approximate else '         '} | "
+                  f"{exact_t / max(fast_t, 1e-9):5.1f}x | PSNR {quality:6.1f} dB"
+                  f"{'' if approximate or quality == float('inf') else '  MISMATCH'}")
+
+    if failures:
+        print(f"{failures} exact paths changed their output")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
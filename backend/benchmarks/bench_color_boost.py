@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Compare the fused color boost stage with the original HSV float round-trip.
+
+Usage (from backend/):
+    python benchmarks/bench_color_boost.py [--megapixels 24] [--repeat 5]
+
+Reports best wall time and peak NumPy allocation (tracemalloc) per variant.
+OpenCV returns NumPy-backed arrays, so its outputs are included in the peak.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.control_plan import compile_plan  # noqa: E402
+from services.image_processor import ImageProcessor  # noqa: E402
+
+PRESETS = {
+    "identity": {"saturation": 0, "hueShift": 0, "rgbGains": {"r": 1, "g": 1, "b": 1}, "contrast": 0, "brightness": 0},
+    "gains_contrast": {"saturation": 0, "hueShift": 0, "rgbGains": {"r": 1.2, "g": 1, "b": 0.9}, "contrast": 0.2, "brightness": 10},
+    "full": {"saturation": 0.4, "hueShift": 12, "rgbGains": {"r": 1.2, "g": 1, "b": 0.9}, "contrast": 0.2, "brightness": 10},
+}
+
+
+def legacy_color_boost(image, color_boost):
+    """The pre-fusion implementation, kept here as the reference"""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV).astype(np.float32)
+    saturation = color_boost.get('saturation', 0)
+    if saturation != 0:
+        hsv[:, :, 1] = hsv[:, :, 1] * (1 + saturation)
+        hsv[:, :, 1] = np.clip(hsv[:, :, 1], 0, 255)
+    hue_shift = color_boost.get('hueShift', 0)
+    if hue_shift != 0:
+        hsv[:, :, 0] = (hsv[:, :, 0] + hue_shift) % 180
+    image = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+    rgb_gains = color_boost.get('rgbGains', {})
+    if rgb_gains:
+        image[:, :, 2] = np.clip(image[:, :, 2] * rgb_gains.get('r', 1), 0, 255)
+        image[:, :, 1] = np.clip(image[:, :, 1] * rgb_gains.get('g', 1), 0, 255)
+        image[:, :, 0] = np.clip(image[:, :, 0] * rgb_gains.get('b', 1), 0, 255)
+    contrast = color_boost.get('contrast', 0)
+    brightness = color_boost.get('brightness', 0)
+    if contrast != 0 or brightness != 0:
+        image = cv2.convertScaleAbs(image, alpha=1+contrast, beta=brightness)
+    return image
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, default=24)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    height = int((args.megapixels * 1e6 * 2 / 3) ** 0.5)
+    width = int(height * 1.5)
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    processor = ImageProcessor()
+    print(f"{width}x{height} ({width * height / 1e6:.1f} MP), best of {args.repeat}")
+
+    for name, preset in PRESETS.items():
+        old_t, old_peak = measure(lambda: legacy_color_boost(image, preset), args.repeat)
+        params = compile_plan({"colorBoost": preset}).color_boost
+        new_t, new_peak = measure(lambda: processor._apply_color_boost(image, params), args.repeat)
+        print(f"{name:16s} legacy {old_t * 1000:8.1f} ms {old_peak / 2**20:8.1f} MiB | "
+              f"fused {new_t * 1000:8.1f} ms {new_peak / 2**20:8.1f} MiB | {old_t / max(new_t, 1e-9):6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
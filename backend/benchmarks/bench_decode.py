@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Check and time plan-driven decoding (reduced-size JPEG decode, early crop).
+
+Usage (from backend/):
+    python benchmarks/bench_decode.py [--megapixels 12 24] [--scales 0.5 0.25 0.125] [--repeat 3]
+
+Random plans are run on PNG and JPEG inputs both through ``decode_for_plan`` and
+through a full-size decode. Outputs must match exactly wherever no reduced
+decode happened (PNG inputs, crops, rotations); reduced JPEG decodes must give
+the same output size and original size, and their PSNR against the full-size
+path is reported. EXIF-rotated JPEGs are included. Any failure exits with
+status 1. Timings compare decode plus pipeline for scaled and cropped JPEGs,
+with the decoded image size.
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.bench_pipeline import synthetic_image  # noqa: E402
+from services.control_plan import compile_plan  # noqa: E402
+from services.decode import decode_for_plan  # noqa: E402
+from services.image_processor import ImageProcessor  # noqa: E402
+
+INTERPOLATIONS = ("nearest", "linear", "cubic", "area")
+
+
+def with_orientation(jpeg: bytes, orientation: int) -> bytes:
+    """``jpeg`` with an EXIF APP1 segment holding only the orientation tag"""
+    tiff = b"MM\x00*\x00\x00\x00\x08" + struct.pack(">HHHIHH", 1, 0x0112, 3, 1, orientation, 0) + b"\x00" * 4
+    payload = b"Exif\x00\x00" + tiff
+    return jpeg[:2] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + jpeg[2:]
+
+
+def psnr(reference: np.ndarray, image: np.ndarray) -> float:
+    mse = np.mean((reference.astype(np.float64) - image) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def random_controls(rng):
+    controls = {}
+    if rng.random() < 0.7:
+        controls["scale"] = float(rng.choice([1.0, 0.9, 0.5, 0.3, 0.25, 0.2, 0.1, 0.05]))
+        controls["scaleInterpolation"] = str(rng.choice(INTERPOLATIONS))
+    if rng.random() < 0.5:
+        x, y = (float(v) for v in rng.uniform(-5, 60, 2))
+        controls.update(isCropActive=True, crop={"x": x, "y": y, "w": float(rng.uniform(1, 90)),
+                                                 "h": float(rng.uniform(1, 90))})
+    if rng.random() < 0.2:
+        controls["rotate"] = float(rng.uniform(-30, 30))
+    if rng.random() < 0.2:
+        controls["translateX"] = float(rng.uniform(-20, 20))
+    if rng.random() < 0.3:
+        controls["grayscaleAmount"] = float(rng.uniform(0, 1))
+    if rng.random() < 0.3:
+        controls["colorSpace"] = str(rng.choice(["HSV", "LAB", "YCrCb"]))
+    if rng.random() < 0.3:
+        controls["blur"] = {"method": "gaussian", "ksize": 5}
+    if rng.random() < 0.3:
+        controls["blendAlpha"] = float(rng.uniform(0.1, 0.9))
+    if rng.random() < 0.2:
+        controls["drawItems"] = [{"type": "rect", "xywh": [5, 5, 40, 30]}]
+    return controls
+
+
+def check(rng, processor: ImageProcessor, trials=150) -> int:
+    failures = 0
+    worst = float("inf")
+    reduced_runs = 0
+    for trial in range(trials):
+        image = synthetic_image(float(rng.uniform(0.02, 0.5)), seed=trial)
+        encoding = ".png" if trial % 3 == 0 else ".jpg"
+        data = cv2.imencode(encoding, image)[1].tobytes()
+        if encoding == ".jpg" and trial % 4 == 1:
+            data = with_orientation(data, int(rng.choice([3, 6, 8])))
+        plan = compile_plan(random_controls(rng))
+
+        full = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        expected = processor.process_image(full, plan)
+        decoded, run_plan, original_size = decode_for_plan(data, plan)
+        output = processor.process_image(decoded, run_plan)
+
+        reduced = run_plan.transform.scale != plan.transform.scale
+        reduced_runs += reduced
+        if original_size != full.shape[:2] or output.shape != expected.shape:
+            failures += 1
+            print(f"MISMATCH size {output.shape} vs {expected.shape}, original {original_size} vs "
+                  f"{full.shape[:2]} for {plan.transform}")
+        elif not reduced and not np.array_equal(output, expected):
+            failures += 1
+            print(f"MISMATCH pixels for {encoding} {plan.transform}")
+        elif reduced:
+            worst = min(worst, psnr(expected, output))
+    print(f"{trials} plans, {reduced_runs} decoded at reduced size, lowest PSNR {worst:.1f} dB")
+    return failures
+
+
+def decoded_bytes(image: np.ndarray) -> int:
+    """Size of the decoded buffer, also when ``image`` is an early crop of it"""
+    return (image.base if isinstance(image.base, np.ndarray) else image).nbytes
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 24])
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 0.25, 0.125])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    processor = ImageProcessor()
+    failures = check(np.random.default_rng(0), processor)
+
+    for megapixels in args.megapixels:
+        image = synthetic_image(megapixels)
+        data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        print(f"{image.shape[1]}x{image.shape[0]} JPEG, best of {args.repeat}")
+        cases = [({"scale": scale, "scaleInterpolation": "area"}, f"scale {scale:5.3f}") for scale in args.scales]
+        cases.append(({"isCropActive": True, "crop": {"x": 40, "y": 40, "w": 20, "h": 20},
+                       "grayscaleAmount": 1.0}, "crop 20%, gray"))
+        for controls, label in cases:
+            plan = compile_plan(controls)
+
+            def full_path():
+                decoded = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+                return decoded, processor.process_image(decoded, plan)
+
+            def plan_path():
+                decoded, run_plan, _ = decode_for_plan(data, plan)
+                return decoded, processor.process_image(decoded, run_plan)
+
+            full_t, (full_img, expected) = best_of(full_path, args.repeat)
+            plan_t, (plan_img, output) = best_of(plan_path, args.repeat)
+            quality = psnr(expected, output) if output.shape == expected.shape else float("nan")
+            print(f"  {label:15s} full {full_t * 1000:7.1f} ms ({decoded_bytes(full_img) / 2 ** 20:5.1f} MiB) | "
+                  f"plan {plan_t * 1000:7.1f} ms ({decoded_bytes(plan_img) / 2 ** 20:5.1f} MiB) | "
+                  f"{full_t / max(plan_t, 1e-9):5.1f}x | PSNR {quality:6.1f} dB")
+
+    if failures:
+        print(f"{failures} failures")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
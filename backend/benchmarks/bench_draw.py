@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Check and time batched drawing of annotation items against item-by-item drawing.
+
+Usage (from backend/):
+    python benchmarks/bench_draw.py [--megapixels 1 12] [--items 100 500 2000] [--repeat 5]
+
+Random item lists (rectangles, filled rectangles, lines, circles, text, with runs
+of matching style, off-image and invalid coordinates) are drawn both ways on
+colour and grayscale images; any difference is reported and the script exits
+with status 1. Timings compare the per-item loop with ``draw_ops`` for lists of
+lines and rectangle outlines in a few styles.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from services.control_plan import DrawOp  # noqa: E402
+from services.draw import _draw_op, draw_ops  # noqa: E402
+
+COLORS = ((0, 0, 255), (0, 255, 0), (255, 255, 255), (0, 0, 0))
+
+
+def draw_each(canvas, ops):
+    """Reference: one OpenCV call per item"""
+    for op in ops:
+        try:
+            _draw_op(canvas, op)
+        except Exception:
+            pass
+    return canvas
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_ops(rng, count, width, height):
+    ops = []
+    while len(ops) < count:
+        kind = str(rng.choice(["rect", "line", "circle", "text"]))
+        color = COLORS[rng.integers(len(COLORS))]
+        thickness = int(rng.choice([-1, 0, 1, 2, 3, 10, 40]))
+        # Runs of one style, which draw_ops batches
+        for _ in range(int(rng.integers(1, 6))):
+            if kind == "circle":
+                points = (int(rng.integers(-20, width + 20)), int(rng.integers(-20, height + 20)),
+                          int(rng.integers(0, width)))
+            elif kind == "text":
+                points = (int(rng.integers(-20, width)), int(rng.integers(0, height + 20)))
+            else:
+                points = tuple(int(v) for v in rng.integers(-width // 4, width * 5 // 4, 4))
+            if rng.random() < 0.01:
+                points = (2 ** 40,) + points[1:]
+            ops.append(DrawOp(kind, color, thickness, points, "Label" if kind == "text" else None,
+                              float(rng.uniform(0.3, 3))))
+    return tuple(ops[:count])
+
+
+def check(rng, trials=300) -> int:
+    mismatches = 0
+    for _ in range(trials):
+        height, width = int(rng.integers(20, 300)), int(rng.integers(20, 300))
+        ops = random_ops(rng, int(rng.integers(1, 60)), width, height)
+        for shape in ((height, width, 3), (height, width)):
+            image = rng.integers(0, 256, size=shape, dtype=np.uint8)
+            if not np.array_equal(draw_each(image.copy(), ops), draw_ops(image.copy(), ops)):
+                mismatches += 1
+                print(f"MISMATCH on {shape} with {len(ops)} items")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 12])
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    # Invalid items are expected in the equivalence check
+    logging.disable(logging.WARNING)
+
+    rng = np.random.default_rng(0)
+    mismatches = check(rng)
+
+    for megapixels in args.megapixels:
+        height = int((megapixels * 1e6 * 3 / 4) ** 0.5)
+        width = int(height * 4 / 3)
+        image = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        for count in args.items:
+            for kind, styles in (("line", 1), ("line", 8), ("rect", 1), ("rect", 8)):
+                corners = rng.integers(0, min(width, height), size=(count, 2))
+                # Consecutive items share a style (colour and thickness) in ``styles`` runs
+                ops = tuple(
+                    DrawOp(kind, COLORS[i * styles // count % len(COLORS)], 2 + i * styles // count // len(COLORS),
+                           (int(x), int(y), int(x) + 80, int(y) + 60))
+                    for i, (x, y) in enumerate(corners.tolist())
+                )
+                # Timed on one canvas drawn over repeatedly, so no copy is in the timing
+                canvas = image.copy()
+                each_t = best_of(lambda: draw_each(canvas, ops), args.repeat)
+                batched_t = best_of(lambda: draw_ops(canvas, ops), args.repeat)
+                same = np.array_equal(draw_each(image.copy(), ops), draw_ops(image.copy(), ops))
+                if not same:
+                    mismatches += 1
+                print(f"{width}x{height} {count:5d} {kind:4s} ({styles} style{'s' if styles > 1 else ''}) "
+                      f"per item {each_t * 1000:7.2f} ms | batched {batched_t * 1000:7.2f} ms | "
+                      f"{each_t / max(batched_t, 1e-9):5.2f}x {'' if same else 'MISMATCH'}")
+
+    print(f"{mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Time the decomposed elliptical morphology against direct OpenCV calls.
+
+Usage (from backend/):
+    python benchmarks/bench_morphology.py [--megapixels 12] [--sizes 3 9 15 21 23 25 31]
+                                          [--iterations 1 3] [--repeat 3]
+
+For each kernel size and iteration count, erosion and dilation are run both ways
+on a 3-channel and a grayscale image. Timings show where MORPH_DECOMPOSE_MIN_SIZE
+should sit on this machine. That both ways give identical output is checked by
+tests/test_kernels.py.
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from config import MORPH_DECOMPOSE_MIN_SIZE  # noqa: E402
+from services.kernels import ellipse_runs, morph_ellipse  # noqa: E402
+
+OPERATIONS = {"erode": cv2.MORPH_ERODE, "dilate": cv2.MORPH_DILATE}
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, default=12)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 9, 15, 21, 23, 25, 31])
+    parser.add_argument("--iterations", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    height = int((args.megapixels * 1e6 * 2 / 3) ** 0.5)
+    width = int(height * 1.5)
+    rng = np.random.default_rng(0)
+    small = rng.integers(0, 256, size=(height // 8, width // 8, 3), dtype=np.uint8)
+    color = cv2.add(cv2.resize(small, (width, height), interpolation=cv2.INTER_NEAREST),
+                    rng.integers(0, 32, size=(height, width, 3), dtype=np.uint8))
+    images = {"bgr": color, "gray": cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)}
+    print(f"{width}x{height} ({width * height / 1e6:.1f} MP), best of {args.repeat}, "
+          f"MORPH_DECOMPOSE_MIN_SIZE={MORPH_DECOMPOSE_MIN_SIZE}")
+
+    for size in args.sizes:
+        for iterations in args.iterations:
+            for label, image in images.items():
+                for name, op in OPERATIONS.items():
+                    direct_t, _ = best_of(
+                        lambda: morph_ellipse(op, image, size, iterations, decompose=False), args.repeat)
+                    decomposed_t, _ = best_of(
+                        lambda: morph_ellipse(op, image, size, iterations, decompose=True), args.repeat)
+                    print(f"{label:4s} {name:6s} size {size:3d} x{iterations} ({len(ellipse_runs(size)):2d} runs) "
+                          f"direct {direct_t * 1000:8.1f} ms | decomposed {decomposed_t * 1000:8.1f} ms | "
+                          f"{direct_t / max(decomposed_t, 1e-9):5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
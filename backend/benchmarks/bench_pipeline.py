@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ImageProcessor pipeline and the HTTP endpoints, offline on CPU.
+
+Usage (from backend/):
+    python benchmarks/bench_pipeline.py [--megapixels 1 12 24 50] [--presets default document ...]
+                                        [--repeat 3] [--output results.json]
+                                        [--baseline baseline.json [--threshold 0.15]] [--save-baseline]
+
+For each synthetic image size and ControlState preset it times every ``_apply_*``
+stage on that stage's real input, then the full ``process_image`` call. It also
+times ``/process-image-base64`` and ``/zip-images`` end to end through an
+in-process TestClient. Timings are best-of-``repeat`` wall seconds, written as
+flat ``name -> seconds`` entries to a JSON file. With ``--baseline``, any entry
+more than ``threshold`` slower than the baseline (and at least 1 ms slower) is
+reported and the script exits with status 1.
+"""
+import argparse
+import base64
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+from models.control_models import ControlState  # noqa: E402
+from services.control_plan import compile_plan  # noqa: E402
+from services.image_processor import PIPELINE_STAGES, ImageProcessor  # noqa: E402
+
+# Ignore regressions smaller than this, they are timer noise on fast stages
+MIN_REGRESSION_SECONDS = 0.001
+
+
+def _dump(state: ControlState) -> Dict[str, Any]:
+    return state.model_dump() if hasattr(state, "model_dump") else state.dict()
+
+
+def build_presets() -> Dict[str, Dict[str, Any]]:
+    """Representative control sets, built through ControlState like real requests"""
+    return {
+        "default": _dump(ControlState()),
+        "photo": _dump(ControlState(
+            blur={"method": "gaussian", "ksize": 5},
+            sharpenStrength=0.5,
+            colorBoost={"saturation": 0.3, "hueShift": 5, "rgbGains": {"r": 1.1, "g": 1.0, "b": 0.95},
+                        "contrast": 0.15, "brightness": 5},
+            brightness=10,
+        )),
+        "document": _dump(ControlState(
+            grayscaleAmount=1.0,
+            blur={"method": "median", "ksize": 5},
+            adaptiveThreshold={"mode": "Adaptive", "method": "gaussian", "blockSize": 25, "c": 5},
+            morphology={"kernelSize": 3, "iterations": 1, "operation": "open"},
+        )),
+        "edges": _dump(ControlState(
+            blur={"method": "gaussian", "ksize": 7},
+            edges={"method": "Sobel", "sobel_ksize": 3},
+            morphology={"kernelSize": 5, "iterations": 1, "operation": "dilate"},
+        )),
+        "geometry": {
+            **_dump(ControlState(
+                rotate=7.5, translateX=40, translateY=-25, scale=0.8, scaleInterpolation="cubic",
+                crop={"x": 10, "y": 10, "w": 80, "h": 80},
+            )),
+            "isCropActive": True,
+        },
+        "annotate": _dump(ControlState(
+            drawItems=[
+                {"type": "rect", "xywh": [100, 100, 400, 300], "color": "#00FF00", "thickness": 4},
+                {"type": "circle", "xyr": [600, 400, 150], "color": "#0000FF", "thickness": 3},
+                {"type": "line", "xyxy": [0, 0, 800, 600], "thickness": 2},
+                {"type": "text", "text": "VisionForge", "xy": [120, 80], "scale": 2.0, "thickness": 3},
+            ],
+            blendAlpha=0.3,
+        )),
+    }
+
+
+def synthetic_image(megapixels: float, seed: int = 0) -> np.ndarray:
+    """
+    Deterministic 3:2 BGR test image: smooth gradients and shapes plus mild noise,
+    so encoders see photo-like content rather than incompressible noise.
+    """
+    height = int((megapixels * 1e6 * 2 / 3) ** 0.5)
+    width = int(height * 1.5)
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(12, 18, 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(24):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        radius = int(rng.integers(height // 40 + 1, height // 6 + 2))
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        cv2.circle(image, center, radius, color, -1, lineType=cv2.LINE_AA)
+    noise = np.empty_like(image)
+    cv2.setRNGSeed(seed)
+    cv2.randn(noise, (0, 0, 0), (6, 6, 6))
+    return cv2.add(image, noise)
+
+
+def best_of(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_pipeline(image: np.ndarray, label: str, presets: Dict[str, Dict[str, Any]],
+                   repeat: int, results: Dict[str, float]):
+    processor = ImageProcessor()
+    for name, controls in presets.items():
+        plan = compile_plan(controls)
+        results[f"pipeline/{label}/{name}/compile_plan"] = best_of(lambda: compile_plan(controls), repeat)
+        # Each stage is timed on the output of the stages before it, without fusion
+        current = image
+        for stage in PIPELINE_STAGES:
+            method = getattr(processor, stage.method)
+            params = getattr(plan, stage.name)
+            stage_input = current
+
+            def call(stage=stage, method=method, params=params, stage_input=stage_input):
+                target = stage_input.copy() if stage.in_place else stage_input
+                if stage.needs_original:
+                    return method(target, params, image)
+                return method(target, params)
+
+            results[f"pipeline/{label}/{name}/{stage.method}"] = best_of(call, repeat)
+            current = call()
+
+        results[f"pipeline/{label}/{name}/process_image"] = best_of(
+            lambda: processor.process_image(image, plan), repeat)
+        print(f"  {label:>6s} {name:10s} process_image "
+              f"{results[f'pipeline/{label}/{name}/process_image'] * 1000:9.1f} ms")
+
+
+def bench_http(image: np.ndarray, label: str, presets: Dict[str, Dict[str, Any]],
+               repeat: int, results: Dict[str, float], zip_entries: int):
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    _, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    image_data = "data:image/jpeg;base64," + base64.b64encode(encoded.tobytes()).decode("ascii")
+
+    for name, controls in presets.items():
+        form = {"image_data": image_data, "controls": json.dumps(controls)}
+
+        def post():
+            response = client.post("/process-image-base64", data=form)
+            response.raise_for_status()
+            return response
+
+        try:
+            results[f"http/{label}/{name}/process-image-base64"] = best_of(post, repeat)
+        except Exception as e:
+            print(f"  {label:>6s} {name:10s} /process-image-base64 failed: {e}")
+
+    processed = main.image_processor.process_image(image, presets[next(iter(presets))])
+    _, png = cv2.imencode(".png", processed)
+    data_url = "data:image/png;base64," + base64.b64encode(png.tobytes()).decode("ascii")
+    payload = {"files": [{"name": f"image_{i}.png", "dataUrl": data_url} for i in range(zip_entries)]}
+
+    def zip_images():
+        with client.stream("POST", "/zip-images", json=payload) as response:
+            response.raise_for_status()
+            for _ in response.iter_bytes():
+                pass
+
+    results[f"http/{label}/zip-images/{zip_entries}"] = best_of(zip_images, repeat)
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], threshold: float) -> int:
+    """Print entries that regressed beyond ``threshold``; returns how many did"""
+    regressions = 0
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        before, after = baseline[key], results[key]
+        if after > before * (1 + threshold) and after - before >= MIN_REGRESSION_SECONDS:
+            regressions += 1
+            print(f"REGRESSION {key}: {before * 1000:.1f} ms -> {after * 1000:.1f} ms "
+                  f"(+{(after / before - 1) * 100:.0f}%)")
+    improved = sum(1 for key in results if key in baseline and results[key] < baseline[key] / (1 + threshold))
+    print(f"{len(set(results) & set(baseline))} compared, {regressions} regressed, {improved} improved "
+          f"(threshold {threshold * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    presets = build_presets()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 12, 24, 50])
+    parser.add_argument("--presets", nargs="+", choices=sorted(presets), default=sorted(presets))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--http-megapixels", type=float, nargs="*", default=[1],
+                        help="sizes to send through HTTP (form fields are capped at 1 MB by Starlette)")
+    parser.add_argument("--zip-entries", type=int, default=8)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="JSON file written by an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    args = parser.parse_args()
+    selected = {name: presets[name] for name in args.presets}
+
+    results: Dict[str, float] = {}
+    for megapixels in args.megapixels:
+        image = synthetic_image(megapixels)
+        label = f"{megapixels:g}MP"
+        print(f"{label}: {image.shape[1]}x{image.shape[0]}")
+        bench_pipeline(image, label, selected, args.repeat, results)
+        if megapixels in args.http_megapixels:
+            bench_http(image, label, selected, args.repeat, results, args.zip_entries)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} timings to {args.output}")
+
+    if args.baseline:
+        if args.save_baseline:
+            with open(args.baseline, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Saved baseline to {args.baseline}")
+        else:
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+            if compare(results, baseline, args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Profile backend startup: import times and time until /health and /ready answer.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py [--runs 3] [--top 12] [--port 8765] [--no-warmup]
+
+First prints the modules that dominate ``import main`` (from ``python -X
+importtime``), then starts ``start.py`` ``--runs`` times and reports how long
+after launch /health answered (server listening), /ready answered 200 (image
+services loaded and warmed up) and the first /process-image request returned.
+Exits with status 1 if the backend never becomes ready.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import cv2
+import numpy as np
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def import_profile(top: int):
+    """Print the direct imports of ``main`` that take longest (cumulative)"""
+    run = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                         cwd=BACKEND_DIR, capture_output=True, text=True)
+    rows = []
+    for line in run.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Indented by two spaces: imported by main (or at interpreter startup)
+        name = name[1:]
+        if name != "main" and (name.startswith("   ") or not name.startswith("  ")):
+            continue
+        rows.append((int(cumulative) / 1000, name.strip()))
+    total = next((ms for ms, name in rows if name == "main"), 0.0)
+    print(f"import main: {total:.1f} ms")
+    for ms, name in sorted((row for row in rows if row[1] != "main"), reverse=True)[:top]:
+        print(f"  {ms:7.1f} ms  {name}")
+
+
+def get(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def process_image(base: str):
+    png = cv2.imencode(".png", np.zeros((64, 64, 3), np.uint8))[1].tobytes()
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"controls\"\r\n\r\n{{}}\r\n"
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"a.png\"\r\n"
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + png + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(f"{base}/process-image", data=body,
+                                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())["success"]
+
+
+def startup_run(port: int, warmup: bool, timeout: float = 30):
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as jobs_dir:
+        env = {**os.environ, "PORT": str(port), "HOST": "127.0.0.1", "RELOAD": "false",
+               "JOBS_DIR": jobs_dir, "WARMUP": "true" if warmup else "false"}
+        started = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "start.py"], cwd=BACKEND_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            health = ready = None
+            while time.perf_counter() - started < timeout and server.poll() is None:
+                if health is None and get(f"{base}/health") == 200:
+                    health = time.perf_counter() - started
+                if health is not None and get(f"{base}/ready") == 200:
+                    ready = time.perf_counter() - started
+                    break
+                time.sleep(0.005)
+            if ready is None:
+                return health, None, None
+            process_image(base)
+            return health, ready, time.perf_counter() - started
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-warmup", action="store_true")
+    args = parser.parse_args()
+
+    import_profile(args.top)
+
+    failures = 0
+    for run in range(args.runs):
+        health, ready, first = startup_run(args.port, not args.no_warmup)
+        if ready is None:
+            failures += 1
+            print(f"run {run + 1}: not ready" + (f" (health {health * 1000:.0f} ms)" if health else ""))
+            continue
+        print(f"run {run + 1}: /health {health * 1000:6.0f} ms | /ready {ready * 1000:6.0f} ms | "
+              f"first /process-image {first * 1000:6.0f} ms")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
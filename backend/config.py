@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 # Configuration settings
 HOST = os.getenv("HOST", "0.0.0.0")
@@ -24,5 +25,76 @@ API_TITLE = "VisionForge API"
 API_VERSION = "1.0.0"
 API_DESCRIPTION = "Backend API for VisionForge image processing application"
 
+# Registered image cache (upload once, process many times by handle)
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", 1024)) * 1024 * 1024
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", 1800))
 
+# Per-stage pipeline memoization for registered images
+STAGE_CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_MB", 512)) * 1024 * 1024
 
+# Request worker pool: concurrent decode/process/encode jobs, plus how many more may
+# wait for a slot before requests are rejected with 503
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", os.cpu_count() or 2))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", 16))
+
+# Elliptical morphology kernels at least this wide run as exact rectangular 1-D passes,
+# which is faster from about 23 px (see benchmarks/bench_morphology.py); 0 disables
+MORPH_DECOMPOSE_MIN_SIZE = int(os.getenv("MORPH_DECOMPOSE_MIN_SIZE", 23))
+
+# Encoded results keyed by image digest plus compiled controls. RESULT_CACHE_DIR adds an
+# on-disk tier that survives restarts (the Electron app points it into its user data folder)
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", 256)) * 1024 * 1024
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MAX_BYTES = int(os.getenv("RESULT_CACHE_DISK_MAX_MB", 2048)) * 1024 * 1024
+
+# Encoded batch results kept for /zip-images
+RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_MB", 512)) * 1024 * 1024
+
+# Batch processing pool: "thread" (default, OpenCV releases the GIL) or "process"
+BATCH_EXECUTOR = os.getenv("BATCH_EXECUTOR", "thread").lower()
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 2))
+# Images read and queued at once; bounds memory regardless of batch size
+BATCH_MAX_IN_FLIGHT = int(os.getenv("BATCH_MAX_IN_FLIGHT", BATCH_WORKERS * 2))
+
+# Background batch jobs (/jobs). JOBS_DIR holds the job database, uploaded inputs and
+# finished outputs (the Electron app points it into its user data folder); JOBS_STORE is
+# "sqlite" (default, jobs resume after a restart) or "memory". Finished jobs are removed
+# JOBS_TTL_HOURS after their last change
+JOBS_STORE = os.getenv("JOBS_STORE", "sqlite").lower()
+JOBS_DIR = os.getenv("JOBS_DIR", os.path.join(tempfile.gettempdir(), "visionforge-jobs"))
+JOBS_TTL = float(os.getenv("JOBS_TTL_HOURS", 72)) * 3600
+
+# Video and frame-sequence jobs (/process-video): frames processed in parallel and
+# decoded frames queued ahead of the workers
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", os.cpu_count() or 2))
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", VIDEO_WORKERS * 2))
+
+# Tiled processing for very large images: images of at least TILE_MIN_MEGAPIXELS are
+# processed in full-width bands of about TILE_MEGAPIXELS (0 disables tiling), on
+# TILE_WORKERS threads per image
+TILE_PIXELS = int(float(os.getenv("TILE_MEGAPIXELS", 4)) * 1_000_000)
+TILE_MIN_PIXELS = int(float(os.getenv("TILE_MIN_MEGAPIXELS", 40)) * 1_000_000)
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", 1))
+
+# Local-path batch mode (/process-batch-local, /process-video): reads sources from and
+# writes results to the local disk. Every request must either carry LOCAL_BATCH_TOKEN in
+# an X-VisionForge-Token header (the Electron shell generates one per launch and adds it
+# to its own requests) or, without a token, stay inside LOCAL_BATCH_ROOTS (directories
+# separated by os.pathsep); with neither configured the endpoints refuse all requests.
+# On by default only when a token is set
+LOCAL_BATCH_TOKEN = os.getenv("LOCAL_BATCH_TOKEN", "")
+LOCAL_BATCH_ENABLED = os.getenv("LOCAL_BATCH", "1" if LOCAL_BATCH_TOKEN else "0") == "1"
+LOCAL_BATCH_ROOTS = [os.path.realpath(p) for p in os.getenv("LOCAL_BATCH_ROOTS", "").split(os.pathsep) if p]
+
+# Decode JPEGs that a request only uses shrunk (a scale below 1 without rotation or
+# translation, or a preview proxy) at 1/2, 1/4 or 1/8 size through libjpeg's DCT scaling.
+# The result differs slightly from decoding at full size and resizing
+DECODE_REDUCED = os.getenv("DECODE_REDUCED", "true").lower() == "true"
+
+# Run a small synthetic image through every stage and encoder in the background at
+# startup, so the first request does not pay for OpenCV's lazy initialisation; /ready
+# answers 503 until it is done
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+# Add a Server-Timing header (decode, each pipeline stage, encode, base64) to image responses
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
@@ -1,19 +1,43 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, Header, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-import cv2
+from fastapi.responses import JSONResponse, StreamingResponse, Response, PlainTextResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 import numpy as np
-from PIL import Image
-import io
+import asyncio
 import base64
+import hmac
 import json
+import os
+import time
+import uuid
 from typing import Optional, List, Dict, Any
-import uvicorn
-import zipfile
 
-from services.image_processor import ImageProcessor
+from services.image_processor import ImageProcessor, create_stage_cache
+from services.control_plan import ControlPlan, compile_plan, dump_controls, parse_controls
+from services.image_cache import ImageCache, LRUCache
+from services.preview import make_proxy, proxy_size, scale_controls_for_proxy
+from services.encoding import encode_image, ENCODINGS
+from services.decode import decode_for_plan, decode_image, decode_mode
+from services.result_cache import CachedResult, ResultCache, result_key
+from services.live_preview import ControlMailbox, pack_frame
+from services.batch import BatchRunner, RAW_EXTENSION, READABLE_EXTENSIONS
+from services.video import FrameSink, FrameSource, VideoJob, is_video_path
+from services.jobs import JobManager, JobNotFound, JobStateError, create_job_store
+from services.workers import WorkerPool, WorkerPoolBusy
+from services.zip_stream import stream_zip
+from services.metrics import PipelineMetrics, RequestStats
+from services.warmup import WarmUp
 from models.control_models import ControlState
-from config import HOST, PORT, RELOAD, ALLOWED_ORIGINS, API_TITLE, API_VERSION, API_DESCRIPTION
+from config import (
+    HOST, PORT, RELOAD, ALLOWED_ORIGINS, API_TITLE, API_VERSION, API_DESCRIPTION,
+    IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL, STAGE_CACHE_MAX_BYTES,
+    BATCH_EXECUTOR, BATCH_WORKERS, BATCH_MAX_IN_FLIGHT,
+    WORKER_THREADS, WORKER_QUEUE_SIZE, RESULT_STORE_MAX_BYTES,
+    TILE_PIXELS, TILE_MIN_PIXELS, TILE_WORKERS, LOCAL_BATCH_ENABLED, LOCAL_BATCH_ROOTS,
+    LOCAL_BATCH_TOKEN,
+    SERVER_TIMING, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES,
+    VIDEO_WORKERS, VIDEO_QUEUE_SIZE, JOBS_STORE, JOBS_DIR, JOBS_TTL, WARMUP
+)
 
 app = FastAPI(
     title=API_TITLE, 
@@ -28,10 +52,242 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Original-Size", "X-Processed-Size", "X-Preview-Scale", "X-Pipeline-Cache", "X-Result-Cache",
+                    "Server-Timing"],
+)
+
+# Initialize image processor (stage outputs are memoized for registered images, very large images are tiled)
+image_processor = ImageProcessor(
+    stage_cache=create_stage_cache(STAGE_CACHE_MAX_BYTES, ttl=IMAGE_CACHE_TTL),
+    tile_pixels=TILE_PIXELS, tile_min_pixels=TILE_MIN_PIXELS, tile_workers=TILE_WORKERS
 )
 
-# Initialize image processor
-image_processor = ImageProcessor()
+# Decoded images registered by clients, keyed by content hash
+image_cache = ImageCache(max_bytes=IMAGE_CACHE_MAX_BYTES, ttl=IMAGE_CACHE_TTL)
+
+# Encoded outputs keyed by image digest, compiled controls and output options, so
+# repeated settings (and repeated batch inputs) skip processing and encoding
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE_MAX_BYTES, ttl=IMAGE_CACHE_TTL,
+    directory=RESULT_CACHE_DIR, disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES
+)
+
+# Encoded batch outputs, so /zip-images can reference them by result_id
+result_store = LRUCache(max_bytes=RESULT_STORE_MAX_BYTES, ttl=IMAGE_CACHE_TTL, sizeof=lambda result: len(result[0]))
+
+# Worker pool for /process-batch
+batch_runner = BatchRunner(max_workers=BATCH_WORKERS, mode=BATCH_EXECUTOR, max_in_flight=BATCH_MAX_IN_FLIGHT)
+
+# Background batch jobs: run on the batch pool, outputs kept on disk for /zip-images
+job_manager = JobManager(
+    create_job_store(JOBS_STORE, JOBS_DIR), batch_runner, JOBS_DIR, cache=result_cache, ttl=JOBS_TTL,
+    on_result=lambda result: _observe_batch_result("jobs", result)
+)
+
+# Bounded pool that keeps decode/process/encode off the event loop
+worker_pool = WorkerPool(max_workers=WORKER_THREADS, max_queue=WORKER_QUEUE_SIZE)
+
+# Per-stage timing and payload size histograms for /metrics
+metrics = PipelineMetrics()
+
+# Optional background run of every stage and encoder at startup, reported by /ready
+warmup = WarmUp(image_processor, enabled=WARMUP)
+
+
+@app.on_event("startup")
+def start_jobs():
+    job_manager.start()
+    warmup.start()
+
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    job_manager.shutdown()
+    batch_runner.shutdown()
+    worker_pool.shutdown()
+    image_processor.shutdown()
+
+
+async def _run_on_worker(fn):
+    """Run blocking image work on the worker pool, answering 503 when it is saturated"""
+    try:
+        return await worker_pool.run(fn)
+    except WorkerPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+def _decode_or_400(decode, *args):
+    """Run a ``services.decode`` function on request bytes, raising a 400 on bad input"""
+    try:
+        return decode(*args)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+
+def _decode_image_bytes(image_bytes: bytes) -> np.ndarray:
+    """Decode encoded image bytes to BGR at full size, raising a 400 on bad input"""
+    return _decode_or_400(decode_image, image_bytes).image
+
+
+def _b64_to_bytes(image_data: str) -> bytes:
+    """Strip an optional data URL prefix and base64-decode"""
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    try:
+        return base64.b64decode(image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+
+def _get_cached_proxy(image_id: str, img: np.ndarray, max_size: int):
+    """Return the registered image's preview proxy, building and caching it on first use"""
+    proxy_id = f"{image_id}:preview:{max_size}"
+    proxy = image_cache.get(proxy_id)
+    if proxy is None:
+        proxy, _ = make_proxy(img, max_size)
+        if proxy is not img:
+            image_cache.put(proxy_id, proxy)
+    factor = max(proxy.shape[:2]) / max(img.shape[:2])
+    return proxy_id if proxy is not img else image_id, proxy, factor
+
+
+def _build_image_response(
+    processed_img: np.ndarray,
+    metadata: Dict[str, Any],
+    response_format: str = "json",
+    encoding: str = "png",
+    quality: Optional[int] = None,
+    stats: Optional[RequestStats] = None,
+    cache_key: Optional[str] = None
+):
+    """
+    Encode a processed image either as a JSON body with a data URL (default) or,
+    with ``response_format="binary"``, as raw bytes with metadata in X- headers.
+    ``stats`` receives the encode and base64 timings and is recorded in /metrics.
+    With ``cache_key`` the encoded result is also stored in the result cache.
+    """
+    stats = stats or RequestStats("unknown")
+    content, media_type, metadata = _encode_result(
+        processed_img, metadata, response_format, encoding, quality, stats, cache_key
+    )
+    return _encoded_response(content, media_type, metadata, response_format, stats)
+
+
+def _cached_response(cache_key: str, response_format: str, stats: RequestStats):
+    """Answer from the result cache, or return None on a miss"""
+    with stats.time("result_cache"):
+        cached = result_cache.get(cache_key)
+    if cached is None:
+        return None
+    metadata = {**cached.metadata, "result_cache": "hit"}
+    return _encoded_response(cached.content, cached.media_type, metadata, response_format, stats)
+
+
+def _encode_result(
+    processed_img: np.ndarray,
+    metadata: Dict[str, Any],
+    response_format: str,
+    encoding: str,
+    quality: Optional[int],
+    stats: RequestStats,
+    cache_key: Optional[str] = None
+):
+    """
+    Encode a processed image, returning ``(content, media_type, metadata)``.
+    With ``cache_key`` the encoded result is also stored in the result cache.
+    """
+    if processed_img is None or processed_img.shape[0] == 0 or processed_img.shape[1] == 0:
+        raise HTTPException(status_code=500, detail="Image processing resulted in invalid image")
+    if response_format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="response_format must be 'json' or 'binary'")
+
+    metadata = {**metadata, "processed_size": processed_img.shape[:2]}
+    try:
+        with stats.time("encode"):
+            content, media_type = encode_image(processed_img, encoding, quality)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image encoding error: {str(e)}")
+    if cache_key is not None:
+        # Run info describes this render only, so it is not replayed on later hits
+        result_cache.put(cache_key, CachedResult(
+            content, media_type, {k: v for k, v in metadata.items() if k not in ("pipeline_cache", "result_cache")}
+        ))
+    return content, media_type, metadata
+
+
+def _encoded_response(
+    content: bytes,
+    media_type: str,
+    metadata: Dict[str, Any],
+    response_format: str = "json",
+    stats: Optional[RequestStats] = None
+):
+    """Wrap encoded image bytes as a JSON data URL body or, for ``binary``, raw bytes with X- headers"""
+    stats = stats or RequestStats("unknown")
+    if response_format not in ("json", "binary"):
+        raise HTTPException(status_code=400, detail="response_format must be 'json' or 'binary'")
+
+    if response_format == "binary":
+        headers = {}
+        for key, value in metadata.items():
+            name = "X-" + "-".join(part.capitalize() for part in key.split("_"))
+            if isinstance(value, dict):
+                value = ";".join(f"{k}={v}" for k, v in value.items())
+            elif isinstance(value, (list, tuple)):
+                value = ",".join(str(v) for v in value)
+            headers[name] = str(value)
+        stats.bytes_out = len(content)
+        _finish_request(stats, headers)
+        return Response(content=content, media_type=media_type, headers=headers)
+
+    with stats.time("base64"):
+        img_base64 = base64.b64encode(content).decode('utf-8')
+    stats.bytes_out = len(img_base64)
+    headers = {}
+    _finish_request(stats, headers)
+    body = {
+        "success": True,
+        "processed_image": f"data:{media_type};base64,{img_base64}",
+        **metadata
+    }
+    return JSONResponse(content=body, headers=headers) if headers else body
+
+
+def _finish_request(stats: RequestStats, headers: Dict[str, str]):
+    """Record a completed request in /metrics and add the Server-Timing header when enabled"""
+    metrics.observe(stats)
+    if SERVER_TIMING:
+        headers["Server-Timing"] = stats.server_timing()
+        headers["Timing-Allow-Origin"] = "*"
+
+
+def _observe_batch_result(endpoint: str, result: Dict[str, Any]):
+    """Record one batch item's worker-side timings and sizes in /metrics"""
+    metrics.observe_stages(result.pop("stage_timings", {}))
+    if result.get("original_size"):
+        height, width = result["original_size"]
+        metrics.image_megapixels.observe(height * width / 1e6, endpoint)
+
+
+def _parse_controls(controls: str) -> ControlState:
+    try:
+        data = json.loads(controls)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid controls JSON: {str(e)}")
+    try:
+        return parse_controls(data)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid controls: {str(e)}")
+
+def _compile_controls(state: ControlState, preview_scale: float = 1.0) -> ControlPlan:
+    """Compile request controls, rescaling pixel-space values for a proxy render"""
+    if preview_scale == 1.0:
+        return compile_plan(state)
+    return compile_plan(scale_controls_for_proxy(dump_controls(state), preview_scale))
 
 @app.get("/")
 async def root():
@@ -41,112 +297,710 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness():
+    """
+    200 once the image services are loaded and the optional warm-up has finished,
+    503 before that; /health only reports that the server is up
+    """
+    body = {"ready": warmup.finished, "stage": "ready" if warmup.finished else "warming",
+            "warmup": warmup.status()}
+    if not warmup.finished:
+        return JSONResponse(status_code=503, content=body, headers={"Retry-After": "1"})
+    return body
+
 @app.post("/process-image")
 async def process_image(
     image: UploadFile = File(...),
-    controls: str = Form(...)
+    controls: str = Form(...),
+    response_format: str = Form("json"),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None)
 ):
     """
     Process image with the given controls
     """
     try:
-        # Parse controls JSON
-        control_data = json.loads(controls)
+        stats = RequestStats("process-image")
+        plan = _compile_controls(_parse_controls(controls))
         
-        # Read and decode image
         image_bytes = await image.read()
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
+        stats.bytes_in = len(image_bytes)
         
-        # Process image
-        processed_img = image_processor.process_image(img, control_data)
+        def work():
+            # Hash, decode, process and encode on the worker pool
+            cache_key = result_key(ImageCache.digest(image_bytes), plan, encoding, quality,
+                                   decode=decode_mode(image_bytes, plan))
+            cached = _cached_response(cache_key, response_format, stats)
+            if cached is not None:
+                return cached
+            with stats.time("decode"):
+                # JPEGs that the plan shrinks are decoded at reduced size
+                img, run_plan, original_size = _decode_or_400(decode_for_plan, image_bytes, plan)
+            stats.megapixels = original_size[0] * original_size[1] / 1e6
+            processed_img = image_processor.process_image(img, run_plan, timings=stats.timings)
+            return _build_image_response(
+                processed_img, {"original_size": original_size, "result_cache": "miss"},
+                response_format, encoding, quality, stats, cache_key
+            )
         
-        # Encode processed image
-        _, buffer = cv2.imencode('.png', processed_img)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        return {
-            "success": True,
-            "processed_image": f"data:image/png;base64,{img_base64}",
-            "original_size": img.shape[:2],
-            "processed_size": processed_img.shape[:2]
-        }
+        return await _run_on_worker(work)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/process-image-base64")
 async def process_image_base64(
     image_data: str = Form(...),
-    controls: str = Form(...)
+    controls: str = Form(...),
+    preview_max_size: Optional[int] = Form(None),
+    response_format: str = Form("json"),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None)
 ):
     """
-    Process image from base64 string
+    Process image from base64 string.
+    With ``preview_max_size`` the pipeline runs on a proxy whose longest side is capped.
+    ``response_format``/``encoding``/``quality`` select the output as for /process-image.
     """
     try:
-        # Parse controls JSON
-        try:
-            control_data = json.loads(controls)
-        except json.JSONDecodeError as e:
-            raise HTTPException(status_code=400, detail=f"Invalid controls JSON: {str(e)}")
-        
-        # Decode base64 image
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        try:
-            image_bytes = base64.b64decode(image_data)
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
+        stats = RequestStats("process-image-base64")
+        stats.bytes_in = len(image_data)
+        control_state = _parse_controls(controls)
         
-        # Validate image dimensions
-        if img.shape[0] == 0 or img.shape[1] == 0:
-            raise HTTPException(status_code=400, detail="Invalid image dimensions")
+        def work():
+            # Decode base64 image
+            with stats.time("base64"):
+                image_bytes = _b64_to_bytes(image_data)
+            plan = compile_plan(control_state)
+            decode = decode_mode(image_bytes, None if preview_max_size else plan)
+            cache_key = result_key(ImageCache.digest(image_bytes), plan, encoding, quality, preview_max_size, decode)
+            cached = _cached_response(cache_key, response_format, stats)
+            if cached is not None:
+                return cached
+            
+            # Process image, optionally on a downscaled proxy. Either way a JPEG that
+            # ends up shrunk is decoded at reduced size
+            preview_scale = 1.0
+            if preview_max_size:
+                with stats.time("decode"):
+                    img, original_size, _ = _decode_or_400(
+                        decode_image, image_bytes, lambda width, height: proxy_size(width, height, preview_max_size)
+                    )
+                with stats.time("proxy"):
+                    img, preview_scale = make_proxy(img, preview_max_size, original_size)
+            else:
+                with stats.time("decode"):
+                    img, plan, original_size = _decode_or_400(decode_for_plan, image_bytes, plan)
+            stats.megapixels = original_size[0] * original_size[1] / 1e6
+            try:
+                if preview_max_size:
+                    plan = _compile_controls(control_state, preview_scale)
+                processed_img = image_processor.process_image(img, plan, timings=stats.timings)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"Image processing error: {str(e)}")
+            
+            # Validate and encode processed image
+            return _build_image_response(
+                processed_img,
+                {"original_size": original_size, "preview_scale": preview_scale, "result_cache": "miss"},
+                response_format, encoding, quality, stats, cache_key
+            )
         
-        # Process image
-        try:
-            processed_img = image_processor.process_image(img, control_data)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Image processing error: {str(e)}")
-        
-        # Validate processed image
-        if processed_img is None or processed_img.shape[0] == 0 or processed_img.shape[1] == 0:
-            raise HTTPException(status_code=500, detail="Image processing resulted in invalid image")
-        
-        # Encode processed image
-        try:
-            _, buffer = cv2.imencode('.png', processed_img)
-            img_base64 = base64.b64encode(buffer).decode('utf-8')
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Image encoding error: {str(e)}")
+        return await _run_on_worker(work)
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+@app.post("/register-image")
+async def register_image(
+    image: Optional[UploadFile] = File(None),
+    image_data: Optional[str] = Form(None)
+):
+    """
+    Upload an image once and get a content-hash handle for later processing.
+    Accepts either a file upload or a base64 string / data URL.
+    """
+    try:
+        if image is not None:
+            image_bytes = await image.read()
+        elif image_data:
+            image_bytes = _b64_to_bytes(image_data)
+        else:
+            raise HTTPException(status_code=400, detail="No image provided")
+
+        def work():
+            image_id = ImageCache.digest(image_bytes)
+            img = image_cache.get(image_id)
+            already_cached = img is not None
+            if img is None:
+                img = _decode_image_bytes(image_bytes)
+                image_cache.put(image_id, img)
+            return image_id, img, already_cached
+
+        image_id, img, already_cached = await _run_on_worker(work)
         return {
             "success": True,
-            "processed_image": f"data:image/png;base64,{img_base64}",
-            "original_size": img.shape[:2],
-            "processed_size": processed_img.shape[:2]
+            "image_id": image_id,
+            "cached": already_cached,
+            "size": img.shape[:2]
         }
-        
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+def _render_registered(image_id: str, img: np.ndarray, control_state: ControlState,
+                       preview_max_size: Optional[int], stats: RequestStats):
+    """
+    Run the pipeline on a registered image, or on its cached proxy when
+    ``preview_max_size`` is set, memoizing stage outputs under the image handle.
+    Returns the processed image and the response metadata.
+    """
+    source = img
+    original_size = source.shape[:2]
+    source_key = image_id
+    preview_scale = 1.0
+    if preview_max_size:
+        with stats.time("proxy"):
+            source_key, source, preview_scale = _get_cached_proxy(image_id, source, preview_max_size)
+    stats.megapixels = source.shape[0] * source.shape[1] / 1e6
+
+    try:
+        plan = _compile_controls(control_state, preview_scale)
+        processed_img, run_info = image_processor.run(
+            source, plan, image_key=source_key, timings=stats.timings
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Image processing error: {str(e)}")
+
+    return processed_img, {
+        "original_size": original_size,
+        "preview_scale": preview_scale,
+        "pipeline_cache": run_info
+    }
+
+@app.post("/process-cached-image")
+async def process_cached_image(
+    image_id: str = Form(...),
+    controls: str = Form(...),
+    preview_max_size: Optional[int] = Form(None),
+    response_format: str = Form("json"),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None)
+):
+    """
+    Process a previously registered image by its handle.
+    Returns 404 once the handle has been evicted so the client can re-register.
+    With ``preview_max_size`` the pipeline runs on a cached downscaled proxy and
+    pixel-space controls are rescaled to match; omit it for the full-resolution render.
+    """
+    try:
+        stats = RequestStats("process-cached-image")
+        control_state = _parse_controls(controls)
+
+        img = image_cache.get(image_id)
+        if img is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired image_id")
+
+        def work():
+            cache_key = result_key(image_id, compile_plan(control_state), encoding, quality, preview_max_size)
+            cached = _cached_response(cache_key, response_format, stats)
+            if cached is not None:
+                return cached
+            processed_img, metadata = _render_registered(image_id, img, control_state, preview_max_size, stats)
+            return _build_image_response(
+                processed_img, {**metadata, "result_cache": "miss"}, response_format, encoding, quality, stats, cache_key
+            )
+
+        return await _run_on_worker(work)
+
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+@app.websocket("/ws/preview/{image_id}")
+async def preview_socket(
+    websocket: WebSocket,
+    image_id: str,
+    preview_max_size: Optional[int] = None,
+    encoding: str = "jpeg",
+    quality: Optional[int] = None
+):
+    """
+    Live preview of a registered image over one WebSocket.
+    The client sends JSON text messages ``{"version": n, "controls": {...}}`` or
+    ``{"version": n, "delta": {...}}`` with increasing versions. Only the newest
+    state is rendered: versions that arrive during a render are dropped. Each
+    frame is a binary message, the 4-byte big-endian version it renders followed
+    by the encoded image. Problems are reported as ``{"type": "error"}`` text
+    messages; an expired image closes the socket with code 4404.
+    """
+    await websocket.accept()
+    encoding = (encoding or "jpeg").lower()
+    if encoding not in ENCODINGS:
+        await websocket.close(code=4400, reason=f"Unsupported encoding '{encoding}'")
+        return
+    img = image_cache.get(image_id)
+    if img is None:
+        await websocket.close(code=4404, reason="Unknown or expired image_id")
+        return
+    await websocket.send_json({
+        "type": "ready",
+        "image_id": image_id,
+        "original_size": img.shape[:2],
+        "media_type": ENCODINGS[encoding][1]
+    })
+    mailbox = ControlMailbox()
+
+    async def render():
+        while True:
+            version, controls = await mailbox.take()
+            stats = RequestStats("ws-preview")
+            source = image_cache.get(image_id)
+            if source is None:
+                await websocket.close(code=4404, reason="Unknown or expired image_id")
+                return
+            try:
+                control_state = parse_controls(controls)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "version": version, "status": 422,
+                                           "detail": f"Invalid controls: {str(e)}"})
+                continue
+
+            def work():
+                cache_key = result_key(image_id, compile_plan(control_state), encoding, quality, preview_max_size)
+                with stats.time("result_cache"):
+                    cached = result_cache.get(cache_key)
+                if cached is not None:
+                    content = cached.content
+                else:
+                    processed_img, metadata = _render_registered(
+                        image_id, source, control_state, preview_max_size, stats
+                    )
+                    content, _, _ = _encode_result(processed_img, metadata, "binary", encoding, quality,
+                                                   stats, cache_key)
+                stats.bytes_out = len(content)
+                return content
+
+            try:
+                content = await _run_on_worker(work)
+            except HTTPException as e:
+                if e.status_code == 503:
+                    # Pool saturated: render whatever is newest once a worker frees up
+                    await asyncio.sleep(0.05)
+                    mailbox.retry()
+                    continue
+                await websocket.send_json({"type": "error", "version": version, "status": e.status_code,
+                                           "detail": e.detail})
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "version": version, "status": 500,
+                                           "detail": f"Unexpected error: {str(e)}"})
+                continue
+            _finish_request(stats, {})
+            await websocket.send_bytes(pack_frame(version, content))
+
+    renderer = asyncio.create_task(render())
+    try:
+        while not renderer.done():
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+                if not isinstance(message, dict):
+                    raise ValueError("message must be a JSON object")
+                mailbox.post(message)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "status": 400, "detail": str(e)})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        renderer.cancel()
+        await asyncio.gather(renderer, return_exceptions=True)
+
+@app.post("/process-batch")
+async def process_batch(
+    images: List[UploadFile] = File(...),
+    controls: str = Form(...),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None)
+):
+    """
+    Process many images with one set of controls across the batch worker pool.
+    Streams newline-delimited JSON: one line per image as it completes
+    (with ``index``, ``name``, ``processed_image`` or ``error``, and timings),
+    then a final summary line with ``"done": true``.
+    Each output is also kept server-side under its ``result_id`` for /zip-images.
+    """
+    # Compiled once and shared by every image of the batch
+    plan = _compile_controls(_parse_controls(controls))
+    if not images:
+        raise HTTPException(status_code=400, detail="No images provided")
+
+    def read_upload(upload: UploadFile):
+        def read() -> bytes:
+            upload.file.seek(0)
+            return upload.file.read()
+        return read
+
+    items = [(upload.filename or f"image_{idx + 1}", read_upload(upload)) for idx, upload in enumerate(images)]
+
+    def stream():
+        stats = RequestStats("process-batch")
+        failed = 0
+        for result in batch_runner.run(items, plan, encoding, quality, cache=result_cache):
+            content = result.pop("content", None)
+            media_type = result.pop("media_type", None)
+            _observe_batch_result(stats.endpoint, result)
+            if content is not None:
+                result_id = uuid.uuid4().hex
+                result_store.put(result_id, (content, media_type))
+                result["result_id"] = result_id
+                started = time.perf_counter()
+                result["processed_image"] = f"data:{media_type};base64,{base64.b64encode(content).decode('utf-8')}"
+                metrics.stage_seconds.observe(time.perf_counter() - started, "base64")
+                metrics.response_bytes.observe(len(content), stats.endpoint)
+            if not result["success"]:
+                failed += 1
+            yield json.dumps(result) + "\n"
+        metrics.request_seconds.observe(stats.elapsed(), stats.endpoint)
+        yield json.dumps({
+            "done": True,
+            "count": len(items),
+            "failed": failed,
+            "elapsed_ms": round(stats.elapsed() * 1000, 2)
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/jobs")
+async def submit_job(
+    images: List[UploadFile] = File(...),
+    controls: str = Form(...),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None)
+):
+    """
+    Queue a background batch job for ``images`` with one set of controls and return
+    its ``job_id`` right away. Uploads are kept on disk until processed and outputs
+    are written there as they finish, so the job outlives this request (and, with
+    the SQLite store, a restart). Follow it with GET /jobs/{job_id} or
+    /jobs/{job_id}/events.
+    """
+    state = _parse_controls(controls)
+    # Compiled here only to reject invalid controls before anything is queued
+    _compile_controls(state)
+    encoding = (encoding or "png").lower()
+    if encoding not in ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported encoding '{encoding}'")
+    if not images:
+        raise HTTPException(status_code=400, detail="No images provided")
+
+    uploads = [(upload.filename or f"image_{idx + 1}", upload.file) for idx, upload in enumerate(images)]
+    for _, upload in uploads:
+        upload.seek(0)
+    job_id = await _run_on_worker(lambda: job_manager.submit(uploads, dump_controls(state), encoding, quality))
+    return await run_in_threadpool(job_manager.get, job_id)
+
+# The job handlers below are plain functions, which FastAPI runs in its thread pool:
+# they query the job store and read outputs from disk
+
+def _job_request(fn):
+    """Map job manager errors to 404 (unknown job) and 409 (wrong state)"""
+    try:
+        return fn()
+    except JobNotFound:
+        raise HTTPException(status_code=404, detail="Job not found")
+    except JobStateError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/jobs")
+def list_jobs():
+    return {"jobs": job_manager.jobs()}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, since: Optional[int] = None):
+    """
+    Job state and item counts, plus its items: all of them, or with ``since`` (the
+    ``seq`` of the previous poll) only those that changed after it.
+    """
+    return _job_request(lambda: job_manager.get(job_id, since))
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str, since: Optional[int] = None):
+    """
+    Subscribe to a job: streams newline-delimited JSON, one line in the GET
+    /jobs/{job_id} format whenever items finish or the state changes, ending once
+    the job is no longer queued or running.
+    """
+    _job_request(lambda: job_manager.get(job_id))
+
+    def stream():
+        try:
+            for event in job_manager.events(job_id, since):
+                yield json.dumps(event) + "\n"
+        except JobNotFound:
+            # Deleted while subscribed
+            return
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}/items/{index}/output")
+def job_output(job_id: str, index: int):
+    """Encoded output of a finished item, read from disk"""
+    output = job_manager.output(job_id, index)
+    if output is None:
+        raise HTTPException(status_code=404, detail="Output not found")
+    path, media_type = output
+    return FileResponse(path, media_type=media_type)
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    """Stop a job after its current items; unfinished items stay pending for /resume"""
+    return _job_request(lambda: job_manager.cancel(job_id))
+
+@app.post("/jobs/{job_id}/resume")
+def resume_job(job_id: str):
+    """Queue a cancelled or failed job again for its pending items"""
+    return _job_request(lambda: job_manager.resume(job_id))
+
+@app.delete("/jobs/{job_id}")
+def delete_job(job_id: str):
+    """Cancel a job if needed and delete it with its inputs and outputs"""
+    _job_request(lambda: job_manager.delete(job_id))
+    return {"success": True}
+
+def _authorize_local(token: Optional[str]):
+    """
+    Refuse a local-path request unless local batch mode is enabled and the request
+    carries LOCAL_BATCH_TOKEN or, without a token, LOCAL_BATCH_ROOTS confine the paths.
+    CORS does not stop a web page from sending a simple form POST to localhost, so
+    the token or the roots are what keep other sites away from the local disk
+    """
+    if not LOCAL_BATCH_ENABLED:
+        raise HTTPException(status_code=403, detail="Local batch mode is disabled")
+    if LOCAL_BATCH_TOKEN:
+        if not token or not hmac.compare_digest(token.encode(), LOCAL_BATCH_TOKEN.encode()):
+            raise HTTPException(status_code=403, detail="Missing or invalid X-VisionForge-Token")
+    elif not LOCAL_BATCH_ROOTS:
+        raise HTTPException(status_code=403,
+                            detail="Local batch mode needs LOCAL_BATCH_TOKEN or LOCAL_BATCH_ROOTS")
+
+def _local_path(path: str) -> str:
+    """Resolve a client-supplied path, rejecting anything outside LOCAL_BATCH_ROOTS"""
+    resolved = os.path.realpath(os.path.expanduser(path))
+    if LOCAL_BATCH_ROOTS and not any(
+        resolved == root or resolved.startswith(root.rstrip(os.sep) + os.sep) for root in LOCAL_BATCH_ROOTS
+    ):
+        raise HTTPException(status_code=403, detail=f"Path is outside the allowed directories: {path}")
+    return resolved
+
+@app.post("/process-batch-local")
+async def process_batch_local(
+    output_dir: str = Form(...),
+    controls: str = Form(...),
+    input_dir: Optional[str] = Form(None),
+    input_paths: Optional[str] = Form(None),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None),
+    overwrite: bool = Form(False),
+    x_visionforge_token: Optional[str] = Header(None)
+):
+    """
+    Process images that are already on the local disk and write the results to
+    ``output_dir``, so no pixel data travels through the request or response.
+    Sources are every image in ``input_dir`` or the JSON list ``input_paths``;
+    ``.npy`` arrays are read and (with ``encoding=npy``) written memory-mapped.
+    Streams newline-delimited JSON like /process-batch, with ``output_path``
+    in place of the image data. Only available when local batch mode is enabled,
+    and only to authorized callers (see ``_authorize_local``).
+    """
+    _authorize_local(x_visionforge_token)
+    plan = _compile_controls(_parse_controls(controls))
+    encoding = (encoding or "png").lower()
+    if encoding != "npy" and encoding not in ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported encoding '{encoding}'")
+    extension = RAW_EXTENSION if encoding == "npy" else ENCODINGS[encoding][0]
+
+    def plan_items():
+        # Resolving paths, listing the input directory and probing for existing outputs all hit the disk
+        if input_paths:
+            try:
+                sources = [_local_path(p) for p in json.loads(input_paths)]
+            except (json.JSONDecodeError, TypeError) as e:
+                raise HTTPException(status_code=400, detail=f"Invalid input_paths: {str(e)}")
+        elif input_dir:
+            directory = _local_path(input_dir)
+            if not os.path.isdir(directory):
+                raise HTTPException(status_code=404, detail=f"Input directory not found: {input_dir}")
+            sources = sorted(
+                os.path.join(directory, name) for name in os.listdir(directory)
+                if os.path.splitext(name)[1].lower() in READABLE_EXTENSIONS
+                and os.path.isfile(os.path.join(directory, name))
+            )
+        else:
+            raise HTTPException(status_code=400, detail="Provide input_dir or input_paths")
+        if not sources:
+            raise HTTPException(status_code=400, detail="No images provided")
+
+        output = _local_path(output_dir)
+        try:
+            os.makedirs(output, exist_ok=True)
+        except OSError as e:
+            raise HTTPException(status_code=400, detail=f"Cannot create output directory: {str(e)}")
+
+        # Pick output names up front so two sources never write the same file
+        items = []
+        used_names = set()
+        for source in sources:
+            stem = os.path.splitext(os.path.basename(source))[0]
+            name = f"{stem}{extension}"
+            counter = 1
+            while name in used_names or (not overwrite and os.path.exists(os.path.join(output, name))):
+                name = f"{stem}_{counter}{extension}"
+                counter += 1
+            used_names.add(name)
+            items.append((os.path.basename(source), source, os.path.join(output, name)))
+        return items, output
+
+    items, output_dir = await run_in_threadpool(plan_items)
+
+    def stream():
+        stats = RequestStats("process-batch-local")
+        failed = 0
+        for result in batch_runner.run_local(items, plan, encoding, quality):
+            _observe_batch_result(stats.endpoint, result)
+            if not result["success"]:
+                failed += 1
+            yield json.dumps(result) + "\n"
+        metrics.request_seconds.observe(stats.elapsed(), stats.endpoint)
+        yield json.dumps({
+            "done": True,
+            "count": len(items),
+            "failed": failed,
+            "output_dir": output_dir,
+            "elapsed_ms": round(stats.elapsed() * 1000, 2)
+        }) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.post("/process-video")
+async def process_video(
+    source: str = Form(...),
+    output_path: str = Form(...),
+    controls: str = Form(...),
+    fourcc: Optional[str] = Form(None),
+    fps: Optional[float] = Form(None),
+    encoding: str = Form("png"),
+    quality: Optional[int] = Form(None),
+    overwrite: bool = Form(False),
+    x_visionforge_token: Optional[str] = Header(None)
+):
+    """
+    Apply one control preset to every frame of a local video file or a directory of
+    numbered frames. An ``output_path`` with a video extension (.mp4, .mov, .avi,
+    .mkv) is written with ``cv2.VideoWriter`` in frame order, at the source frame
+    rate unless ``fps`` is given; any other path is a directory that receives
+    ``frame_000000`` ... images in ``encoding``. Streams newline-delimited JSON:
+    failed frames, progress with the running frames per second, then a ``done``
+    summary. Only available when local batch mode is enabled, and only to
+    authorized callers (see ``_authorize_local``).
+    """
+    _authorize_local(x_visionforge_token)
+    plan = _compile_controls(_parse_controls(controls))
+    encoding = (encoding or "png").lower()
+    if encoding != "npy" and encoding not in ENCODINGS:
+        raise HTTPException(status_code=400, detail=f"Unsupported encoding '{encoding}'")
+    if fourcc is not None and len(fourcc) != 4:
+        raise HTTPException(status_code=400, detail="fourcc must be four characters, e.g. mp4v")
+    if fps is not None and fps <= 0:
+        raise HTTPException(status_code=400, detail="fps must be positive")
+
+    def open_video():
+        # Resolving paths, opening the capture, listing frame directories and creating the output all hit the disk
+        source_path = _local_path(source)
+        output = _local_path(output_path)
+        if not os.path.exists(source_path):
+            raise HTTPException(status_code=404, detail=f"Source not found: {source_path}")
+        if is_video_path(output):
+            if os.path.exists(output) and not overwrite:
+                raise HTTPException(status_code=409, detail=f"Output already exists: {output}")
+        elif os.path.isdir(output) and os.listdir(output) and not overwrite:
+            raise HTTPException(status_code=409, detail=f"Output directory is not empty: {output}")
+        try:
+            frames = FrameSource(source_path, fps)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            return frames, FrameSink(output, frames.fps, fourcc, encoding, quality)
+        except OSError as e:
+            frames.release()
+            raise HTTPException(status_code=400, detail=f"Cannot create output: {str(e)}")
+
+    frames, sink = await run_in_threadpool(open_video)
+    job = VideoJob(frames, sink, plan, image_processor, workers=VIDEO_WORKERS, queue_size=VIDEO_QUEUE_SIZE)
+
+    def stream():
+        stats = RequestStats("process-video")
+        for event in job.run():
+            yield json.dumps(event) + "\n"
+        metrics.request_seconds.observe(stats.elapsed(), stats.endpoint)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.delete("/register-image/{image_id}")
+async def release_image(image_id: str):
+    """
+    Drop a registered image from the cache
+    """
+    return {"success": True, "released": image_cache.pop(image_id) is not None}
+
+@app.get("/image-cache/stats")
+async def image_cache_stats():
+    return image_cache.stats()
+
+@app.get("/result-cache/stats")
+async def result_cache_stats():
+    """
+    Encoded-result cache: memory tier hits, misses and size, plus the disk tier when enabled
+    """
+    return result_cache.stats()
+
+@app.get("/pipeline-cache/stats")
+async def pipeline_cache_stats():
+    """
+    Stage reuse counts: hits are stages served from cache, misses are stages re-run
+    """
+    return {
+        **image_processor.stage_stats,
+        "cache": image_processor.stage_cache.stats()
+    }
+
+@app.get("/workers/stats")
+async def worker_stats():
+    return worker_pool.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus text format: per-stage durations (decode, each pipeline stage,
+    encode, base64), request durations, payload bytes and image megapixels
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
-    import os
     # Respect Electron override to avoid uvicorn reload worker that can outlive Electron
     reload_env = os.getenv("RELOAD", str(RELOAD))
     is_electron = os.getenv("ELECTRON") == "1"
     reload_flag = False if is_electron else (reload_env.lower() == "true")
-    uvicorn.run("main:app", host=HOST, port=PORT, reload=reload_flag)
+    import uvicorn
+    uvicorn.run("asgi:app", host=HOST, port=PORT, reload=reload_flag)
 
 # -------- ZIP Creation Endpoint --------
 @app.post("/zip-images")
@@ -156,45 +1010,60 @@ async def zip_images(payload: Dict[str, Any]):
     Expected payload format:
     {
       "files": [
-        {"name": "image1.png", "dataUrl": "data:image/png;base64,...."},
+        {"name": "image1.png", "resultId": "<result_id from /process-batch>"},
+        {"name": "image2.png", "jobId": "<job_id from /jobs>", "index": 0},
+        {"name": "image3.png", "dataUrl": "data:image/png;base64,...."},
         ...
       ]
     }
+    Entries are written one at a time while the archive streams out. Already
+    compressed formats (PNG/JPEG/WebP) are stored rather than deflated again.
     Returns: application/zip stream
     """
-    try:
-        files = payload.get("files", [])
-        if not isinstance(files, list) or len(files) == 0:
-            raise HTTPException(status_code=400, detail="No files provided")
-
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zipf:
-            for idx, f in enumerate(files):
-                name = f.get("name") or f"image_{idx + 1}.png"
-                data_url = f.get("dataUrl")
-                if not data_url or not isinstance(data_url, str):
-                    continue
-                try:
-                    # Support data URLs (e.g., data:image/png;base64,....)
-                    if data_url.startswith("data:image"):
-                        base64_part = data_url.split(",", 1)[1]
-                    else:
-                        base64_part = data_url
-                    raw = base64.b64decode(base64_part)
-                except Exception:
-                    # Skip invalid entries
-                    continue
-                # Ensure extension
-                if "." not in name:
-                    name = name + ".png"
-                zipf.writestr(name, raw)
-
-        zip_buffer.seek(0)
-        headers = {
-            "Content-Disposition": f"attachment; filename=visionforge_results.zip"
-        }
-        return StreamingResponse(zip_buffer, media_type="application/zip", headers=headers)
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to create ZIP: {str(e)}")
+    files = payload.get("files", [])
+    if not isinstance(files, list) or len(files) == 0:
+        raise HTTPException(status_code=400, detail="No files provided")
+
+    def load_entry(f: Dict[str, Any]):
+        def load() -> Optional[bytes]:
+            result_id = f.get("resultId")
+            if result_id:
+                stored = result_store.get(result_id)
+                if stored is not None:
+                    return stored[0]
+            job_id = f.get("jobId")
+            if job_id and isinstance(f.get("index"), int):
+                output = job_manager.output(job_id, f["index"])
+                if output is not None:
+                    with open(output[0], 'rb') as stored_file:
+                        return stored_file.read()
+            # Fall back to an inline data URL when there is no (live) handle
+            data_url = f.get("dataUrl")
+            if not data_url or not isinstance(data_url, str):
+                return None
+            try:
+                # Support data URLs (e.g., data:image/png;base64,....)
+                if data_url.startswith("data:image"):
+                    base64_part = data_url.split(",", 1)[1]
+                else:
+                    base64_part = data_url
+                return base64.b64decode(base64_part)
+            except Exception:
+                # Skip invalid entries
+                return None
+        return load
+
+    def entries():
+        for idx, f in enumerate(files):
+            if not isinstance(f, dict):
+                continue
+            name = f.get("name") or f"image_{idx + 1}.png"
+            # Ensure extension
+            if "." not in name:
+                name = name + ".png"
+            yield name, load_entry(f)
+
+    headers = {
+        "Content-Disposition": f"attachment; filename=visionforge_results.zip"
+    }
+    return StreamingResponse(stream_zip(entries()), media_type="application/zip", headers=headers)
@@ -2,14 +2,17 @@ from pydantic import BaseModel
 from typing import Optional, List, Dict, Any, Literal
 
 class CropData(BaseModel):
-    x: int = 0
-    y: int = 0
-    w: int = 0
-    h: int = 0
+    # Percent of the image size
+    x: float = 0
+    y: float = 0
+    w: float = 0
+    h: float = 0
 
 class BlurData(BaseModel):
     method: str = "gaussian"
     ksize: int = 3
+    # "fast" lets large median and bilateral windows use approximations
+    accuracy: Literal['exact', 'fast'] = 'exact'
 
 class EdgesData(BaseModel):
     method: str = "None"
@@ -21,7 +24,7 @@ class EdgesData(BaseModel):
 class BitwiseData(BaseModel):
     operation: str = "None"
     maskThreshold: int = 128
-    maskUpload: Optional[str] = None
+    maskUpload: Optional[Any] = None  # Client-side file input, not used by the pipeline
 
 class AdaptiveThresholdData(BaseModel):
     mode: str = "Simple"
@@ -52,15 +55,15 @@ class DrawItem(BaseModel):
     color: str = "#FF0000"
     thickness: int = 2
     # Universal positioning and sizing for all shapes
-    x: Optional[int] = None          # X position for all shapes
-    y: Optional[int] = None          # Y position for all shapes  
-    w: Optional[int] = None          # Width for all shapes
-    h: Optional[int] = None          # Height for all shapes
+    x: Optional[float] = None          # X position for all shapes
+    y: Optional[float] = None          # Y position for all shapes  
+    w: Optional[float] = None          # Width for all shapes
+    h: Optional[float] = None          # Height for all shapes
     # Legacy properties for backward compatibility
-    xywh: Optional[List[int]] = None  # For rectangles
-    xyr: Optional[List[int]] = None   # For circles
-    xyxy: Optional[List[int]] = None  # For lines
-    xy: Optional[List[int]] = None    # For text
+    xywh: Optional[List[float]] = None  # For rectangles
+    xyr: Optional[List[float]] = None   # For circles
+    xyxy: Optional[List[float]] = None  # For lines
+    xy: Optional[List[float]] = None    # For text
     text: Optional[str] = None        # For text
     scale: Optional[float] = None     # For text
 
@@ -76,6 +79,7 @@ class ControlState(BaseModel):
     scale: float = 1.0
     scaleInterpolation: str = "linear"
     crop: CropData = CropData()
+    isCropActive: bool = False
     cropAspect: str = "None"
     
     # Filters
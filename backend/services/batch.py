@@ -0,0 +1,278 @@
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from config import TILE_PIXELS, TILE_MIN_PIXELS, TILE_WORKERS
+from services.control_plan import ControlPlan
+from services.decode import decode_for_plan, decode_mode
+from services.encoding import ENCODINGS, encode_image
+from services.image_cache import ImageCache
+from services.image_processor import ImageProcessor
+from services.result_cache import CachedResult, ResultCache, result_key
+
+# ImageProcessor is stateless, so one instance serves every worker thread (or one per worker process)
+_processor = ImageProcessor(tile_pixels=TILE_PIXELS, tile_min_pixels=TILE_MIN_PIXELS, tile_workers=TILE_WORKERS)
+
+
+# Raw array format for local batches: memory-mapped on read and on write
+RAW_EXTENSION = '.npy'
+# Files picked up when a local batch (or frame sequence) names a directory
+READABLE_EXTENSIONS = {ext for ext, _ in ENCODINGS.values()} | {'.jpeg', '.tif', '.tiff', RAW_EXTENSION}
+
+
+def decode_file(path: str) -> np.ndarray:
+    """
+    Read an image from disk. ``.npy`` arrays are memory-mapped read-only, so pixels
+    are paged in as stages touch them; encoded files are decoded straight from a
+    memory map of the file instead of a bytes copy.
+    """
+    if path.lower().endswith(RAW_EXTENSION):
+        img = np.load(path, mmap_mode='r')
+        if img.dtype != np.uint8:
+            raise ValueError(f"Expected a uint8 array, got {img.dtype}")
+        if img.ndim == 2:
+            img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+        elif img.ndim == 3 and img.shape[2] == 4:
+            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        elif img.ndim != 3 or img.shape[2] != 3:
+            raise ValueError(f"Expected an HxW, HxWx3 or HxWx4 array, got shape {img.shape}")
+    else:
+        if os.path.getsize(path) == 0:
+            raise ValueError("Invalid image format")
+        img = cv2.imdecode(np.memmap(path, dtype=np.uint8, mode='r'), cv2.IMREAD_COLOR)
+    if img is None or img.shape[0] == 0 or img.shape[1] == 0:
+        raise ValueError("Invalid image format")
+    return img
+
+
+def decode_file_for_plan(path: str, plan: ControlPlan) -> Tuple[np.ndarray, ControlPlan, Tuple[int, int]]:
+    """``decode_file`` shaped by ``plan`` (see ``decode_for_plan``): image, plan to run and full (height, width)"""
+    if path.lower().endswith(RAW_EXTENSION):
+        img = decode_file(path)
+        return img, plan, img.shape[:2]
+    if os.path.getsize(path) == 0:
+        raise ValueError("Invalid image format")
+    return decode_for_plan(np.memmap(path, dtype=np.uint8, mode='r'), plan)
+
+
+def write_file(image: np.ndarray, path: str, encoding: str, quality: Optional[int]):
+    """Write ``image`` next to ``path`` and move it into place, so readers never see a partial file"""
+    partial = path + '.part'
+    try:
+        if encoding == 'npy':
+            out = np.lib.format.open_memmap(partial, mode='w+', dtype=image.dtype, shape=image.shape)
+            out[...] = image
+            out.flush()
+            del out
+        else:
+            content, _ = encode_image(image, encoding, quality)
+            with open(partial, 'wb') as f:
+                f.write(content)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+
+def process_local_file(
+    source_path: str,
+    output_path: str,
+    controls: ControlPlan,
+    encoding: str = "png",
+    quality: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Read, process and write one image on the local disk. Only paths cross the
+    pool boundary, so no pixel data is pickled or held in the request.
+    """
+    stage_timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    img, plan, original_size = decode_file_for_plan(source_path, controls)
+    t1 = time.perf_counter()
+    processed = _processor.process_image(img, plan, timings=stage_timings)
+    t2 = time.perf_counter()
+    write_file(processed, output_path, encoding, quality)
+    t3 = time.perf_counter()
+    return {
+        "output_path": output_path,
+        "original_size": original_size,
+        "processed_size": processed.shape[:2],
+        "timing_ms": {
+            "decode": round((t1 - t0) * 1000, 2),
+            "process": round((t2 - t1) * 1000, 2),
+            "write": round((t3 - t2) * 1000, 2),
+        },
+        "stage_timings": {"decode": t1 - t0, **stage_timings, "write": t3 - t2},
+    }
+
+
+def process_encoded_image(
+    image_bytes: bytes,
+    controls: ControlPlan,
+    encoding: str = "png",
+    quality: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Decode, process and encode one image. Runs inside a pool worker, so it only
+    takes and returns picklable values and reports its own stage timings.
+    """
+    stage_timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    img, plan, original_size = decode_for_plan(image_bytes, controls)
+    t1 = time.perf_counter()
+    processed = _processor.process_image(img, plan, timings=stage_timings)
+    t2 = time.perf_counter()
+    content, media_type = encode_image(processed, encoding, quality)
+    t3 = time.perf_counter()
+    return {
+        "content": content,
+        "media_type": media_type,
+        "original_size": original_size,
+        "processed_size": processed.shape[:2],
+        "timing_ms": {
+            "decode": round((t1 - t0) * 1000, 2),
+            "process": round((t2 - t1) * 1000, 2),
+            "encode": round((t3 - t2) * 1000, 2),
+        },
+        "stage_timings": {"decode": t1 - t0, **stage_timings, "encode": t3 - t2},
+    }
+
+
+class BatchRunner:
+    """
+    Fans batch items out over a thread or process pool and yields results as they finish.
+
+    At most ``max_in_flight`` items are read and submitted at once, so memory stays
+    bounded by the in-flight window rather than the batch size.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, mode: str = "thread", max_in_flight: Optional[int] = None):
+        if mode not in ("thread", "process"):
+            raise ValueError("Batch executor mode must be 'thread' or 'process'")
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.mode = mode
+        self.max_in_flight = max_in_flight or self.max_workers * 2
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                pool = ProcessPoolExecutor if self.mode == "process" else ThreadPoolExecutor
+                self._executor = pool(max_workers=self.max_workers)
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def run(
+        self,
+        items: Iterable[Tuple[str, Callable[[], bytes]]],
+        controls: ControlPlan,
+        encoding: str = "png",
+        quality: Optional[int] = None,
+        cache: Optional[ResultCache] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        ``items`` yields ``(name, read_bytes)`` pairs; ``read_bytes`` is only called
+        once a slot in the in-flight window is free. ``controls`` is compiled once
+        by the caller and shared (or pickled, in process mode) for every item. Yields one result dict per item,
+        in completion order, with either the encoded output or an ``error``.
+
+        With ``cache``, an input already processed with the same plan and encoding
+        is answered from it without reaching a worker and new outputs are added;
+        results then carry ``result_cache`` ("hit" or "miss").
+        """
+        keys: List[Optional[str]] = []
+
+        def make_args(read_bytes: Callable[[], bytes]):
+            keys.append(None)
+            image_bytes = read_bytes()
+            if cache is not None:
+                key = keys[-1] = result_key(ImageCache.digest(image_bytes), controls, encoding, quality,
+                                            decode=decode_mode(image_bytes, controls))
+                cached = cache.get(key)
+                if cached is not None:
+                    return {"content": cached.content, "media_type": cached.media_type,
+                            **cached.metadata, "result_cache": "hit"}
+            return (image_bytes, controls, encoding, quality)
+
+        jobs = ((name, lambda read_bytes=read_bytes: make_args(read_bytes)) for name, read_bytes in items)
+        for result in self._run(process_encoded_image, jobs):
+            key = keys[result["index"]]
+            if key is not None and result["success"] and "result_cache" not in result:
+                cache.put(key, CachedResult(result["content"], result["media_type"], {
+                    "original_size": result["original_size"], "processed_size": result["processed_size"]
+                }))
+                result["result_cache"] = "miss"
+            yield result
+
+    def run_local(
+        self,
+        items: Iterable[Tuple[str, str, str]],
+        controls: ControlPlan,
+        encoding: str = "png",
+        quality: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        ``items`` yields ``(name, source_path, output_path)``. Yields one result dict
+        per item, in completion order, with the ``output_path`` written or an ``error``.
+        """
+        jobs = ((name, lambda source=source, output=output: (source, output, controls, encoding, quality))
+                for name, source, output in items)
+        return self._run(process_local_file, jobs)
+
+    def _run(self, fn: Callable[..., Dict[str, Any]],
+             jobs: Iterable[Tuple[str, Callable[[], tuple]]]) -> Iterator[Dict[str, Any]]:
+        """
+        Submit ``fn(*make_args())`` for each ``(name, make_args)`` within the in-flight
+        window. ``make_args`` may instead return a finished result dict.
+        """
+        pending: Dict[Future, Tuple[int, str, float]] = {}
+        iterator = enumerate(jobs)
+        exhausted = False
+
+        while pending or not exhausted:
+            while not exhausted and len(pending) < self.max_in_flight:
+                try:
+                    index, (name, make_args) = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                started = time.perf_counter()
+                try:
+                    args = make_args()
+                    if isinstance(args, dict):
+                        # Already answered (e.g. from the result cache) without running ``fn``
+                        yield {"index": index, "name": name, **args, "success": True,
+                               "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+                        continue
+                    future = self.executor.submit(fn, *args)
+                except Exception as e:
+                    yield {"index": index, "name": name, "success": False, "error": str(e)}
+                    continue
+                pending[future] = (index, name, started)
+
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, name, started = pending.pop(future)
+                result: Dict[str, Any] = {"index": index, "name": name}
+                try:
+                    result.update(future.result())
+                    result["success"] = True
+                except Exception as e:
+                    result.update({"success": False, "error": str(e)})
+                result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                yield result
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+
+# Blur accuracy modes: "exact" reproduces OpenCV's filters bit for bit, "fast" lets large
+# median and bilateral windows use approximations. Gaussian and box blur are always exact
+# (OpenCV already runs them separably and with running sums respectively).
+BLUR_ACCURACIES = ('exact', 'fast')
+
+# Bilateral parameters the pipeline has always used
+BILATERAL_SIGMA_COLOR = 80
+BILATERAL_SIGMA_SPACE = 80
+
+# Smallest windows for which the approximations beat the exact filters (see
+# benchmarks/bench_blur.py); below them "fast" still runs the exact filter
+FAST_MEDIAN_MIN_KSIZE = 7
+FAST_BILATERAL_MIN_KSIZE = 13
+
+
+def approximates(method: str, ksize: int, fast: bool) -> bool:
+    """Whether ``apply_blur`` may return an approximation for these settings"""
+    if not fast:
+        return False
+    if method == 'median':
+        return ksize >= FAST_MEDIAN_MIN_KSIZE
+    if method == 'bilateral':
+        return ksize >= FAST_BILATERAL_MIN_KSIZE
+    return False
+
+
+def apply_blur(image: np.ndarray, method: str, ksize: int, fast: bool = False) -> np.ndarray:
+    """
+    Blur ``image`` with a ``ksize`` window, picking the implementation from the
+    method, window and image size. Images smaller than a few windows always take
+    the exact path, where the approximations would have too few samples.
+    """
+    if approximates(method, ksize, fast) and min(image.shape[:2]) >= 4 * ksize:
+        if method == 'median':
+            return _fast_median(image, ksize)
+        return _fast_bilateral(image, ksize, BILATERAL_SIGMA_COLOR)
+
+    if method == 'gaussian':
+        return cv2.GaussianBlur(image, (ksize, ksize), 0)
+    if method == 'median':
+        return cv2.medianBlur(image, ksize)
+    if method == 'bilateral':
+        return cv2.bilateralFilter(image, ksize, BILATERAL_SIGMA_COLOR, BILATERAL_SIGMA_SPACE)
+    if method == 'box':
+        return cv2.boxFilter(image, -1, (ksize, ksize))
+    return image
+
+
+def _fast_median(image: np.ndarray, ksize: int) -> np.ndarray:
+    """
+    Median over a half-resolution copy with a half-size window, upsampled
+    bilinearly. Small windows then hit OpenCV's sorting-network median and large
+    ones run the histogram median on a quarter of the pixels.
+    """
+    h, w = image.shape[:2]
+    small = cv2.resize(image, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
+    small = cv2.medianBlur(small, max(3, (ksize // 2) | 1))
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def _fast_bilateral(image: np.ndarray, ksize: int, sigma_color: float) -> np.ndarray:
+    """
+    Piecewise-linear bilateral filter (Durand & Dorsey). The intensity axis is
+    sampled every ``sigma`` levels. For each level, the range-weighted channel and
+    its weights are box filtered at reduced resolution, and every pixel then
+    interpolates between the two levels around its own value. The spatial
+    sigma is far wider than any window, so a box stands in for OpenCV's disc.
+    Channels are filtered separately; OpenCV sums channel differences, so the colour
+    sigma is split between them. The cost does not grow with ``ksize``.
+    """
+    h, w = image.shape[:2]
+    planes = cv2.split(image) if image.ndim == 3 else [image]
+    sigma = sigma_color / len(planes)
+    factor = max(1, ksize // 6)
+    window = max(3, round(ksize / factor) | 1)
+    values = np.arange(256, dtype=np.float32)
+
+    filtered = []
+    for plane in planes:
+        small = cv2.resize(plane, (w // factor, h // factor), interpolation=cv2.INTER_AREA) if factor > 1 else plane
+        small_values = small.astype(np.float32)
+        result = np.zeros((h, w), np.float32)
+        for level in np.arange(0, 255 + sigma, sigma, dtype=np.float32):
+            weight = cv2.LUT(small, np.exp(-(values - level) ** 2 / (2 * sigma * sigma)))
+            level_image = cv2.divide(cv2.boxFilter(cv2.multiply(small_values, weight), -1, (window, window)),
+                                     cv2.boxFilter(weight, -1, (window, window)))
+            if factor > 1:
+                level_image = cv2.resize(level_image, (w, h), interpolation=cv2.INTER_LINEAR)
+            share = cv2.LUT(plane, np.maximum(0, 1 - np.abs(values - level) / sigma))
+            cv2.accumulateProduct(level_image, share, result)
+        filtered.append(cv2.convertScaleAbs(result))
+    return cv2.merge(filtered) if image.ndim == 3 else filtered[0]
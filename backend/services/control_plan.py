@@ -0,0 +1,261 @@
+import functools
+import logging
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+import cv2
+from pydantic import ValidationError
+
+from models.control_models import ControlState, DrawItem
+from services.blur import approximates
+
+logger = logging.getLogger(__name__)
+
+_INTERPOLATION_METHODS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'area': cv2.INTER_AREA,
+    'lanczos': cv2.INTER_LANCZOS4
+}
+_COLOR_SPACES = ('RGB', 'HSV', 'LAB', 'YCrCb')
+_BLUR_METHODS = ('gaussian', 'median', 'bilateral', 'box')
+_BITWISE_OPERATIONS = ('NOT', 'AND', 'OR', 'XOR')
+# Number of coordinates each draw item type reads from its legacy field
+_DRAW_COORDS = {'rect': ('xywh', 4), 'circle': ('xyr', 3), 'line': ('xyxy', 4), 'text': ('xy', 2)}
+
+
+class ColorParams(NamedTuple):
+    grayscale: float
+    color_space: str
+
+
+class TransformParams(NamedTuple):
+    rotate: float
+    translate_x: float
+    translate_y: float
+    scale: float
+    interpolation: int
+    crop: Optional[Tuple[float, float, float, float]]  # (x, y, w, h) in percent, None when inactive
+
+
+class FilterParams(NamedTuple):
+    blur: Optional[str]  # None when no blur is applied
+    ksize: int
+    sharpen: float
+    fast: bool = False  # the blur may be approximated (see services.blur)
+
+
+class EdgesParams(NamedTuple):
+    method: Optional[str]  # 'Canny', 'Sobel' or None; the other method's parameters are 0
+    canny_t1: int
+    canny_t2: int
+    sobel_ksize: int
+
+
+class BitwiseParams(NamedTuple):
+    operation: Optional[str]  # 'NOT', 'AND', 'OR', 'XOR' or None
+    mask_threshold: int
+
+
+class AdaptiveParams(NamedTuple):
+    method: Optional[int]  # cv2.ADAPTIVE_THRESH_* flag, None in simple mode
+    block_size: int
+    c: int
+
+
+class MorphologyParams(NamedTuple):
+    operation: Optional[str]  # None when the kernel or iteration count is a no-op
+    kernel_size: int  # odd, 0 when inactive
+    iterations: int
+
+
+class ColorBoostParams(NamedTuple):
+    saturation: float
+    hue_shift: float
+    gains_bgr: Tuple[float, float, float]
+    contrast: float
+    brightness: float
+
+
+class DrawOp(NamedTuple):
+    """One validated shape, with its colour and pixel coordinates already resolved"""
+    kind: str
+    color: Tuple[int, int, int]
+    thickness: int
+    points: Tuple[int, ...]  # rect/line: x1, y1, x2, y2; circle: x, y, r; text: x, y
+    text: Optional[str] = None
+    scale: float = 1.0
+
+
+class FinalParams(NamedTuple):
+    brightness: float
+    blend_alpha: float
+
+
+class ControlPlan(NamedTuple):
+    """
+    Controls compiled for the pipeline: one field per stage, named after it, holding
+    that stage's parameters. Plans are immutable and hashable, so one plan can be
+    shared by every image of a batch and used as (part of) a cache key.
+    """
+    color: ColorParams
+    transform: TransformParams
+    filter: FilterParams
+    edges: EdgesParams
+    bitwise: BitwiseParams
+    adaptive_threshold: AdaptiveParams
+    morphology: MorphologyParams
+    color_boost: ColorBoostParams
+    draw: Tuple[DrawOp, ...]
+    final: FinalParams
+
+
+@functools.lru_cache(maxsize=256)
+def hex_to_bgr(hex_color: str) -> Tuple[int, int, int]:
+    """Convert hex color to BGR tuple"""
+    hex_color = hex_color.lstrip('#')
+    r = int(hex_color[0:2], 16)
+    g = int(hex_color[2:4], 16)
+    b = int(hex_color[4:6], 16)
+    return (b, g, r)  # OpenCV uses BGR
+
+
+def dump_controls(state: ControlState) -> Dict[str, Any]:
+    return state.model_dump() if hasattr(state, 'model_dump') else state.dict()
+
+
+def parse_controls(data: Any) -> ControlState:
+    """
+    Validate decoded controls JSON into a ``ControlState``.
+
+    Draw items are validated one by one and invalid ones are dropped with a
+    warning, as the pipeline always did, so a half-edited shape in the UI does
+    not fail the whole request. Any other invalid field raises ``ValueError``.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Controls must be a JSON object")
+    draw_items = data.get('drawItems')
+    if isinstance(draw_items, list):
+        valid = []
+        for i, item in enumerate(draw_items):
+            try:
+                valid.append(DrawItem(**item))
+            except (ValidationError, TypeError) as e:
+                logger.warning("Skipping invalid draw item %d: %s", i, e)
+        data = {**data, 'drawItems': valid}
+    elif draw_items is not None:
+        logger.warning("drawItems is not a list, got %s", type(draw_items))
+        data = {**data, 'drawItems': []}
+    return ControlState(**data)
+
+
+def _compile_draw_item(i: int, item: DrawItem) -> Optional[DrawOp]:
+    field, count = _DRAW_COORDS.get(item.type, (None, 0))
+    values = getattr(item, field) if field else None
+    if not values or (item.type == 'text' and not item.text):
+        logger.warning("Unknown or incomplete draw item type: %s", item.type)
+        return None
+    if len(values) != count:
+        logger.warning("Invalid %s for %s: %s", field, item.type, values)
+        return None
+    try:
+        color = hex_to_bgr(item.color)
+    except ValueError as e:
+        logger.warning("Error processing draw item %d: %s", i, e)
+        return None
+
+    if item.type == 'rect':
+        x, y, w, h = values
+        points = (int(x), int(y), int(x+w), int(y+h))
+    else:
+        points = tuple(int(v) for v in values)
+    if item.type == 'text':
+        scale = 1.0 if item.scale is None else float(item.scale)
+        return DrawOp(item.type, color, int(item.thickness), points, str(item.text), scale)
+    return DrawOp(item.type, color, int(item.thickness), points)
+
+
+def _float(value: float) -> float:
+    # Adding 0.0 turns -0.0 into 0.0, so equal settings also have equal reprs
+    return float(value) + 0.0
+
+
+def compile_plan(controls: Union[ControlState, Dict[str, Any]]) -> ControlPlan:
+    """
+    Resolve validated controls into the parameters each stage actually uses.
+    Settings that make a stage a no-op compile to ``None`` operations and the
+    parameters an inactive operation would read are zeroed, so the plan is also
+    a canonical form: controls that render the same give equal plans.
+    """
+    state = controls if isinstance(controls, ControlState) else parse_controls(controls)
+
+    crop = state.crop
+    crop_active = (state.isCropActive and crop.w > 0 and crop.h > 0
+                   and crop.x >= 0 and crop.y >= 0)
+
+    blur = state.blur
+    blur_method = blur.method if blur.ksize > 3 and blur.method in _BLUR_METHODS else None
+
+    edges = state.edges
+    adaptive = state.adaptiveThreshold
+    if adaptive.mode != 'Adaptive':
+        adaptive_method = None
+    elif adaptive.method == 'mean':
+        adaptive_method = cv2.ADAPTIVE_THRESH_MEAN_C
+    else:  # gaussian
+        adaptive_method = cv2.ADAPTIVE_THRESH_GAUSSIAN_C
+
+    morphology = state.morphology
+    kernel_size = morphology.kernelSize
+    morphology_active = kernel_size > 1 and morphology.iterations > 0
+    if kernel_size % 2 == 0:
+        # Ensure kernel size is odd
+        kernel_size += 1
+
+    color_boost = state.colorBoost
+    gains = color_boost.rgbGains
+    draw = tuple(op for op in (_compile_draw_item(i, item) for i, item in enumerate(state.drawItems))
+                 if op is not None)
+
+    scale = _float(state.scale)
+    if edges.method == 'Canny':
+        edges_params = EdgesParams('Canny', edges.canny_t1, edges.canny_t2, 0)
+    elif edges.method == 'Sobel':
+        edges_params = EdgesParams('Sobel', 0, 0, edges.sobel_ksize)
+    else:
+        edges_params = EdgesParams(None, 0, 0, 0)
+    bitwise = state.bitwise
+    operation = bitwise.operation if bitwise.operation in _BITWISE_OPERATIONS else None
+
+    return ControlPlan(
+        color=ColorParams(max(0.0, _float(state.grayscaleAmount)),
+                          state.colorSpace if state.colorSpace in _COLOR_SPACES else 'RGB'),
+        transform=TransformParams(
+            _float(state.rotate), _float(state.translateX), _float(state.translateY), scale,
+            # Interpolation only matters when the image is scaled
+            _INTERPOLATION_METHODS.get(state.scaleInterpolation, cv2.INTER_LINEAR) if scale != 1.0 else cv2.INTER_LINEAR,
+            tuple(_float(v) for v in (crop.x, crop.y, crop.w, crop.h)) if crop_active else None,
+        ),
+        filter=FilterParams(blur_method, blur.ksize if blur_method else 0, max(0.0, _float(state.sharpenStrength)),
+                            approximates(blur_method, blur.ksize, blur.accuracy == 'fast')),
+        edges=edges_params,
+        bitwise=BitwiseParams(operation, bitwise.maskThreshold if operation in ('AND', 'OR') else 0),
+        adaptive_threshold=(AdaptiveParams(adaptive_method, adaptive.blockSize, adaptive.c)
+                            if adaptive_method is not None else AdaptiveParams(None, 0, 0)),
+        morphology=(MorphologyParams(morphology.operation, kernel_size, morphology.iterations)
+                    if morphology_active else MorphologyParams(None, 0, 0)),
+        color_boost=ColorBoostParams(
+            _float(color_boost.saturation), _float(color_boost.hueShift),
+            (_float(gains.b), _float(gains.g), _float(gains.r)),
+            _float(color_boost.contrast), _float(color_boost.brightness),
+        ),
+        draw=draw,
+        final=FinalParams(_float(state.brightness), max(0.0, _float(state.blendAlpha))),
+    )
+
+
+def as_plan(controls: Union[ControlPlan, ControlState, Dict[str, Any]]) -> ControlPlan:
+    """Accept a compiled plan, a ``ControlState`` or raw controls JSON"""
+    if isinstance(controls, ControlPlan):
+        return controls
+    return compile_plan(controls)
@@ -0,0 +1,150 @@
+from typing import Callable, NamedTuple, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from config import DECODE_REDUCED
+from services.control_plan import ControlPlan, as_plan
+from services.image_processor import crop_window
+
+# JPEG DCT scaling denominator -> imdecode flag, coarsest first. Other formats are
+# decoded at full size and then resized inside OpenCV, which saves nothing
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# Start-of-frame markers, which carry the frame size (C4, C8 and CC are DHT, JPG and DAC)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+ImageData = Union[bytes, bytearray, memoryview, np.ndarray]
+# Full-resolution (width, height) -> smallest (width, height) the caller will use
+SizeNeeded = Callable[[int, int], Tuple[int, int]]
+
+
+class Decoded(NamedTuple):
+    image: np.ndarray
+    original_size: Tuple[int, int]  # (height, width) of the image at full resolution
+    reduction: int  # DCT scaling denominator used, 1 for a full-size decode
+
+
+def jpeg_size(data: np.ndarray) -> Optional[Tuple[int, int]]:
+    """(width, height) from the start-of-frame header of a JPEG, or None for anything else"""
+    if len(data) < 4 or bytes(data[:2]) != b'\xff\xd8':
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        segment = bytes(data[i:i + 9])
+        if segment[0] != 0xFF:
+            return None
+        marker = segment[1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = segment[5] << 8 | segment[6]
+            width = segment[7] << 8 | segment[8]
+            return (width, height) if width and height else None
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan before any frame header
+            return None
+        i += 2 + (segment[2] << 8 | segment[3])
+    return None
+
+
+def _reduced(width: int, height: int, factor: int) -> Tuple[int, int]:
+    """Size libjpeg decodes to at 1/``factor`` scale"""
+    return -(-width // factor), -(-height // factor)
+
+
+def decode_image(data: ImageData, needed: Optional[SizeNeeded] = None) -> Decoded:
+    """
+    Decode ``data`` (encoded bytes or a uint8 array of them) to BGR.
+
+    With ``needed``, a JPEG is decoded at the smallest 1/2, 1/4 or 1/8 scale that is
+    still at least that size: libjpeg then skips most of the inverse DCT and the
+    decoded buffer shrinks by the square of the factor. EXIF orientation is applied
+    either way. Raises ValueError for data that does not decode.
+    """
+    buffer = data if isinstance(data, np.ndarray) else np.frombuffer(data, np.uint8)
+    size = jpeg_size(buffer) if needed is not None and DECODE_REDUCED else None
+    if size is not None:
+        width, height = size
+        need_w, need_h = needed(width, height)
+        for factor, flag in REDUCED_FLAGS:
+            reduced_w, reduced_h = _reduced(width, height, factor)
+            if need_w < 1 or need_h < 1 or reduced_w < need_w or reduced_h < need_h:
+                continue
+            image = cv2.imdecode(buffer, flag)
+            if image is None:
+                break
+            decoded = (image.shape[1], image.shape[0])
+            if decoded == (reduced_w, reduced_h):
+                return Decoded(image, (height, width), factor)
+            # EXIF orientation swapped the axes
+            need_w, need_h = needed(height, width)
+            if decoded == _reduced(height, width, factor) and decoded[0] >= need_w and decoded[1] >= need_h:
+                return Decoded(image, (width, height), factor)
+            break
+    image = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if image is None or image.shape[0] == 0 or image.shape[1] == 0:
+        raise ValueError("Invalid image format")
+    return Decoded(image, image.shape[:2], 1)
+
+
+def _plan_size_needed(transform) -> Optional[SizeNeeded]:
+    """The size a shrink-only transform keeps, or None when the plan needs the full-size decode"""
+    if transform.rotate == 0 and transform.translate_x == 0 and transform.translate_y == 0 and transform.scale < 1:
+        return lambda width, height: (int(width * transform.scale), int(height * transform.scale))
+    return None
+
+
+def decode_mode(data: ImageData, plan: Optional[ControlPlan] = None) -> str:
+    """
+    ``'reduced'`` when ``decode_for_plan(data, plan)`` (or, without ``plan``, a preview
+    decode with a size limit) may decode ``data`` at reduced size, else ``'full'``.
+    Results rendered from the two differ slightly, so result cache keys include it.
+    Only the JPEG header is read.
+    """
+    if not DECODE_REDUCED or (plan is not None and _plan_size_needed(as_plan(plan).transform) is None):
+        return 'full'
+    buffer = data if isinstance(data, np.ndarray) else np.frombuffer(data, np.uint8)
+    return 'reduced' if jpeg_size(buffer) is not None else 'full'
+
+
+def decode_for_plan(data: ImageData, plan: ControlPlan) -> Tuple[np.ndarray, ControlPlan, Tuple[int, int]]:
+    """
+    Decode ``data`` for running ``plan`` on it; returns the image, the plan to run
+    on it instead and the full-resolution (height, width).
+
+    When the plan only shrinks the image before anything that depends on pixel
+    positions (a scale below 1 without rotation or translation), a JPEG is decoded
+    at reduced size, resized to the exact scaled size and paired with a plan that
+    no longer scales. When the transform that remains is only a crop and the
+    final blend does not need the uncropped source, the crop is taken right after
+    decoding, so the colour stage only converts the kept region; that part is exact.
+    """
+    plan = as_plan(plan)
+    transform = plan.transform
+    needed = _plan_size_needed(transform)
+    image, original_size, reduction = decode_image(data, needed)
+
+    if reduction > 1:
+        size = needed(original_size[1], original_size[0])
+        if size != (image.shape[1], image.shape[0]):
+            image = cv2.resize(image, size, interpolation=transform.interpolation)
+        transform = transform._replace(scale=1.0, interpolation=cv2.INTER_LINEAR)
+
+    if (transform.crop is not None and transform.scale == 1.0 and transform.rotate == 0
+            and transform.translate_x == 0 and transform.translate_y == 0 and plan.final.blend_alpha == 0):
+        window = crop_window(transform, image.shape[1], image.shape[0])
+        if window is not None:
+            x, y, w, h = window
+            image = image[y:y + h, x:x + w]
+            transform = transform._replace(crop=None)
+
+    if transform is not plan.transform:
+        plan = plan._replace(transform=transform)
+    return image, plan, original_size
@@ -0,0 +1,78 @@
+import logging
+from typing import Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from services.control_plan import DrawOp
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_key(op: DrawOp) -> Optional[Tuple]:
+    """
+    Items that can share one ``cv2.polylines`` call with neighbours of the same key.
+    ``cv2.line`` and ``cv2.rectangle`` outlines draw exactly the pixels of the
+    equivalent polyline; filled rectangles cannot be batched because ``fillPoly``
+    leaves holes where polygons of one call overlap.
+    """
+    if op.kind == 'line' and op.thickness > 0:
+        return ('line', op.color, op.thickness)
+    if op.kind == 'rect' and op.thickness >= 0:
+        return ('rect', op.color, op.thickness)
+    return None
+
+
+def _polylines(ops: Sequence[DrawOp], kind: str) -> np.ndarray:
+    """Points of every item of a run as one ``(n, 2 or 4, 2)`` int32 array"""
+    points = np.array([op.points for op in ops], np.int32)
+    if kind == 'line':
+        return points.reshape(-1, 2, 2)
+    x1, y1, x2, y2 = points.T
+    return np.stack([x1, y1, x2, y1, x2, y2, x1, y2], axis=1).reshape(-1, 4, 2)
+
+
+def _draw_op(canvas: np.ndarray, op: DrawOp):
+    if op.kind == 'rect':
+        x1, y1, x2, y2 = op.points
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), op.color, op.thickness)
+    elif op.kind == 'circle':
+        x, y, r = op.points
+        cv2.circle(canvas, (x, y), r, op.color, op.thickness)
+    elif op.kind == 'line':
+        x1, y1, x2, y2 = op.points
+        cv2.line(canvas, (x1, y1), (x2, y2), op.color, op.thickness)
+    elif op.kind == 'text':
+        cv2.putText(canvas, op.text, op.points, cv2.FONT_HERSHEY_SIMPLEX, op.scale, op.color, op.thickness)
+
+
+def draw_ops(canvas: np.ndarray, ops: Sequence[DrawOp]) -> np.ndarray:
+    """
+    Draw ``ops`` into ``canvas`` in place and in order. Runs of consecutive lines,
+    or of rectangle outlines, with the same colour and thickness are drawn with one
+    ``cv2.polylines`` call from a single coordinate array; within a run the order
+    does not matter, so the output is identical to drawing item by item. An item
+    that fails is skipped with a warning.
+    """
+    i = 0
+    while i < len(ops):
+        key = _batch_key(ops[i])
+        end = i + 1
+        while key is not None and end < len(ops) and _batch_key(ops[end]) == key:
+            end += 1
+        if end - i > 1:
+            try:
+                kind, color, thickness = key
+                cv2.polylines(canvas, _polylines(ops[i:end], kind), kind == 'rect', color, thickness)
+                i = end
+                continue
+            except Exception:
+                # Draw the run item by item so only the bad ones are skipped
+                pass
+        for index in range(i, end):
+            try:
+                _draw_op(canvas, ops[index])
+            except Exception as e:
+                logger.warning("Error processing draw item %d: %s", index, e)
+        i = end
+    return canvas
@@ -0,0 +1,44 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+# encoding name -> (file extension, media type)
+ENCODINGS = {
+    'png': ('.png', 'image/png'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'jpg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+    # Uncompressed, cheapest to produce; meant for local Electron use
+    'bmp': ('.bmp', 'image/bmp'),
+}
+
+
+def _encode_params(encoding: str, quality: Optional[int]) -> list:
+    """OpenCV imencode parameters for the requested quality"""
+    if quality is None:
+        return []
+    if encoding == 'png':
+        # For PNG "quality" is the zlib compression level: 0 (fastest) to 9 (smallest)
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(min(max(quality, 0), 9))]
+    if encoding in ('jpeg', 'jpg'):
+        return [cv2.IMWRITE_JPEG_QUALITY, int(min(max(quality, 0), 100))]
+    if encoding == 'webp':
+        # Above 100 selects lossless WebP
+        return [cv2.IMWRITE_WEBP_QUALITY, int(min(max(quality, 1), 101))]
+    return []
+
+
+def encode_image(image: np.ndarray, encoding: str = 'png', quality: Optional[int] = None) -> Tuple[bytes, str]:
+    """
+    Encode ``image`` and return the raw bytes with their media type.
+    Raises ValueError for unknown encodings.
+    """
+    encoding = (encoding or 'png').lower()
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unsupported encoding '{encoding}', expected one of {', '.join(sorted(ENCODINGS))}")
+    ext, media_type = ENCODINGS[encoding]
+    ok, buffer = cv2.imencode(ext, image, _encode_params(encoding, quality))
+    if not ok:
+        raise ValueError(f"Failed to encode image as {encoding}")
+    return buffer.tobytes(), media_type
@@ -0,0 +1,136 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+
+def _default_sizeof(value: Any) -> int:
+    """Best-effort byte size of a cached value"""
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    return 0
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by total byte size, entry count and TTL.
+
+    Entries that have not been touched for ``ttl`` seconds are evicted lazily
+    on access. Values larger than ``max_bytes`` are never stored.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        sizeof: Callable[[Any], int] = _default_sizeof,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, _ = entry
+            self._entries[key] = (value, size, time.monotonic())
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size, time.monotonic())
+            self.current_bytes += size
+            self._expire()
+            while self._entries and (
+                self.current_bytes > self.max_bytes
+                or (self.max_entries is not None and len(self._entries) > self.max_entries)
+            ):
+                self._evict_oldest()
+            return True
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            self._expire()
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _evict_oldest(self):
+        _, (_, size, _) = self._entries.popitem(last=False)
+        self.current_bytes -= size
+        self.evictions += 1
+
+    def _expire(self):
+        """Drop entries idle for longer than the TTL (oldest are first)"""
+        if self.ttl is None:
+            return
+        deadline = time.monotonic() - self.ttl
+        while self._entries:
+            _, (_, _, last_used) = next(iter(self._entries.items()))
+            if last_used >= deadline:
+                break
+            self._evict_oldest()
+
+
+class ImageCache(LRUCache):
+    """Cache of decoded images keyed by the content hash of their encoded bytes"""
+
+    @staticmethod
+    def digest(image_bytes: bytes) -> str:
+        """Content hash used as the public image handle"""
+        return hashlib.sha256(image_bytes).hexdigest()
+
+    def put(self, key: Hashable, value: np.ndarray) -> bool:
+        # Cached arrays are shared between requests, so guard them against in-place edits
+        value.flags.writeable = False
+        return super().put(key, value)
@@ -1,372 +1,742 @@
 import cv2
 import numpy as np
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, NamedTuple, List, Union
+import functools
+import hashlib
+import logging
 import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models.control_models import ControlState
+from services.control_plan import (
+    AdaptiveParams, BitwiseParams, ColorBoostParams, ColorParams, ControlPlan, DrawOp, EdgesParams,
+    FilterParams, FinalParams, MorphologyParams, TransformParams, as_plan,
+)
+from services.blur import apply_blur
+from services.draw import draw_ops
+from services.image_cache import LRUCache
+from services.kernels import morph_ellipse, sharpen_kernel
+from services.tiling import Band, band_grid, band_rows, expand_band
+
+logger = logging.getLogger(__name__)
+
+
+Controls = Union[ControlPlan, ControlState, Dict[str, Any]]
+
+
+class PipelineStage(NamedTuple):
+    """One step of the processing pipeline; ``name`` is also its field in ``ControlPlan``"""
+    name: str
+    method: str
+    in_place: bool = False  # stage draws into its input instead of returning a new array
+    needs_original: bool = False  # stage also receives the unprocessed source image
+
+
+PIPELINE_STAGES: Tuple[PipelineStage, ...] = (
+    PipelineStage('color', '_apply_color_operations'),
+    PipelineStage('transform', '_apply_transform_operations'),
+    PipelineStage('filter', '_apply_filter_operations'),
+    PipelineStage('edges', '_apply_edge_operations'),
+    PipelineStage('bitwise', '_apply_bitwise_operations'),
+    PipelineStage('adaptive_threshold', '_apply_adaptive_threshold'),
+    PipelineStage('morphology', '_apply_morphology_operations'),
+    PipelineStage('color_boost', '_apply_color_boost'),
+    PipelineStage('draw', '_apply_draw_operations', in_place=True),
+    PipelineStage('final', '_apply_final_operations', needs_original=True),
+)
+
+
+class PlanStep(NamedTuple):
+    """Stages ``first:last`` of the pipeline, run as one lookup table when ``lut`` is set"""
+    first: int
+    last: int
+    name: str
+    lut: Optional[np.ndarray] = None
+
+
+class _StageResult(NamedTuple):
+    image: np.ndarray
+    nbytes: int  # 0 when the stage passed its input through unchanged
+
+
+def stage_key(input_key: str, stage: PipelineStage, plan: ControlPlan) -> str:
+    """Cache key for a stage output: input fingerprint plus the stage's own parameters"""
+    params = repr(getattr(plan, stage.name))
+    h = hashlib.blake2b(digest_size=16)
+    h.update(input_key.encode())
+    h.update(stage.name.encode())
+    h.update(params.encode())
+    return h.hexdigest()
+
+
+def create_stage_cache(max_bytes: int, ttl: Optional[float] = None) -> LRUCache:
+    """LRU cache for stage outputs, sized by the pixels each entry actually owns"""
+    return LRUCache(max_bytes=max_bytes, ttl=ttl, sizeof=lambda result: result.nbytes)
+
+
+@functools.lru_cache(maxsize=256)
+def _color_boost_luts(saturation: float, hue_shift: float, gains_bgr: Tuple[float, float, float],
+                      contrast: float, brightness: float) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Build the 256-entry lookup tables for the color boost stage.
+
+    The tables reproduce the original float arithmetic value by value (float32
+    saturation/hue math with truncation, float64 gains with truncation, then
+    convertScaleAbs rounding), so the result is identical to applying each step
+    to the whole image. Either table is None when its part is at identity.
+    """
+    hsv_lut = None
+    if saturation != 0 or hue_shift != 0:
+        values = np.arange(256, dtype=np.float32)
+        hue = values if hue_shift == 0 else (values + np.float32(hue_shift)) % 180
+        sat = values if saturation == 0 else np.clip(values * np.float32(1 + saturation), 0, 255)
+        hsv_lut = np.dstack([hue, sat, values]).astype(np.uint8).reshape(256, 1, 3)
+
+    bgr_lut = None
+    if gains_bgr != (1.0, 1.0, 1.0) or contrast != 0 or brightness != 0:
+        values = np.arange(256, dtype=np.float64)
+        channels = [np.clip(values * gain, 0, 255).astype(np.uint8) for gain in gains_bgr]
+        bgr_lut = np.dstack(channels).reshape(256, 1, 3)
+        if contrast != 0 or brightness != 0:
+            bgr_lut = cv2.convertScaleAbs(bgr_lut, alpha=1+contrast, beta=brightness)
+    return hsv_lut, bgr_lut
+
+
+_IDENTITY_LUT = np.arange(256, dtype=np.uint8).reshape(256, 1, 1).repeat(3, axis=2)
+_INVERT_LUT = 255 - _IDENTITY_LUT
+_MORPHOLOGY_OPERATIONS = ('erode', 'dilate', 'erode_dilate', 'dilate_erode', 'open', 'close',
+                          'gradient', 'tophat', 'blackhat')
+
+
+@functools.lru_cache(maxsize=64)
+def _brightness_lut(brightness: float) -> np.ndarray:
+    """Table equivalent to convertScaleAbs(image, beta=brightness)"""
+    if brightness == 0:
+        return _IDENTITY_LUT
+    return cv2.convertScaleAbs(_IDENTITY_LUT, beta=brightness)
+
+
+def _compose_luts(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """Table that applies ``first`` then ``second``"""
+    if first is _IDENTITY_LUT:
+        return second
+    if second is _IDENTITY_LUT:
+        return first
+    return np.take_along_axis(second, first.astype(np.intp), axis=0)
+
+
+def _is_bgr(image: np.ndarray) -> bool:
+    return image.dtype == np.uint8 and image.ndim == 3 and image.shape[2] == 3
+
+
+def crop_window(params: TransformParams, img_w: int, img_h: int) -> Optional[Tuple[int, int, int, int]]:
+    """Crop rectangle (x, y, w, h) in pixels for an image of the given size, or None"""
+    if params.crop is None:
+        return None
+    crop_x, crop_y, crop_w, crop_h = params.crop
+
+    # Convert percentage to pixel coordinates
+    x = int((crop_x / 100) * img_w)
+    y = int((crop_y / 100) * img_h)
+    w = int((crop_w / 100) * img_w)
+    h = int((crop_h / 100) * img_h)
+
+    # Ensure crop coordinates are within image bounds
+    x = max(0, min(x, img_w - 1))
+    y = max(0, min(y, img_h - 1))
+    w = min(w, img_w - x)
+    h = min(h, img_h - y)
+
+    if w > 0 and h > 0 and x < img_w and y < img_h:
+        return x, y, w, h
+    return None
+
+
+def _add_timing(timings: Optional[Dict[str, float]], name: str, seconds: float):
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
 
 class ImageProcessor:
-    def __init__(self):
-        self.original_image = None
-        self.processed_image = None
+    """
+    Stateless image pipeline: every call works on its own arrays, so one instance
+    can be shared by concurrent requests. Only the optional stage cache, the
+    reuse counters and the tile pool are shared, and all are guarded by locks.
+
+    Images of at least ``tile_min_pixels`` pixels are processed in bands of about
+    ``tile_pixels`` pixels (see ``run_tiled``) when ``tile_pixels`` is set.
+    """
+
+    def __init__(self, stage_cache: Optional[LRUCache] = None, tile_pixels: int = 0,
+                 tile_min_pixels: int = 0, tile_workers: int = 1):
+        self.stage_cache = stage_cache
+        self.stage_stats = {"hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+        self.tile_pixels = tile_pixels
+        self.tile_min_pixels = tile_min_pixels
+        self.tile_workers = tile_workers
+        self._tile_executor: Optional[ThreadPoolExecutor] = None
+        self._tile_lock = threading.Lock()
+    
+    def shutdown(self):
+        with self._tile_lock:
+            if self._tile_executor is not None:
+                self._tile_executor.shutdown(wait=False, cancel_futures=True)
+                self._tile_executor = None
     
-    def process_image(self, image: np.ndarray, controls: Dict[str, Any]) -> np.ndarray:
+    def process_image(self, image: np.ndarray, controls: Controls,
+                      image_key: Optional[str] = None,
+                      timings: Optional[Dict[str, float]] = None) -> np.ndarray:
         """
-        Main image processing function that applies all controls
+        Main image processing function that applies all controls.
+
+        ``controls`` is a ``ControlPlan`` from ``compile_plan``, or a ``ControlState``
+        or raw controls dict that is compiled first. Compile once and pass the plan
+        when the same controls are applied to many images.
+
+        When ``image_key`` (a fingerprint of ``image``) is given and a stage cache
+        is configured, each stage output is memoized so that only the stages
+        whose parameters changed, and the ones after them, are re-run. Images
+        large enough to be tiled are never memoized.
+        ``image`` itself is never modified.
+
+        Only the operations returned by ``plan`` run, so stages at identity
+        settings cost nothing. When ``timings`` is given, the seconds spent in
+        each executed stage are added to it under the stage name; stages fused
+        into one lookup table are reported together as ``name+name``.
         """
-        self.original_image = image.copy()
-        self.processed_image = image.copy()
-        
-        # Apply transformations in order
-        self._apply_color_operations(controls)
-        self._apply_transform_operations(controls)
-        self._apply_filter_operations(controls)
-        self._apply_edge_operations(controls)
-        self._apply_bitwise_operations(controls)
-        self._apply_adaptive_threshold(controls)
-        self._apply_morphology_operations(controls)
-        self._apply_color_boost(controls)
-        self._apply_draw_operations(controls)
-        self._apply_final_operations(controls)
-        
-        return self.processed_image
+        return self.run(image, controls, image_key, timings)[0]
+
+    def run(self, image: np.ndarray, controls: Controls, image_key: Optional[str] = None,
+            timings: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Like ``process_image`` but also returns how many stages were reused from cache"""
+        plan = as_plan(controls)
+        if self.tile_pixels > 0 and image.shape[0] * image.shape[1] >= self.tile_min_pixels:
+            result = self.run_tiled(image, plan, timings=timings)
+            return result, {"reused_stages": 0, "executed_stages": len(PIPELINE_STAGES)}
+
+        memoize = image_key is not None and self.stage_cache is not None
+        keys: List[str] = []
+        start = 0
+        current = image
+        if memoize:
+            input_key = image_key
+            for stage in PIPELINE_STAGES:
+                input_key = stage_key(input_key, stage, plan)
+                keys.append(input_key)
+
+            # Resume after the deepest stage whose output is still cached
+            for i in range(len(PIPELINE_STAGES) - 1, -1, -1):
+                cached = self.stage_cache.get(keys[i])
+                if cached is not None:
+                    start = i + 1
+                    current = cached.image
+                    break
+
+        def remember(index: int, before: np.ndarray, after: np.ndarray):
+            if memoize:
+                shared = after is before or np.may_share_memory(after, before)
+                after.flags.writeable = False
+                self.stage_cache.put(keys[index], _StageResult(after, 0 if shared else after.nbytes))
+
+        current = self._run_stages(current, plan, image, start, len(PIPELINE_STAGES), remember, timings)
+        if memoize and current is not image and keys[-1] not in self.stage_cache:
+            # Trailing identity stages were skipped; record the result under the final key too
+            remember(len(PIPELINE_STAGES) - 1, current, current)
+
+        run_info = {"reused_stages": start, "executed_stages": len(PIPELINE_STAGES) - start}
+        if memoize:
+            with self._stats_lock:
+                self.stage_stats["hits"] += start
+                self.stage_stats["misses"] += len(PIPELINE_STAGES) - start
+        return current, run_info
+    
+    def plan(self, controls: Controls, first: int = 0,
+             end: Optional[int] = None) -> List[PlanStep]:
+        """
+        Resolve ``controls`` into the operations that actually change pixels for
+        ``PIPELINE_STAGES[first:end]``. Stages left at identity settings are dropped,
+        and each run of consecutive point operations becomes one lookup table.
+        """
+        plan = as_plan(controls)
+        end = len(PIPELINE_STAGES) if end is None else end
+        steps: List[PlanStep] = []
+        i = first
+        while i < end:
+            lut = self._point_lut(PIPELINE_STAGES[i], plan)
+            if lut is None:
+                steps.append(PlanStep(i, i + 1, PIPELINE_STAGES[i].name))
+                i += 1
+                continue
+            names = [] if lut is _IDENTITY_LUT else [PIPELINE_STAGES[i].name]
+            last = i + 1
+            while last < end:
+                next_lut = self._point_lut(PIPELINE_STAGES[last], plan)
+                if next_lut is None:
+                    break
+                if next_lut is not _IDENTITY_LUT:
+                    names.append(PIPELINE_STAGES[last].name)
+                lut = _compose_luts(lut, next_lut)
+                last += 1
+            if lut is not _IDENTITY_LUT:
+                steps.append(PlanStep(i, last, "+".join(names), lut))
+            i = last
+        return steps
+    
+    def _run_stages(self, current: np.ndarray, plan: ControlPlan, image: np.ndarray,
+                    first: int, end: int, remember=None,
+                    timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Run the planned operations for ``PIPELINE_STAGES[first:end]`` on ``current``.
+        ``image`` is the unprocessed source; ``remember(index, before, after)`` is
+        called with the output of each step under the index of its last stage.
+        """
+        for step in self.plan(plan, first, end):
+            before = current
+            started = time.perf_counter()
+            if step.lut is not None and _is_bgr(current):
+                current = cv2.LUT(current, step.lut)
+            else:
+                for stage in PIPELINE_STAGES[step.first:step.last]:
+                    # In-place stages must never write into the caller's image or a cached array
+                    if stage.in_place and (not current.flags.writeable or np.may_share_memory(current, image)):
+                        current = current.copy()
+                    method = getattr(self, stage.method)
+                    params = getattr(plan, stage.name)
+                    current = method(current, params, image) if stage.needs_original else method(current, params)
+            _add_timing(timings, step.name, time.perf_counter() - started)
+            if remember is not None:
+                remember(step.last - 1, before, current)
+        return current
+    
+    def run_tiled(self, image: np.ndarray, controls: Controls, tile_pixels: Optional[int] = None,
+                  timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Process ``image`` in overlapping tiles with output identical to ``process_image``.
+
+        Consecutive stages that only look at a bounded neighbourhood form a segment.
+        Each tile of a segment is cut from the segment input with a halo equal to
+        the sum of the stages' kernel radii, run through those stages, and its core
+        is written into the segment output, so intermediates never exceed one tile
+        (per tile worker). Stages that need the whole frame (geometry, Canny
+        hysteresis, drawing, blending) run on the full image between segments.
+
+        Tiles are full-width bands: some OpenCV conversions (HSV to BGR) round
+        differently in their vectorised and scalar tails, so a pixel must keep
+        its column offset for the result to be bit-exact.
+        """
+        plan = as_plan(controls)
+        tile_pixels = tile_pixels or self.tile_pixels
+        current = image
+        i = 0
+        while i < len(PIPELINE_STAGES):
+            if self._stage_halo(PIPELINE_STAGES[i], plan) is None:
+                current = self._run_stages(current, plan, image, i, i + 1, timings=timings)
+                i += 1
+                continue
+            end = i + 1
+            while end < len(PIPELINE_STAGES) and self._stage_halo(PIPELINE_STAGES[end], plan) is not None:
+                end += 1
+            current = self._run_segment_tiled(current, plan, i, end, tile_pixels, timings)
+            i = end
+        return current
+    
+    def _run_segment_tiled(self, source: np.ndarray, plan: ControlPlan, first: int, end: int,
+                           tile_pixels: int, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Run the neighbourhood-bounded stages ``first:end`` over bands of ``source``"""
+        stages = PIPELINE_STAGES[first:end]
+        if not self.plan(plan, first, end):
+            return source
+        height = source.shape[0]
+        bands = list(band_grid(height, band_rows(source.shape[1], tile_pixels)))
+        if len(bands) == 1:
+            return self._run_stages(source, plan, source, first, end, timings=timings)
+        halos = [self._stage_halo(stage, plan) for stage in stages]
+
+        # Sobel normalises by the global maximum, so reduce it over all bands first
+        edges_index = None
+        sobel_max = None
+        for offset, stage in enumerate(stages):
+            if stage.name == 'edges' and plan.edges.method == 'Sobel':
+                edges_index = first + offset
+                reduce_halo = sum(halos[:offset + 1])
+                started = time.perf_counter()
+                sobel_max = max(self._map_tiles(
+                    lambda band: self._band_sobel_max(source, plan, first, edges_index, band, reduce_halo),
+                    bands))
+                _add_timing(timings, "sobel_max", time.perf_counter() - started)
+
+        halo = sum(halos)
+
+        def process(band: Band) -> np.ndarray:
+            y0, y1 = band
+            ty0, ty1 = expand_band(band, halo, height)
+            tile = source[ty0:ty1]
+            band_timings = {} if timings is not None else None
+            if edges_index is None:
+                tile = self._run_stages(tile, plan, source, first, end, timings=band_timings)
+            else:
+                tile = self._run_stages(tile, plan, source, first, edges_index, timings=band_timings)
+                started = time.perf_counter()
+                tile = self._apply_edge_operations(tile, plan.edges, sobel_max=sobel_max)
+                _add_timing(band_timings, 'edges', time.perf_counter() - started)
+                tile = self._run_stages(tile, plan, source, edges_index + 1, end, timings=band_timings)
+            if band_timings:
+                # Bands may run on several tile workers; stage times add up across them
+                with self._stats_lock:
+                    for name, seconds in band_timings.items():
+                        _add_timing(timings, name, seconds)
+            return tile[y0 - ty0:y1 - ty0]
+
+        # The first band tells us the output channels and dtype
+        head = process(bands[0])
+        output = np.empty(source.shape[:2] + head.shape[2:], dtype=head.dtype)
+        output[:head.shape[0]] = head
+        del head
+
+        def store(band: Band):
+            output[band[0]:band[1]] = process(band)
+
+        self._map_tiles(store, bands[1:])
+        return output
+    
+    def _band_sobel_max(self, source: np.ndarray, plan: ControlPlan, first: int, edges_index: int,
+                        band: Band, halo: int) -> float:
+        """Sobel magnitude maximum over the core rows of one band"""
+        y0, y1 = band
+        ty0, ty1 = expand_band(band, halo, source.shape[0])
+        tile = self._run_stages(source[ty0:ty1], plan, source, first, edges_index)
+        magnitude = self._sobel_magnitude(tile, plan.edges.sobel_ksize)
+        return magnitude[y0 - ty0:y1 - ty0].max()
+    
+    def _map_tiles(self, fn, tiles: List[Band]) -> List[Any]:
+        """Apply ``fn`` to every tile, on the tile pool when more than one tile worker is configured"""
+        if self.tile_workers <= 1 or len(tiles) <= 1:
+            return [fn(region) for region in tiles]
+        with self._tile_lock:
+            if self._tile_executor is None:
+                self._tile_executor = ThreadPoolExecutor(max_workers=self.tile_workers,
+                                                         thread_name_prefix="visionforge-tile")
+            executor = self._tile_executor
+        return list(executor.map(fn, tiles))
+    
+    def _stage_halo(self, stage: PipelineStage, plan: ControlPlan) -> Optional[int]:
+        """
+        How far, in pixels, a stage looks around each output pixel for this
+        plan, or None when it cannot be computed tile by tile.
+        """
+        name = stage.name
+        if name in ('color', 'bitwise', 'color_boost'):
+            return 0
+        if name == 'transform':
+            return 0 if self._point_lut(stage, plan) is _IDENTITY_LUT else None
+        if name == 'filter':
+            if plan.filter.fast:
+                # Approximations resample the whole frame
+                return None
+            halo = 0
+            if plan.filter.blur is not None:
+                halo += plan.filter.ksize // 2
+            if plan.filter.sharpen > 0:
+                halo += 1
+            return halo
+        if name == 'edges':
+            method = plan.edges.method
+            if method == 'Canny':
+                # Hysteresis follows edges across the whole image
+                return None
+            if method == 'Sobel':
+                return max(1, plan.edges.sobel_ksize // 2)
+            return 0
+        if name == 'adaptive_threshold':
+            adaptive = plan.adaptive_threshold
+            return adaptive.block_size // 2 if adaptive.method is not None else 0
+        if name == 'morphology':
+            morphology = plan.morphology
+            if morphology.operation is None:
+                return 0
+            passes = 1 if morphology.operation in ('erode', 'dilate', 'gradient') else 2
+            return passes * morphology.iterations * (morphology.kernel_size // 2)
+        if name in ('draw', 'final'):
+            return 0 if self._point_lut(stage, plan) is not None else None
+        return None
+    
+    def _point_lut(self, stage: PipelineStage, plan: ControlPlan) -> Optional[np.ndarray]:
+        """
+        Express a stage as a per-channel 256-entry lookup table when, for this
+        plan, it is a pure point operation. Returns ``_IDENTITY_LUT`` for
+        stages that would leave the image unchanged and None when the stage
+        depends on neighbouring pixels, other channels or geometry.
+        """
+        name = stage.name
+        if name == 'color':
+            # Grayscale blending mixes channels, so only the no-op case qualifies
+            if plan.color.grayscale > 0 or plan.color.color_space != 'RGB':
+                return None
+            return _IDENTITY_LUT
+        if name == 'transform':
+            transform = plan.transform
+            if (transform.rotate != 0 or transform.translate_x != 0 or transform.translate_y != 0
+                    or transform.scale != 1.0 or transform.crop is not None):
+                return None
+            return _IDENTITY_LUT
+        if name == 'filter':
+            if plan.filter.blur is not None or plan.filter.sharpen > 0:
+                return None
+            return _IDENTITY_LUT
+        if name == 'edges':
+            return None if plan.edges.method is not None else _IDENTITY_LUT
+        if name == 'bitwise':
+            operation = plan.bitwise.operation
+            if operation == 'NOT':
+                return _INVERT_LUT
+            return None if operation is not None else _IDENTITY_LUT
+        if name == 'adaptive_threshold':
+            return None if plan.adaptive_threshold.method is not None else _IDENTITY_LUT
+        if name == 'morphology':
+            return None if plan.morphology.operation is not None else _IDENTITY_LUT
+        if name == 'color_boost':
+            hsv_lut, bgr_lut = _color_boost_luts(*plan.color_boost)
+            if hsv_lut is not None:
+                return None
+            return bgr_lut if bgr_lut is not None else _IDENTITY_LUT
+        if name == 'draw':
+            return None if plan.draw else _IDENTITY_LUT
+        if name == 'final':
+            if plan.final.blend_alpha > 0:
+                return None
+            return _brightness_lut(plan.final.brightness)
+        return None
     
-    def _apply_color_operations(self, controls: Dict[str, Any]):
+    def _apply_color_operations(self, image: np.ndarray, params: ColorParams) -> np.ndarray:
         """Apply color space and grayscale operations"""
-        if controls.get('grayscaleAmount', 0) > 0:
-            gray = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2GRAY)
+        if params.grayscale > 0:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             gray = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-            alpha = controls['grayscaleAmount']
-            self.processed_image = cv2.addWeighted(self.processed_image, 1-alpha, gray, alpha, 0)
+            alpha = params.grayscale
+            # Full grayscale is the gray image itself, no blend needed
+            image = gray if alpha == 1 else cv2.addWeighted(image, 1-alpha, gray, alpha, 0)
         
         # Color space conversion
-        color_space = controls.get('colorSpace', 'RGB')
+        color_space = params.color_space
         if color_space != 'RGB':
             if color_space == 'HSV':
-                self.processed_image = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2HSV)
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
             elif color_space == 'LAB':
-                self.processed_image = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2LAB)
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
             elif color_space == 'YCrCb':
-                self.processed_image = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2YCrCb)
-    
-    def _apply_transform_operations(self, controls: Dict[str, Any]):
-        """Apply rotation, translation, scaling, and cropping"""
-        h, w = self.processed_image.shape[:2]
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb)
         
-        # Rotation
-        if controls.get('rotate', 0) != 0:
-            angle = controls['rotate']
-            center = (w // 2, h // 2)
-            M = cv2.getRotationMatrix2D(center, angle, 1.0)
-            self.processed_image = cv2.warpAffine(self.processed_image, M, (w, h))
+        return image
+    
+    def _apply_transform_operations(self, image: np.ndarray, params: TransformParams) -> np.ndarray:
+        """
+        Apply rotation, translation, scaling, and cropping.
+
+        Rotation, translation and scaling are composed into one affine matrix and
+        the crop is folded into the output window, so the frame is resampled once
+        and only the cropped pixels are computed. Pure scaling still goes through
+        cv2.resize, as does area-interpolated downscaling, which warpAffine cannot do.
+        """
+        h, w = image.shape[:2]
+        angle = params.rotate
+        tx = params.translate_x
+        ty = params.translate_y
+        scale = params.scale
+        interpolation = params.interpolation
         
-        # Translation
-        tx = controls.get('translateX', 0)
-        ty = controls.get('translateY', 0)
+        # Rotation about the image centre, then translation
+        M = np.array([[1, 0, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float64)
+        if angle != 0:
+            M = np.vstack([cv2.getRotationMatrix2D((w // 2, h // 2), angle, 1.0), [0, 0, 1]])
         if tx != 0 or ty != 0:
-            M = np.float32([[1, 0, tx], [0, 1, ty]])
-            self.processed_image = cv2.warpAffine(self.processed_image, M, (w, h))
+            M = np.array([[1, 0, tx], [0, 1, ty], [0, 0, 1]], dtype=np.float64) @ M
+        has_warp = angle != 0 or tx != 0 or ty != 0
         
         # Scaling
-        scale = controls.get('scale', 1.0)
+        out_w, out_h = w, h
+        resize_separately = False
         if scale != 1.0:
-            interpolation_method = controls.get('scaleInterpolation', 'linear')
-            interpolation = self._get_interpolation_method(interpolation_method)
-            new_w = int(w * scale)
-            new_h = int(h * scale)
-            print(f"Scaling with {interpolation_method} interpolation: {scale}x from {w}x{h} to {new_w}x{new_h}")
-            self.processed_image = cv2.resize(self.processed_image, (new_w, new_h), interpolation=interpolation)
+            out_w = int(w * scale)
+            out_h = int(h * scale)
+            resize_separately = not has_warp or (interpolation == cv2.INTER_AREA and scale < 1.0)
+            if not resize_separately:
+                # Same pixel-centre convention as cv2.resize
+                sx, sy = out_w / w, out_h / h
+                S = np.array([[sx, 0, 0.5 * (sx - 1)], [0, sy, 0.5 * (sy - 1)], [0, 0, 1]], dtype=np.float64)
+                M = S @ M
+        
+        if has_warp:
+            warp_w, warp_h = (w, h) if resize_separately else (out_w, out_h)
+            window = None if resize_separately else crop_window(params, warp_w, warp_h)
+            if window is not None:
+                x, y, warp_w, warp_h = window
+                M = np.array([[1, 0, -x], [0, 1, -y], [0, 0, 1]], dtype=np.float64) @ M
+            # Scaling uses the requested interpolation; rotate/translate alone stay bilinear
+            flags = interpolation if scale != 1.0 and not resize_separately else cv2.INTER_LINEAR
+            image = cv2.warpAffine(image, M[:2], (warp_w, warp_h), flags=flags)
+            if window is not None:
+                return image
+        
+        if resize_separately:
+            image = cv2.resize(image, (out_w, out_h), interpolation=interpolation)
         
         # Cropping
-        crop = controls.get('crop', {})
-        is_crop_active = controls.get('isCropActive', False)
-        if crop and isinstance(crop, dict) and is_crop_active:
-            crop_w = crop.get('w', 0)
-            crop_h = crop.get('h', 0)
-            crop_x = crop.get('x', 0)
-            crop_y = crop.get('y', 0)
-            
-            # Only apply crop if we have valid dimensions
-            if crop_w > 0 and crop_h > 0 and crop_x >= 0 and crop_y >= 0:
-                img_h, img_w = self.processed_image.shape[:2]
-                
-                # Convert percentage to pixel coordinates
-                x = int((crop_x / 100) * img_w)
-                y = int((crop_y / 100) * img_h)
-                w = int((crop_w / 100) * img_w)
-                h = int((crop_h / 100) * img_h)
-                
-                # Ensure crop coordinates are within image bounds
-                x = max(0, min(x, img_w - 1))
-                y = max(0, min(y, img_h - 1))
-                w = min(w, img_w - x)
-                h = min(h, img_h - y)
-                
-                # Only crop if we have valid dimensions
-                if w > 0 and h > 0 and x < img_w and y < img_h:
-                    self.processed_image = self.processed_image[y:y+h, x:x+w]
+        window = crop_window(params, image.shape[1], image.shape[0])
+        if window is not None:
+            x, y, cw, ch = window
+            image = image[y:y+ch, x:x+cw]
+        
+        return image
     
-    def _apply_filter_operations(self, controls: Dict[str, Any]):
+    def _apply_filter_operations(self, image: np.ndarray, params: FilterParams) -> np.ndarray:
         """Apply blur and sharpen filters"""
         # Blur
-        blur_data = controls.get('blur', {})
-        if blur_data.get('ksize', 3) > 3:
-            method = blur_data.get('method', 'gaussian')
-            ksize = blur_data.get('ksize', 3)
-            
-            if method == 'gaussian':
-                self.processed_image = cv2.GaussianBlur(self.processed_image, (ksize, ksize), 0)
-            elif method == 'median':
-                self.processed_image = cv2.medianBlur(self.processed_image, ksize)
-            elif method == 'bilateral':
-                self.processed_image = cv2.bilateralFilter(self.processed_image, ksize, 80, 80)
-            elif method == 'box':
-                self.processed_image = cv2.boxFilter(self.processed_image, -1, (ksize, ksize))
+        if params.blur is not None:
+            image = apply_blur(image, params.blur, params.ksize, params.fast)
         
         # Sharpen
-        sharpen_strength = controls.get('sharpenStrength', 0)
-        if sharpen_strength > 0:
-            kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]]) * sharpen_strength
-            kernel[1,1] = kernel[1,1] + 1
-            self.processed_image = cv2.filter2D(self.processed_image, -1, kernel)
+        if params.sharpen > 0:
+            image = cv2.filter2D(image, -1, sharpen_kernel(params.sharpen))
+        
+        return image
     
-    def _apply_edge_operations(self, controls: Dict[str, Any]):
-        """Apply edge detection operations"""
-        edges_data = controls.get('edges', {})
-        method = edges_data.get('method', 'None')
+    def _apply_edge_operations(self, image: np.ndarray, params: EdgesParams,
+                               sobel_max: Optional[float] = None) -> np.ndarray:
+        """
+        Apply edge detection operations. Sobel output is normalised by its maximum,
+        which tiled runs reduce over the whole image and pass in as ``sobel_max``.
+        """
+        if params.method == 'Canny':
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            edges = cv2.Canny(gray, params.canny_t1, params.canny_t2)
+            image = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
         
-        if method == 'Canny':
-            t1 = edges_data.get('canny_t1', 50)
-            t2 = edges_data.get('canny_t2', 100)
-            gray = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2GRAY)
-            edges = cv2.Canny(gray, t1, t2)
-            self.processed_image = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+        elif params.method == 'Sobel':
+            sobel = self._sobel_magnitude(image, params.sobel_ksize)
+            if sobel_max is None:
+                sobel_max = sobel.max()
+            sobel = np.uint8(sobel / sobel_max * 255)
+            image = cv2.cvtColor(sobel, cv2.COLOR_GRAY2BGR)
         
-        elif method == 'Sobel':
-            ksize = edges_data.get('sobel_ksize', 3)
-            gray = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2GRAY)
-            sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=ksize)
-            sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=ksize)
-            sobel = np.sqrt(sobelx**2 + sobely**2)
-            sobel = np.uint8(sobel / sobel.max() * 255)
-            self.processed_image = cv2.cvtColor(sobel, cv2.COLOR_GRAY2BGR)
+        return image
+    
+    def _sobel_magnitude(self, image: np.ndarray, ksize: int) -> np.ndarray:
+        """Gradient magnitude of the grayscale image"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        sobelx = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=ksize)
+        sobely = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=ksize)
+        return np.sqrt(sobelx**2 + sobely**2)
     
-    def _apply_bitwise_operations(self, controls: Dict[str, Any]):
+    def _apply_bitwise_operations(self, image: np.ndarray, params: BitwiseParams) -> np.ndarray:
         """Apply bitwise operations"""
-        bitwise_data = controls.get('bitwise', {})
-        operation = bitwise_data.get('operation', 'None')
+        operation = params.operation
         
-        if operation != 'None':
-            gray = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2GRAY)
-            threshold = bitwise_data.get('maskThreshold', 128)
-            _, mask = cv2.threshold(gray, threshold, 255, cv2.THRESH_BINARY)
+        if operation == 'NOT':
+            return cv2.bitwise_not(image)
+        if operation == 'XOR':
+            # An image XORed with itself is zero inside and outside the mask
+            return np.zeros_like(image)
+        
+        if operation in ('AND', 'OR'):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(gray, params.mask_threshold, 255, cv2.THRESH_BINARY)
             
-            if operation == 'NOT':
-                result = cv2.bitwise_not(self.processed_image)
-            elif operation == 'AND':
-                result = cv2.bitwise_and(self.processed_image, self.processed_image, mask=mask)
-            elif operation == 'OR':
-                result = cv2.bitwise_or(self.processed_image, self.processed_image, mask=mask)
-            elif operation == 'XOR':
-                result = cv2.bitwise_xor(self.processed_image, self.processed_image, mask=mask)
+            if operation == 'AND':
+                image = cv2.bitwise_and(image, image, mask=mask)
             else:
-                return
-            
-            self.processed_image = result
+                image = cv2.bitwise_or(image, image, mask=mask)
+        
+        return image
     
-    def _apply_adaptive_threshold(self, controls: Dict[str, Any]):
+    def _apply_adaptive_threshold(self, image: np.ndarray, params: AdaptiveParams) -> np.ndarray:
         """Apply adaptive thresholding"""
-        adaptive_data = controls.get('adaptiveThreshold', {})
-        mode = adaptive_data.get('mode', 'Simple')
+        if params.method is not None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            thresh = cv2.adaptiveThreshold(gray, 255, params.method, cv2.THRESH_BINARY,
+                                           params.block_size, params.c)
+            image = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
         
-        if mode == 'Adaptive':
-            gray = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2GRAY)
-            method = adaptive_data.get('method', 'mean')
-            block_size = adaptive_data.get('blockSize', 11)
-            c = adaptive_data.get('c', 2)
-            
-            if method == 'mean':
-                adaptive_method = cv2.ADAPTIVE_THRESH_MEAN_C
-            else:  # gaussian
-                adaptive_method = cv2.ADAPTIVE_THRESH_GAUSSIAN_C
-            
-            thresh = cv2.adaptiveThreshold(gray, 255, adaptive_method, cv2.THRESH_BINARY, block_size, c)
-            self.processed_image = cv2.cvtColor(thresh, cv2.COLOR_GRAY2BGR)
+        return image
     
-    def _apply_morphology_operations(self, controls: Dict[str, Any]):
-        """Apply morphological operations"""
-        morphology_data = controls.get('morphology', {})
-        kernel_size = morphology_data.get('kernelSize', 3)
-        iterations = morphology_data.get('iterations', 1)
-        operation = morphology_data.get('operation', 'erode_dilate')
+    def _apply_morphology_operations(self, image: np.ndarray, params: MorphologyParams) -> np.ndarray:
+        """
+        Apply morphological operations. Compound operations are spelled out as the
+        erosions and dilations ``cv2.morphologyEx`` performs, so that large kernels
+        can take the decomposed path in ``morph_ellipse``.
+        """
+        operation = params.operation
         
-        if kernel_size > 1 and iterations > 0:
-            # Ensure kernel size is odd
-            if kernel_size % 2 == 0:
-                kernel_size += 1
-            
-            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+        if operation is not None:
+            def erode(img: np.ndarray) -> np.ndarray:
+                return morph_ellipse(cv2.MORPH_ERODE, img, params.kernel_size, params.iterations)
+
+            def dilate(img: np.ndarray) -> np.ndarray:
+                return morph_ellipse(cv2.MORPH_DILATE, img, params.kernel_size, params.iterations)
             
             if operation == 'erode':
                 # Erosion: removes small bright spots
-                self.processed_image = cv2.erode(self.processed_image, kernel, iterations=iterations)
+                image = erode(image)
             elif operation == 'dilate':
                 # Dilation: fills small dark spots
-                self.processed_image = cv2.dilate(self.processed_image, kernel, iterations=iterations)
-            elif operation == 'erode_dilate':
-                # Erosion followed by dilation (opening)
-                self.processed_image = cv2.erode(self.processed_image, kernel, iterations=iterations)
-                self.processed_image = cv2.dilate(self.processed_image, kernel, iterations=iterations)
-            elif operation == 'dilate_erode':
-                # Dilation followed by erosion (closing)
-                self.processed_image = cv2.dilate(self.processed_image, kernel, iterations=iterations)
-                self.processed_image = cv2.erode(self.processed_image, kernel, iterations=iterations)
-            elif operation == 'open':
+                image = dilate(image)
+            elif operation in ('erode_dilate', 'open'):
                 # Opening: erosion followed by dilation
-                self.processed_image = cv2.morphologyEx(self.processed_image, cv2.MORPH_OPEN, kernel, iterations=iterations)
-            elif operation == 'close':
+                image = dilate(erode(image))
+            elif operation in ('dilate_erode', 'close'):
                 # Closing: dilation followed by erosion
-                self.processed_image = cv2.morphologyEx(self.processed_image, cv2.MORPH_CLOSE, kernel, iterations=iterations)
+                image = erode(dilate(image))
             elif operation == 'gradient':
                 # Morphological gradient
-                self.processed_image = cv2.morphologyEx(self.processed_image, cv2.MORPH_GRADIENT, kernel, iterations=iterations)
+                image = cv2.subtract(dilate(image), erode(image))
             elif operation == 'tophat':
-                # Top hat
-                self.processed_image = cv2.morphologyEx(self.processed_image, cv2.MORPH_TOPHAT, kernel, iterations=iterations)
+                # Top hat: image minus its opening
+                image = cv2.subtract(image, dilate(erode(image)))
             elif operation == 'blackhat':
-                # Black hat
-                self.processed_image = cv2.morphologyEx(self.processed_image, cv2.MORPH_BLACKHAT, kernel, iterations=iterations)
-            
-            print(f"Applied morphology: {operation}, kernel_size={kernel_size}, iterations={iterations}")
-    
-    def _apply_color_boost(self, controls: Dict[str, Any]):
-        """Apply color boost operations"""
-        color_boost = controls.get('colorBoost', {})
-        
-        # Convert to HSV for saturation and hue operations
-        hsv = cv2.cvtColor(self.processed_image, cv2.COLOR_BGR2HSV).astype(np.float32)
+                # Black hat: closing minus the image
+                image = cv2.subtract(erode(dilate(image)), image)
         
-        # Saturation
-        saturation = color_boost.get('saturation', 0)
-        if saturation != 0:
-            hsv[:, :, 1] = hsv[:, :, 1] * (1 + saturation)
-            hsv[:, :, 1] = np.clip(hsv[:, :, 1], 0, 255)
-        
-        # Hue shift
-        hue_shift = color_boost.get('hueShift', 0)
-        if hue_shift != 0:
-            hsv[:, :, 0] = (hsv[:, :, 0] + hue_shift) % 180
+        return image
+    
+    def _apply_color_boost(self, image: np.ndarray, params: ColorBoostParams) -> np.ndarray:
+        """
+        Apply color boost operations as at most two table lookups: one over HSV for
+        saturation and hue, one over BGR for channel gains, contrast and brightness.
+        Neutral settings skip the stage entirely.
+        """
+        hsv_lut, bgr_lut = _color_boost_luts(*params)
         
-        # Convert back to BGR
-        self.processed_image = cv2.cvtColor(hsv.astype(np.uint8), cv2.COLOR_HSV2BGR)
+        # Saturation and hue shift in a single pass over the HSV image
+        if hsv_lut is not None:
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            cv2.LUT(hsv, hsv_lut, dst=hsv)
+            image = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
         
-        # RGB channel gains
-        rgb_gains = color_boost.get('rgbGains', {})
-        if rgb_gains:
-            self.processed_image[:, :, 2] = np.clip(self.processed_image[:, :, 2] * rgb_gains.get('r', 1), 0, 255)
-            self.processed_image[:, :, 1] = np.clip(self.processed_image[:, :, 1] * rgb_gains.get('g', 1), 0, 255)
-            self.processed_image[:, :, 0] = np.clip(self.processed_image[:, :, 0] * rgb_gains.get('b', 1), 0, 255)
+        # RGB channel gains, contrast and brightness folded into one per-channel table
+        if bgr_lut is not None:
+            image = cv2.LUT(image, bgr_lut)
         
-        # Contrast and brightness
-        contrast = color_boost.get('contrast', 0)
-        brightness = color_boost.get('brightness', 0)
-        if contrast != 0 or brightness != 0:
-            self.processed_image = cv2.convertScaleAbs(self.processed_image, alpha=1+contrast, beta=brightness)
+        return image
     
-    def _apply_draw_operations(self, controls: Dict[str, Any]):
-        """Apply drawing operations"""
-        try:
-            draw_items = controls.get('drawItems', [])
-            print(f"Draw operations - Found {len(draw_items)} draw items")
-            
-            if not isinstance(draw_items, list):
-                print(f"Warning: drawItems is not a list, got {type(draw_items)}")
-                return
-            
-            for i, item in enumerate(draw_items):
-                try:
-                    print(f"Draw item {i}: {item}")
-                    
-                    if not isinstance(item, dict):
-                        print(f"Warning: Draw item {i} is not a dict, skipping")
-                        continue
-                    
-                    color = self._hex_to_bgr(item.get('color', '#FF0000'))
-                    thickness = int(item.get('thickness', 2))
-                    
-                    if item.get('type') == 'rect' and item.get('xywh'):
-                        x, y, w, h = item['xywh']
-                        if len(item['xywh']) == 4 and all(isinstance(x, (int, float)) for x in item['xywh']):
-                            cv2.rectangle(self.processed_image, (int(x), int(y)), (int(x+w), int(y+h)), color, thickness)
-                        else:
-                            print(f"Warning: Invalid xywh for rect: {item['xywh']}")
-                    
-                    elif item.get('type') == 'circle' and item.get('xyr'):
-                        x, y, r = item['xyr']
-                        if len(item['xyr']) == 3 and all(isinstance(x, (int, float)) for x in item['xyr']):
-                            cv2.circle(self.processed_image, (int(x), int(y)), int(r), color, thickness)
-                        else:
-                            print(f"Warning: Invalid xyr for circle: {item['xyr']}")
-                    
-                    elif item.get('type') == 'line' and item.get('xyxy'):
-                        x1, y1, x2, y2 = item['xyxy']
-                        if len(item['xyxy']) == 4 and all(isinstance(x, (int, float)) for x in item['xyxy']):
-                            cv2.line(self.processed_image, (int(x1), int(y1)), (int(x2), int(y2)), color, thickness)
-                        else:
-                            print(f"Warning: Invalid xyxy for line: {item['xyxy']}")
-                    
-                    elif item.get('type') == 'text' and item.get('text'):
-                        x, y = item.get('xy', [20, 20])
-                        scale = float(item.get('scale', 1.0))
-                        if len(item.get('xy', [])) == 2 and all(isinstance(x, (int, float)) for x in item.get('xy', [])):
-                            cv2.putText(self.processed_image, str(item['text']), (int(x), int(y)), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
-                        else:
-                            print(f"Warning: Invalid xy for text: {item.get('xy', [])}")
-                    else:
-                        print(f"Warning: Unknown or incomplete draw item type: {item.get('type')}")
-                        
-                except Exception as e:
-                    print(f"Error processing draw item {i}: {e}")
-                    continue
-                    
-        except Exception as e:
-            print(f"Error in _apply_draw_operations: {e}")
-            import traceback
-            traceback.print_exc()
+    def _apply_draw_operations(self, image: np.ndarray, params: Tuple[DrawOp, ...]) -> np.ndarray:
+        """Apply drawing operations; items were validated when the plan was compiled"""
+        return draw_ops(image, params)
     
-    def _apply_final_operations(self, controls: Dict[str, Any]):
+    def _apply_final_operations(self, image: np.ndarray, params: FinalParams,
+                                original: Optional[np.ndarray] = None) -> np.ndarray:
         """Apply final operations like brightness and blending"""
         # Brightness
-        brightness = controls.get('brightness', 0)
-        if brightness != 0:
-            self.processed_image = cv2.convertScaleAbs(self.processed_image, beta=brightness)
+        if params.brightness != 0:
+            image = cv2.convertScaleAbs(image, beta=params.brightness)
         
         # Blend with original
-        blend_alpha = controls.get('blendAlpha', 0)
-        if blend_alpha > 0 and self.original_image is not None:
+        blend_alpha = params.blend_alpha
+        if blend_alpha > 0 and original is not None:
             # Resize original to match processed if needed
-            if self.original_image.shape != self.processed_image.shape:
-                self.original_image = cv2.resize(self.original_image, 
-                                               (self.processed_image.shape[1], self.processed_image.shape[0]))
-            self.processed_image = cv2.addWeighted(self.processed_image, 1-blend_alpha, 
-                                                 self.original_image, blend_alpha, 0)
-    
-    def _get_interpolation_method(self, method: str) -> int:
-        """Get OpenCV interpolation method"""
-        methods = {
-            'nearest': cv2.INTER_NEAREST,
-            'linear': cv2.INTER_LINEAR,
-            'cubic': cv2.INTER_CUBIC,
-            'area': cv2.INTER_AREA,
-            'lanczos': cv2.INTER_LANCZOS4
-        }
-        return methods.get(method, cv2.INTER_LINEAR)
-    
-    def _hex_to_bgr(self, hex_color: str) -> Tuple[int, int, int]:
-        """Convert hex color to BGR tuple"""
-        hex_color = hex_color.lstrip('#')
-        r = int(hex_color[0:2], 16)
-        g = int(hex_color[2:4], 16)
-        b = int(hex_color[4:6], 16)
-        return (b, g, r)  # OpenCV uses BGR
-
-
-
+            if original.shape != image.shape:
+                original = cv2.resize(original, (image.shape[1], image.shape[0]))
+            image = cv2.addWeighted(image, 1-blend_alpha, original, blend_alpha, 0)
+        
+        return image
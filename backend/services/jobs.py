@@ -0,0 +1,571 @@
+import json
+import logging
+import os
+import queue
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from services.batch import BatchRunner
+from services.control_plan import compile_plan
+from services.encoding import ENCODINGS
+from services.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+# Job states. Queued and running jobs are picked up again when the backend restarts;
+# cancelled and failed jobs keep their unfinished items and can be resumed
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_CANCELLED = 'cancelled'
+JOB_FAILED = 'failed'
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+FINISHED_STATES = (JOB_COMPLETED, JOB_CANCELLED, JOB_FAILED)
+
+# Item states
+ITEM_PENDING = 'pending'
+ITEM_DONE = 'done'
+ITEM_FAILED = 'failed'
+
+# Per-item result fields kept with the item (the encoded output itself lives on disk)
+_RESULT_FIELDS = ('original_size', 'processed_size', 'timing_ms', 'elapsed_ms', 'result_cache', 'error')
+
+
+class JobStore(ABC):
+    """
+    Persistence backend for ``JobManager``. Jobs carry a ``seq`` counter that goes up
+    on every change; each item records the ``seq`` of its last change, so clients
+    can ask for only what changed since the last poll.
+    """
+
+    @abstractmethod
+    def create(self, job: Dict[str, Any], names: List[str]):
+        ...
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def jobs(self, states: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Jobs (without items), oldest first, optionally only those in ``states``"""
+
+    @abstractmethod
+    def items(self, job_id: str, since: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Items by index; with ``since``, only those changed after that ``seq``"""
+
+    @abstractmethod
+    def item(self, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set_state(self, job_id: str, state: str, error: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    def finish_item(self, job_id: str, index: int, state: str, output: Optional[str],
+                    media_type: Optional[str], result: Dict[str, Any]) -> int:
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str):
+        ...
+
+    def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """Keeps jobs for the life of the process only; nothing is resumed after a restart"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._items: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, job: Dict[str, Any], names: List[str]):
+        with self._lock:
+            self._jobs[job['id']] = {**job, 'seq': 0, 'error': None, 'updated': job['created']}
+            self._items[job['id']] = [
+                {'index': index, 'name': name, 'state': ITEM_PENDING, 'seq': 0,
+                 'output': None, 'media_type': None, 'result': {}}
+                for index, name in enumerate(names)
+            ]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            counts = _empty_counts()
+            for item in self._items[job_id]:
+                counts[item['state']] += 1
+            return {**job, 'counts': counts}
+
+    def jobs(self, states: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        states = set(states) if states is not None else None
+        with self._lock:
+            return [dict(job) for job in sorted(self._jobs.values(), key=lambda job: job['created'])
+                    if states is None or job['state'] in states]
+
+    def items(self, job_id: str, since: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(item) for item in self._items.get(job_id, []) if since is None or item['seq'] > since]
+
+    def item(self, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            items = self._items.get(job_id, [])
+            return dict(items[index]) if 0 <= index < len(items) else None
+
+    def set_state(self, job_id: str, state: str, error: Optional[str] = None) -> int:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(state=state, error=error, seq=job['seq'] + 1, updated=time.time())
+            return job['seq']
+
+    def finish_item(self, job_id: str, index: int, state: str, output: Optional[str],
+                    media_type: Optional[str], result: Dict[str, Any]) -> int:
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(seq=job['seq'] + 1, updated=time.time())
+            self._items[job_id][index].update(state=state, seq=job['seq'], output=output,
+                                              media_type=media_type, result=result)
+            return job['seq']
+
+    def delete(self, job_id: str):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._items.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Jobs and items in one SQLite file, so queued work, progress and output paths
+    survive a backend restart. One connection is shared and serialised by a lock;
+    every change is committed before it is reported.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            controls TEXT NOT NULL,
+            encoding TEXT NOT NULL,
+            quality INTEGER,
+            created REAL NOT NULL,
+            updated REAL NOT NULL,
+            seq INTEGER NOT NULL DEFAULT 0,
+            error TEXT
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+            idx INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            state TEXT NOT NULL,
+            seq INTEGER NOT NULL DEFAULT 0,
+            output TEXT,
+            media_type TEXT,
+            result TEXT NOT NULL DEFAULT '{}',
+            PRIMARY KEY (job_id, idx)
+        );
+        CREATE INDEX IF NOT EXISTS items_seq ON items (job_id, seq);
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(self._SCHEMA)
+
+    def create(self, job: Dict[str, Any], names: List[str]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, state, controls, encoding, quality, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job['id'], job['state'], job['controls'], job['encoding'], job['quality'],
+                 job['created'], job['created']))
+            self._conn.executemany(
+                "INSERT INTO items (job_id, idx, name, state) VALUES (?, ?, ?, ?)",
+                [(job['id'], index, name, ITEM_PENDING) for index, name in enumerate(names)])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            counts = self._conn.execute(
+                "SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state", (job_id,)).fetchall()
+        return {**dict(row), 'counts': {**_empty_counts(), **dict(counts)}}
+
+    def jobs(self, states: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created").fetchall()
+        states = set(states) if states is not None else None
+        return [dict(row) for row in rows if states is None or row['state'] in states]
+
+    def items(self, job_id: str, since: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM items WHERE job_id = ? AND seq > ? ORDER BY idx",
+                                      (job_id, -1 if since is None else since)).fetchall()
+        return [self._item(row) for row in rows]
+
+    def item(self, job_id: str, index: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM items WHERE job_id = ? AND idx = ?", (job_id, index)).fetchone()
+        return None if row is None else self._item(row)
+
+    @staticmethod
+    def _item(row: sqlite3.Row) -> Dict[str, Any]:
+        return {'index': row['idx'], 'name': row['name'], 'state': row['state'], 'seq': row['seq'],
+                'output': row['output'], 'media_type': row['media_type'], 'result': json.loads(row['result'])}
+
+    def set_state(self, job_id: str, state: str, error: Optional[str] = None) -> int:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET state = ?, error = ?, seq = seq + 1, updated = ? WHERE id = ?",
+                               (state, error, time.time(), job_id))
+            return self._conn.execute("SELECT seq FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+    def finish_item(self, job_id: str, index: int, state: str, output: Optional[str],
+                    media_type: Optional[str], result: Dict[str, Any]) -> int:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET seq = seq + 1, updated = ? WHERE id = ?", (time.time(), job_id))
+            seq = self._conn.execute("SELECT seq FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            self._conn.execute(
+                "UPDATE items SET state = ?, seq = ?, output = ?, media_type = ?, result = ? WHERE job_id = ? AND idx = ?",
+                (state, seq, output, media_type, json.dumps(result), job_id, index))
+            return seq
+
+    def delete(self, job_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _empty_counts() -> Dict[str, int]:
+    return {ITEM_PENDING: 0, ITEM_DONE: 0, ITEM_FAILED: 0}
+
+
+def create_job_store(kind: str, directory: str) -> JobStore:
+    """``sqlite`` (``jobs.sqlite3`` in ``directory``) or ``memory``"""
+    if kind == 'sqlite':
+        return SQLiteJobStore(os.path.join(directory, 'jobs.sqlite3'))
+    if kind == 'memory':
+        return MemoryJobStore()
+    raise ValueError("Job store must be 'sqlite' or 'memory'")
+
+
+class JobNotFound(KeyError):
+    pass
+
+
+class JobStateError(ValueError):
+    pass
+
+
+class JobManager:
+    """
+    Runs batch jobs in the background, one job at a time, each spread over the
+    ``BatchRunner`` pool.
+
+    Uploads are written to ``directory/<job_id>/inputs`` when the job is submitted
+    and each output to ``directory/<job_id>`` as soon as it is encoded, so a job
+    only needs its ID to be polled, cancelled, resumed or zipped. Inputs are
+    deleted once their item finishes. Jobs that were queued or running when the
+    process stopped are queued again by ``start``; finished jobs are removed
+    ``ttl`` seconds after their last change.
+    """
+
+    def __init__(self, store: JobStore, runner: BatchRunner, directory: str,
+                 cache: Optional[ResultCache] = None, ttl: Optional[float] = None,
+                 on_result: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.store = store
+        self.runner = runner
+        self.directory = directory
+        self.cache = cache
+        self.ttl = ttl
+        self.on_result = on_result
+        self._queue: queue.Queue = queue.Queue()
+        self._changed = threading.Condition()
+        self._lock = threading.Lock()
+        self._running: Optional[str] = None
+        self._cancel = threading.Event()
+        self._delete_after: set = set()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        self.purge()
+        for job in self.store.jobs(ACTIVE_STATES):
+            if job['state'] == JOB_RUNNING:
+                self.store.set_state(job['id'], JOB_QUEUED)
+            self._queue.put(job['id'])
+        self._thread = threading.Thread(target=self._dispatch, name="visionforge-jobs", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """
+        Stop after the current item; the running job stays ``running`` and resumes on
+        the next start. The store is only closed once the dispatch thread has exited,
+        since an item that is still running writes its progress to it
+        """
+        self._queue.put(None)
+        with self._lock:
+            self._stopping = True
+            if self._running is not None:
+                self._cancel.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            if self._thread.is_alive():
+                # A daemon thread: it ends with the process, and the connection with it
+                logger.warning("Job dispatcher still busy at shutdown; leaving the job store open")
+                return
+        self.store.close()
+
+    def submit(self, uploads: List[Tuple[str, BinaryIO]], controls: Dict[str, Any],
+               encoding: str = "png", quality: Optional[int] = None) -> str:
+        """
+        Copy ``(name, file)`` uploads to disk and queue a job for them. ``controls``
+        is the validated controls dict; it is stored as is and compiled when the job runs.
+        """
+        job_id = uuid.uuid4().hex
+        inputs = self._inputs_dir(job_id)
+        os.makedirs(inputs)
+        try:
+            for index, (_, upload) in enumerate(uploads):
+                with open(os.path.join(inputs, f"{index:06d}"), 'wb') as f:
+                    shutil.copyfileobj(upload, f, 1024 * 1024)
+            self.store.create({'id': job_id, 'state': JOB_QUEUED, 'controls': json.dumps(controls),
+                               'encoding': encoding, 'quality': quality, 'created': time.time()},
+                              [name for name, _ in uploads])
+        except BaseException:
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+            raise
+        self._queue.put(job_id)
+        return job_id
+
+    def get(self, job_id: str, since: Optional[int] = None) -> Dict[str, Any]:
+        """The job, its item counts and its items (only those changed after ``seq`` ``since`` if given)"""
+        job = self.store.get(job_id)
+        if job is None:
+            raise JobNotFound(job_id)
+        return self._describe(job, self.store.items(job_id, since))
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        return [self._describe(job) for job in self.store.jobs()]
+
+    def events(self, job_id: str, since: Optional[int] = None, timeout: float = 15.0) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the job state whenever it changes, with the items changed since the
+        previous update, until the job is no longer queued or running. An update
+        without changes is yielded every ``timeout`` seconds as a keep-alive.
+        """
+        while True:
+            job = self.get(job_id, since)
+            yield job
+            if job['state'] not in ACTIVE_STATES:
+                return
+            since = job['seq']
+            with self._changed:
+                self._changed.wait_for(lambda: self._seq(job_id) != since, timeout=timeout)
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """Stop a queued or running job; items that have not finished stay pending for ``resume``"""
+        job = self._require(job_id)
+        with self._lock:
+            if self._running == job_id:
+                self._cancel.set()
+                return self.get(job_id)
+            if job['state'] != JOB_QUEUED:
+                raise JobStateError(f"Job is {job['state']}")
+            self.store.set_state(job_id, JOB_CANCELLED)
+        self._notify()
+        return self.get(job_id)
+
+    def resume(self, job_id: str) -> Dict[str, Any]:
+        """Queue a cancelled or failed job again for its pending items"""
+        job = self._require(job_id)
+        with self._lock:
+            if job['state'] in ACTIVE_STATES:
+                raise JobStateError(f"Job is already {job['state']}")
+            if job['counts'][ITEM_PENDING] == 0:
+                raise JobStateError("Job has no pending items")
+            self.store.set_state(job_id, JOB_QUEUED)
+        self._queue.put(job_id)
+        self._notify()
+        return self.get(job_id)
+
+    def delete(self, job_id: str):
+        """Remove a job with its inputs and outputs; a running job is cancelled first"""
+        self._require(job_id)
+        with self._lock:
+            if self._running == job_id:
+                self._delete_after.add(job_id)
+                self._cancel.set()
+                return
+            self._remove(job_id)
+        self._notify()
+
+    def output(self, job_id: str, index: int) -> Optional[Tuple[str, str]]:
+        """``(path, media_type)`` of a finished item's output"""
+        item = self.store.item(job_id, index)
+        if item is None or item['state'] != ITEM_DONE or not item['output']:
+            return None
+        path = os.path.join(self._job_dir(job_id), item['output'])
+        return (path, item['media_type']) if os.path.exists(path) else None
+
+    def purge(self):
+        """Remove finished jobs whose last change is older than ``ttl``"""
+        if not self.ttl:
+            return
+        cutoff = time.time() - self.ttl
+        for job in self.store.jobs(FINISHED_STATES):
+            if job['updated'] < cutoff:
+                self._remove(job['id'])
+
+    def _describe(self, job: Dict[str, Any], items: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        counts = job.get('counts')
+        if counts is None:
+            counts = self.store.get(job['id'])['counts']
+        description = {
+            "job_id": job['id'],
+            "state": job['state'],
+            "seq": job['seq'],
+            "count": sum(counts.values()),
+            "completed": counts[ITEM_DONE],
+            "failed": counts[ITEM_FAILED],
+            "pending": counts[ITEM_PENDING],
+            "encoding": job['encoding'],
+            "created": job['created'],
+            "updated": job['updated'],
+        }
+        if job.get('error'):
+            description["error"] = job['error']
+        if items is not None:
+            description["items"] = [{
+                "index": item['index'],
+                "name": item['name'],
+                "state": item['state'],
+                # Unset until the item finishes
+                "success": None if item['state'] == ITEM_PENDING else item['state'] == ITEM_DONE,
+                **item['result'],
+            } for item in items]
+        return description
+
+    def _require(self, job_id: str) -> Dict[str, Any]:
+        job = self.store.get(job_id)
+        if job is None:
+            raise JobNotFound(job_id)
+        return job
+
+    def _seq(self, job_id: str) -> Optional[int]:
+        job = self.store.get(job_id)
+        return None if job is None else job['seq']
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    def _inputs_dir(self, job_id: str) -> str:
+        return os.path.join(self._job_dir(job_id), 'inputs')
+
+    def _remove(self, job_id: str):
+        self.store.delete(job_id)
+        shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def _dispatch(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self.store.get(job_id)
+            if job is None or job['state'] != JOB_QUEUED:
+                continue
+            with self._lock:
+                self._running = job_id
+                self._cancel.clear()
+            try:
+                self._execute(job)
+            except Exception as e:
+                logger.exception("Job %s failed", job_id)
+                self.store.set_state(job_id, JOB_FAILED, str(e))
+            finally:
+                with self._lock:
+                    self._running = None
+                    if job_id in self._delete_after:
+                        self._delete_after.discard(job_id)
+                        self._remove(job_id)
+                self._notify()
+                self.purge()
+
+    def _execute(self, job: Dict[str, Any]):
+        job_id = job['id']
+        self.store.set_state(job_id, JOB_RUNNING)
+        self._notify()
+        plan = compile_plan(json.loads(job['controls']))
+        encoding = job['encoding']
+        extension = ENCODINGS[encoding][0]
+        inputs = self._inputs_dir(job_id)
+        pending = [item for item in self.store.items(job_id) if item['state'] == ITEM_PENDING]
+
+        def read(index: int):
+            def read_bytes() -> bytes:
+                with open(os.path.join(inputs, f"{index:06d}"), 'rb') as f:
+                    return f.read()
+            return read_bytes
+
+        results = self.runner.run([(item['name'], read(item['index'])) for item in pending],
+                                  plan, encoding, job['quality'], cache=self.cache)
+        try:
+            for result in results:
+                index = pending[result["index"]]['index']
+                content = result.pop("content", None)
+                media_type = result.pop("media_type", None)
+                if self.on_result is not None:
+                    self.on_result(result)
+                output = None
+                if content is not None:
+                    output = f"{index:06d}{extension}"
+                    path = os.path.join(self._job_dir(job_id), output)
+                    with open(path + '.part', 'wb') as f:
+                        f.write(content)
+                    os.replace(path + '.part', path)
+                self.store.finish_item(job_id, index, ITEM_DONE if result["success"] else ITEM_FAILED,
+                                       output, media_type,
+                                       {field: result[field] for field in _RESULT_FIELDS if field in result})
+                try:
+                    os.remove(os.path.join(inputs, f"{index:06d}"))
+                except OSError:
+                    pass
+                self._notify()
+                if self._cancel.is_set():
+                    break
+        finally:
+            results.close()
+
+        if self._cancel.is_set():
+            with self._lock:
+                if self._stopping and job_id not in self._delete_after:
+                    # Left running, so the next start picks it up again
+                    return
+            self.store.set_state(job_id, JOB_CANCELLED)
+            return
+        shutil.rmtree(inputs, ignore_errors=True)
+        self.store.set_state(job_id, JOB_COMPLETED)
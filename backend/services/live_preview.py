@@ -0,0 +1,80 @@
+import asyncio
+import struct
+from typing import Any, Dict, Tuple
+
+# Binary preview frames start with the control version they render, as a big-endian uint32
+FRAME_HEADER = struct.Struct('>I')
+
+
+def merge_controls(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Return ``base`` updated with ``delta``: nested objects are merged key by key,
+    anything else (numbers, strings, lists such as ``drawItems``) is replaced.
+    Neither input is modified.
+    """
+    merged = dict(base)
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_controls(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def pack_frame(version: int, content: bytes) -> bytes:
+    return FRAME_HEADER.pack(version) + content
+
+
+class ControlMailbox:
+    """
+    Latest control state of one live-preview connection.
+
+    Every message is applied in order, so deltas always build on the full state,
+    but only the newest state is kept for rendering: versions that arrive while a
+    frame is being rendered replace each other and are never rendered themselves.
+    """
+
+    def __init__(self):
+        self.controls: Dict[str, Any] = {}
+        self.version = 0
+        self.superseded = 0
+        self._pending = False
+        self._event = asyncio.Event()
+
+    def post(self, message: Dict[str, Any]) -> int:
+        """
+        Apply ``{"version": n, "controls": {...}}`` (full state) or
+        ``{"version": n, "delta": {...}}``. Versions must increase.
+        """
+        version = message.get('version')
+        if not isinstance(version, int) or isinstance(version, bool) or not 0 < version <= 0xFFFFFFFF:
+            raise ValueError("version must be a positive 32-bit integer")
+        if version <= self.version:
+            raise ValueError(f"version {version} is not newer than {self.version}")
+        if isinstance(message.get('controls'), dict):
+            controls = message['controls']
+        elif isinstance(message.get('delta'), dict):
+            controls = merge_controls(self.controls, message['delta'])
+        else:
+            raise ValueError("message needs a 'controls' or 'delta' object")
+
+        if self._pending:
+            self.superseded += 1
+        self.controls = controls
+        self.version = version
+        self._pending = True
+        self._event.set()
+        return version
+
+    def retry(self):
+        """Ask for the current state to be rendered again, e.g. after the worker pool was busy"""
+        self._pending = True
+        self._event.set()
+
+    async def take(self) -> Tuple[int, Dict[str, Any]]:
+        """Wait for a state that has not been rendered yet and return ``(version, controls)``"""
+        while not self._pending:
+            self._event.clear()
+            await self._event.wait()
+        self._pending = False
+        return self.version, self.controls
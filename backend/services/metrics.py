@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTE_BUCKETS = (10e3, 100e3, 500e3, 1e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6)
+MEGAPIXEL_BUCKETS = (0.1, 0.5, 1, 2, 5, 12, 24, 50, 100, 200)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative histogram rendered in the Prometheus text exposition format"""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values -> (bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: (list(s[0]), s[1], s[2]) for key, s in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            labels = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key)]
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = ",".join(labels + [f'le="{_format_value(bound)}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {bucket_count}")
+            suffix = "{" + ",".join(labels) + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class RequestStats:
+    """
+    Timings and sizes gathered while serving one request. ``timings`` maps a step
+    name (``decode``, a pipeline stage, ``encode``, ``base64``) to seconds and is
+    handed to ``ImageProcessor`` to fill in the stage durations.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.megapixels: Optional[float] = None
+
+    @contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """``Server-Timing`` header value, durations in milliseconds"""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.timings.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(entries)
+
+
+class PipelineMetrics:
+    """Histograms served on /metrics"""
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "visionforge_stage_duration_seconds",
+            "Time per processing step: decode, each pipeline stage, encode and base64",
+            ("stage",))
+        self.request_seconds = Histogram(
+            "visionforge_request_duration_seconds", "Time to serve an image request", ("endpoint",))
+        self.request_bytes = Histogram(
+            "visionforge_request_bytes", "Encoded image bytes received", ("endpoint",), BYTE_BUCKETS)
+        self.response_bytes = Histogram(
+            "visionforge_response_bytes", "Encoded image bytes sent", ("endpoint",), BYTE_BUCKETS)
+        self.image_megapixels = Histogram(
+            "visionforge_image_megapixels", "Source image size", ("endpoint",), MEGAPIXEL_BUCKETS)
+
+    def observe_stages(self, timings: Dict[str, float]):
+        for stage, seconds in timings.items():
+            self.stage_seconds.observe(seconds, stage)
+
+    def observe(self, stats: RequestStats):
+        self.observe_stages(stats.timings)
+        self.request_seconds.observe(stats.elapsed(), stats.endpoint)
+        if stats.bytes_in:
+            self.request_bytes.observe(stats.bytes_in, stats.endpoint)
+        if stats.bytes_out:
+            self.response_bytes.observe(stats.bytes_out, stats.endpoint)
+        if stats.megapixels is not None:
+            self.image_megapixels.observe(stats.megapixels, stats.endpoint)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for histogram in (self.stage_seconds, self.request_seconds, self.request_bytes,
+                          self.response_bytes, self.image_megapixels):
+            lines.extend(histogram.render())
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,104 @@
+import copy
+from typing import Dict, Any, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# Kernel sizes accepted by cv2.Sobel
+SOBEL_KSIZES = (1, 3, 5, 7)
+
+
+def proxy_size(width: int, height: int, max_size: int) -> Tuple[int, int]:
+    """Size of the proxy of a ``width`` x ``height`` image, which is unchanged when it already fits"""
+    longest = max(width, height)
+    if max_size <= 0 or longest <= max_size:
+        return width, height
+    factor = max_size / longest
+    return max(1, int(round(width * factor))), max(1, int(round(height * factor)))
+
+
+def make_proxy(image: np.ndarray, max_size: int,
+               original_size: Optional[Tuple[int, int]] = None) -> Tuple[np.ndarray, float]:
+    """
+    Downscale ``image`` so its longest side is at most ``max_size``.
+    Returns the proxy and the scale factor applied (1.0 when no downscale was needed).
+    ``original_size`` (height, width) is the full-resolution size when ``image``
+    was decoded at a reduced size; the proxy and factor are the same as for the
+    full-resolution image.
+    """
+    h, w = original_size or image.shape[:2]
+    longest = max(h, w)
+    if max_size <= 0 or longest <= max_size:
+        return image, 1.0
+    new_w, new_h = proxy_size(w, h, max_size)
+    if (new_w, new_h) == (image.shape[1], image.shape[0]):
+        return image, max_size / longest
+    proxy = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
+    return proxy, max_size / longest
+
+
+def _odd(value: float, minimum: int) -> int:
+    """Round to the nearest odd integer no smaller than ``minimum``"""
+    k = int(round(value))
+    if k % 2 == 0:
+        k += 1
+    return max(minimum, k)
+
+
+def _scale_xy(values, factor: float):
+    return [v * factor if isinstance(v, (int, float)) else v for v in values]
+
+
+def scale_controls_for_proxy(controls: Dict[str, Any], factor: float) -> Dict[str, Any]:
+    """
+    Rescale the pixel-space parameters in ``controls`` for an image resized by ``factor``
+    so the proxy render matches a downscaled full-resolution render.
+
+    Crop is given in percent and rotation/scale are relative, so they are left as-is.
+    Kernels that are active at full resolution stay active (at their smallest
+    effective size) on the proxy rather than silently switching off.
+    """
+    if factor == 1.0:
+        return controls
+    scaled = copy.deepcopy(controls)
+
+    for key in ('translateX', 'translateY'):
+        if isinstance(scaled.get(key), (int, float)):
+            scaled[key] = scaled[key] * factor
+
+    blur = scaled.get('blur')
+    if isinstance(blur, dict) and blur.get('ksize', 3) > 3:
+        # Blur is only applied above ksize 3
+        blur['ksize'] = _odd(blur['ksize'] * factor, 5)
+
+    edges = scaled.get('edges')
+    if isinstance(edges, dict) and 'sobel_ksize' in edges:
+        target = edges['sobel_ksize'] * factor
+        edges['sobel_ksize'] = min(SOBEL_KSIZES, key=lambda k: abs(k - target))
+
+    adaptive = scaled.get('adaptiveThreshold')
+    if isinstance(adaptive, dict) and 'blockSize' in adaptive:
+        adaptive['blockSize'] = _odd(adaptive['blockSize'] * factor, 3)
+
+    morphology = scaled.get('morphology')
+    if isinstance(morphology, dict) and morphology.get('kernelSize', 3) > 1:
+        morphology['kernelSize'] = _odd(morphology['kernelSize'] * factor, 3)
+
+    draw_items = scaled.get('drawItems')
+    if isinstance(draw_items, list):
+        for item in draw_items:
+            if not isinstance(item, dict):
+                continue
+            for key in ('xywh', 'xyr', 'xyxy', 'xy'):
+                if isinstance(item.get(key), list):
+                    item[key] = _scale_xy(item[key], factor)
+            for key in ('x', 'y', 'w', 'h'):
+                if isinstance(item.get(key), (int, float)):
+                    item[key] = item[key] * factor
+            thickness = item.get('thickness')
+            if isinstance(thickness, (int, float)) and thickness > 0:
+                item['thickness'] = max(1, int(round(thickness * factor)))
+            if item.get('type') == 'text' and isinstance(item.get('scale', 1.0), (int, float)):
+                item['scale'] = item.get('scale', 1.0) * factor
+
+    return scaled
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, NamedTuple, Optional
+
+from config import DECODE_REDUCED
+from services.control_plan import ControlPlan
+from services.image_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Part of every key, so the disk tier never serves bytes rendered by older code. Bump it
+# whenever a change alters output bytes (pipeline stages, LUT rounding, decoding, encoders)
+CACHE_VERSION = 1
+
+
+class CachedResult(NamedTuple):
+    content: bytes
+    media_type: str
+    metadata: Dict[str, Any]  # response fields such as original_size and processed_size
+
+
+def result_key(image_digest: str, plan: ControlPlan, encoding: str, quality: Optional[int],
+               preview_max_size: Optional[int] = None, decode: str = 'full') -> str:
+    """
+    Content address of an encoded result: the source image digest, the compiled
+    plan (inactive stages and defaults are already normalised away) and every
+    option that changes the output bytes, including ``decode`` (``'full'``, or
+    ``'reduced'`` when the source may be decoded at reduced size, see
+    ``services.decode.decode_mode``). ``CACHE_VERSION`` and the settings that
+    change output are salted in, since disk entries outlive the process.
+    """
+    encoding = encoding.lower()
+    if encoding == 'jpg':
+        encoding = 'jpeg'
+    h = hashlib.blake2b(digest_size=20)
+    h.update(repr((CACHE_VERSION, DECODE_REDUCED, image_digest, preview_max_size or 0, encoding, quality,
+                   decode, plan)).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Encoded pipeline outputs keyed by ``result_key``.
+
+    Entries live in a byte-bounded in-memory LRU. With ``directory`` set they are
+    also written there, one file per key, so repeats survive a backend restart;
+    the directory is trimmed oldest-first (by last use) to ``disk_max_bytes``.
+    Its size is only measured on the first write or stats call, so a large cache
+    directory does not slow down startup.
+    """
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None,
+                 directory: Optional[str] = None, disk_max_bytes: int = 0):
+        self.memory = LRUCache(max_bytes=max_bytes, ttl=ttl, sizeof=lambda result: len(result.content))
+        self.directory = directory or None
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._disk_bytes: Optional[int] = None
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        result = self.memory.get(key)
+        if result is not None or not self.directory:
+            return result
+        result = self._read(key)
+        with self._lock:
+            if result is None:
+                self.disk_misses += 1
+                return None
+            self.disk_hits += 1
+        self.memory.put(key, result)
+        return result
+
+    def put(self, key: str, result: CachedResult):
+        self.memory.put(key, result)
+        if self.directory:
+            self._write(key, result)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"memory": self.memory.stats()}
+        if self.directory:
+            with self._lock:
+                stats["disk"] = {
+                    "directory": self.directory,
+                    "bytes": self._disk_usage(),
+                    "max_bytes": self.disk_max_bytes,
+                    "hits": self.disk_hits,
+                    "misses": self.disk_misses,
+                }
+        return stats
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _read(self, key: str) -> Optional[CachedResult]:
+        """One JSON header line (media type and metadata) followed by the encoded bytes"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                content = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable result cache entry %s: %s", path, e)
+            return None
+        return CachedResult(content, header["media_type"], header["metadata"])
+
+    def _write(self, key: str, result: CachedResult):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        with self._lock:
+            # Measured before the new file lands so it is not counted twice
+            self._disk_usage()
+        header = json.dumps({"media_type": result.media_type, "metadata": result.metadata}).encode() + b"\n"
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(partial, 'wb') as f:
+                f.write(header)
+                f.write(result.content)
+            os.replace(partial, path)
+        except OSError as e:
+            logger.warning("Could not write result cache entry %s: %s", path, e)
+            if os.path.exists(partial):
+                os.remove(partial)
+            return
+        with self._lock:
+            self._disk_bytes += len(header) + len(result.content)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._trim_disk()
+
+    def _disk_usage(self) -> int:
+        """Bytes on disk, walking the directory once; call with the lock held"""
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+        return self._disk_bytes
+
+    def _disk_entries(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _trim_disk(self):
+        """Delete least recently used files until the directory is back under 90% of its bound"""
+        with self._lock:
+            entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            target = self.disk_max_bytes * 0.9
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._disk_bytes = total
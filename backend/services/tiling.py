@@ -0,0 +1,24 @@
+from typing import Iterator, Tuple
+
+# (y0, y1) half-open row range of a full-width band
+Band = Tuple[int, int]
+
+# Thinner bands would spend most of their time on the halo rows
+MIN_BAND_ROWS = 64
+
+
+def band_rows(width: int, tile_pixels: int) -> int:
+    """Rows per band so that one band holds about ``tile_pixels`` pixels"""
+    return max(MIN_BAND_ROWS, tile_pixels // max(1, width))
+
+
+def band_grid(height: int, rows: int) -> Iterator[Band]:
+    """Split ``height`` rows into consecutive bands of at most ``rows`` rows"""
+    for y0 in range(0, height, rows):
+        yield y0, min(y0 + rows, height)
+
+
+def expand_band(band: Band, halo: int, height: int) -> Band:
+    """Grow ``band`` by ``halo`` rows above and below, clamped to the image"""
+    y0, y1 = band
+    return max(0, y0 - halo), min(height, y1 + halo)
@@ -0,0 +1,308 @@
+import os
+import queue
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from services.batch import RAW_EXTENSION, READABLE_EXTENSIONS, decode_file, write_file
+from services.control_plan import ControlPlan
+from services.encoding import ENCODINGS
+from services.image_processor import ImageProcessor
+
+# Output container extension -> default FourCC for cv2.VideoWriter
+VIDEO_CODECS = {'.mp4': 'mp4v', '.m4v': 'mp4v', '.mov': 'mp4v', '.avi': 'MJPG', '.mkv': 'XVID'}
+# Frame sequences carry no frame rate of their own
+DEFAULT_SEQUENCE_FPS = 25.0
+# Seconds between progress events
+PROGRESS_INTERVAL = 0.5
+
+_END = object()
+
+
+def _frame_order(name: str) -> List[Any]:
+    """Sort key that compares runs of digits numerically, so frame_2 comes before frame_10"""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name.lower())]
+
+
+def sequence_files(directory: str) -> List[str]:
+    """Readable image files of ``directory`` in frame order"""
+    names = [name for name in os.listdir(directory)
+             if os.path.splitext(name)[1].lower() in READABLE_EXTENSIONS
+             and os.path.isfile(os.path.join(directory, name))]
+    return [os.path.join(directory, name) for name in sorted(names, key=_frame_order)]
+
+
+def is_video_path(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in VIDEO_CODECS
+
+
+class FrameSource:
+    """
+    Frames of a video file, read through ``cv2.VideoCapture``, or of a directory
+    of numbered images. Directories are read file by file: OpenCV's image
+    sequence capture needs a printf pattern and only finds sequences that start
+    at index 0-4.
+    """
+
+    def __init__(self, path: str, fps: Optional[float] = None):
+        self.path = path
+        self.capture = None
+        self.files: Optional[List[str]] = None
+        if os.path.isdir(path):
+            self.files = sequence_files(path)
+            if not self.files:
+                raise ValueError(f"No frames found in {path}")
+            self.frame_count: Optional[int] = len(self.files)
+            self.fps = fps or DEFAULT_SEQUENCE_FPS
+        else:
+            self.capture = cv2.VideoCapture(path)
+            if not self.capture.isOpened():
+                raise ValueError(f"Cannot open video: {path}")
+            count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.frame_count = count if count > 0 else None
+            self.fps = fps or self.capture.get(cv2.CAP_PROP_FPS) or DEFAULT_SEQUENCE_FPS
+
+    def frames(self) -> Iterator[Tuple[Optional[np.ndarray], Optional[str]]]:
+        """Yield ``(frame, None)`` in order, or ``(None, error)`` for an unreadable sequence file"""
+        if self.files is not None:
+            for path in self.files:
+                try:
+                    yield decode_file(path), None
+                except (OSError, ValueError) as e:
+                    yield None, f"{os.path.basename(path)}: {e}"
+            return
+        try:
+            while True:
+                ok, frame = self.capture.read()
+                if not ok:
+                    break
+                yield frame, None
+        finally:
+            self.capture.release()
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+
+class FrameSink:
+    """
+    Where processed frames go. A path with a video extension is written through
+    ``cv2.VideoWriter``, strictly in frame order, into a partial file that replaces
+    ``path`` once the job succeeds; audio is not carried over. Any other path is a
+    directory of numbered images, which workers write in parallel (``parallel``).
+    """
+
+    def __init__(self, path: str, fps: float, fourcc: Optional[str] = None,
+                 encoding: str = "png", quality: Optional[int] = None):
+        self.path = path
+        self.fps = fps
+        self.encoding = encoding
+        self.quality = quality
+        self.writer = None
+        self.size: Optional[Tuple[int, int]] = None
+        self.parallel = not is_video_path(path)
+        if self.parallel:
+            self.extension = RAW_EXTENSION if encoding == "npy" else ENCODINGS[encoding][0]
+            os.makedirs(path, exist_ok=True)
+        else:
+            root, extension = os.path.splitext(path)
+            self.fourcc = fourcc or VIDEO_CODECS[extension.lower()]
+            self.partial = f"{root}.part{extension}"
+
+    def write(self, index: int, frame: np.ndarray):
+        if self.parallel:
+            write_file(frame, os.path.join(self.path, f"frame_{index:06d}{self.extension}"),
+                       self.encoding, self.quality)
+            return
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        if self.writer is None:
+            # The first frame fixes the video size
+            self.size = (frame.shape[1], frame.shape[0])
+            self.writer = cv2.VideoWriter(self.partial, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self.size)
+            if not self.writer.isOpened():
+                self.writer = None
+                raise ValueError(f"Cannot open a '{self.fourcc}' video writer for {self.path}")
+        elif (frame.shape[1], frame.shape[0]) != self.size:
+            # Percent crops of differently sized sequence frames
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self.writer.write(frame)
+
+    def close(self, success: bool):
+        if self.parallel:
+            return
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+            if success:
+                os.replace(self.partial, self.path)
+                return
+        if os.path.exists(self.partial):
+            os.remove(self.partial)
+
+
+class VideoJob:
+    """
+    Apply one compiled plan to every frame of a ``FrameSource``.
+
+    Decode, process and write form a streaming pipeline: a reader thread decodes
+    frames into a bounded queue, ``workers`` threads run the pipeline on them (and,
+    for image output, encode and write), and the thread iterating ``run`` writes
+    video frames strictly in order. At most ``max_in_flight`` frames are decoded,
+    processing or waiting for an earlier frame at any time, so memory does not
+    grow with the clip length.
+    """
+
+    def __init__(self, source: FrameSource, sink: FrameSink, plan: ControlPlan, processor: ImageProcessor,
+                 workers: int = 2, queue_size: int = 4, max_in_flight: Optional[int] = None):
+        self.source = source
+        self.sink = sink
+        self.plan = plan
+        self.processor = processor
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.max_in_flight = max_in_flight or self.queue_size + 2 * self.workers
+
+    def run(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yield failed frames and periodic progress (frames written, frames per
+        second) as they happen, then a summary with ``done: true``. Closing the
+        iterator early cancels the job and discards a partial video.
+        """
+        frames: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        results: queue.Queue = queue.Queue()
+        slots = threading.Semaphore(self.max_in_flight)
+        stop = threading.Event()
+        read_error: List[str] = []
+
+        def put(item):
+            while True:
+                try:
+                    frames.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    if stop.is_set() and item is not _END:
+                        return
+
+        def read():
+            try:
+                decoded = self.source.frames()
+                index = 0
+                while True:
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    started = time.perf_counter()
+                    item = next(decoded, None)
+                    if item is None:
+                        return
+                    frame, error = item
+                    put((index, frame, error, {"decode": time.perf_counter() - started}))
+                    index += 1
+            except Exception as e:
+                read_error.append(str(e))
+            finally:
+                self.source.release()
+                for _ in range(self.workers):
+                    put(_END)
+
+        def work():
+            while True:
+                item = frames.get()
+                if item is _END:
+                    results.put(_END)
+                    return
+                index, frame, error, timings = item
+                processed = None
+                if error is None and not stop.is_set():
+                    try:
+                        processed = self.processor.process_image(frame, self.plan, timings=timings)
+                        if self.sink.parallel:
+                            started = time.perf_counter()
+                            self.sink.write(index, processed)
+                            timings["write"] = time.perf_counter() - started
+                            processed = None
+                    except Exception as e:
+                        error = str(e)
+                results.put((index, processed, error, timings))
+
+        threads = [threading.Thread(target=read, name="visionforge-video-read", daemon=True)]
+        threads += [threading.Thread(target=work, name=f"visionforge-video-{i}", daemon=True)
+                    for i in range(self.workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        pending: Dict[int, Tuple[int, Optional[np.ndarray], Optional[str], Dict[str, float]]] = {}
+        next_index = 0
+        finished = 0
+        written = 0
+        failed = 0
+        stage_totals: Dict[str, float] = {}
+        last_report = started
+        success = False
+        try:
+            while finished < self.workers:
+                item = results.get()
+                if item is _END:
+                    finished += 1
+                    continue
+                pending[item[0]] = item
+                while next_index in pending:
+                    index, processed, error, timings = pending.pop(next_index)
+                    if error is None and processed is not None:
+                        write_started = time.perf_counter()
+                        try:
+                            self.sink.write(index, processed)
+                            timings["write"] = time.perf_counter() - write_started
+                        except Exception as e:
+                            error = str(e)
+                    slots.release()
+                    next_index += 1
+                    if error is not None:
+                        failed += 1
+                        yield {"frame": index, "success": False, "error": error}
+                        continue
+                    written += 1
+                    for name, seconds in timings.items():
+                        stage_totals[name] = stage_totals.get(name, 0.0) + seconds
+                now = time.perf_counter()
+                if now - last_report >= PROGRESS_INTERVAL:
+                    last_report = now
+                    yield self._progress(written, failed, now - started)
+            if read_error:
+                yield {"success": False, "error": f"Reading stopped early: {read_error[0]}"}
+            success = written > 0
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join(timeout=5)
+            self.sink.close(success)
+
+        elapsed = time.perf_counter() - started
+        yield {
+            "done": True,
+            "success": success,
+            **self._progress(written, failed, elapsed),
+            "output_path": self.sink.path,
+            "source_fps": round(self.source.fps, 3),
+            # Mean per written frame; stages of different frames overlap across workers
+            "stage_ms": {name: round(seconds / written * 1000, 2) for name, seconds in stage_totals.items()}
+            if written else {},
+        }
+
+    def _progress(self, written: int, failed: int, elapsed: float) -> Dict[str, Any]:
+        return {
+            "frames": written,
+            "failed": failed,
+            "frame_count": self.source.frame_count,
+            "fps": round(written / elapsed, 2) if elapsed > 0 else 0.0,
+            "elapsed_ms": round(elapsed * 1000, 2),
+        }
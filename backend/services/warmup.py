@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from services.control_plan import compile_plan
+from services.encoding import ENCODINGS, encode_image
+from services.image_processor import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+# Control sets that between them run every pipeline stage, the blur methods and
+# the morphology and text paths, on a small synthetic image
+WARMUP_CONTROLS = (
+    {
+        'grayscaleAmount': 0.5, 'rotate': 5, 'scale': 0.9, 'scaleInterpolation': 'cubic',
+        'blur': {'method': 'gaussian', 'ksize': 5}, 'sharpenStrength': 0.5,
+        'colorBoost': {'saturation': 0.2, 'hueShift': 5, 'contrast': 0.1},
+        'brightness': 5, 'blendAlpha': 0.2,
+        'drawItems': [
+            {'type': 'rect', 'xywh': [8, 8, 64, 48]},
+            {'type': 'circle', 'xyr': [96, 64, 24]},
+            {'type': 'line', 'xyxy': [0, 0, 127, 127]},
+            {'type': 'text', 'text': 'VisionForge', 'xy': [8, 120]},
+        ],
+    },
+    {
+        'colorSpace': 'HSV', 'blur': {'method': 'median', 'ksize': 5},
+        'edges': {'method': 'Canny'}, 'morphology': {'kernelSize': 5, 'operation': 'close'},
+    },
+    {
+        'blur': {'method': 'bilateral', 'ksize': 9}, 'edges': {'method': 'Sobel'},
+        'bitwise': {'operation': 'AND'},
+        'adaptiveThreshold': {'mode': 'Adaptive', 'method': 'gaussian', 'blockSize': 11, 'c': 2},
+        'morphology': {'kernelSize': 31, 'operation': 'open'},
+    },
+)
+
+
+def warm_up(processor: ImageProcessor, size: int = 128):
+    """
+    Run a synthetic ``size`` x ``size`` image through ``WARMUP_CONTROLS`` and every
+    encoder once. The first call of an OpenCV function pays for lazily loaded
+    code (codec libraries, Hershey fonts, the parallel backend), so this moves
+    that cost from the first request to startup. Nothing is cached.
+    """
+    image = cv2.resize(np.arange(48, dtype=np.uint8).reshape(4, 4, 3), (size, size),
+                       interpolation=cv2.INTER_LINEAR)
+    for controls in WARMUP_CONTROLS:
+        processor.process_image(image, compile_plan(controls))
+    for encoding in ENCODINGS:
+        content, _ = encode_image(image, encoding)
+        cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+
+
+class WarmUp:
+    """Run ``warm_up`` once on a background thread and report its state for /ready"""
+
+    def __init__(self, processor: ImageProcessor, enabled: bool = True):
+        self.processor = processor
+        self.state = 'pending' if enabled else 'off'
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def start(self):
+        if self.state != 'pending':
+            return
+        self.state = 'running'
+        threading.Thread(target=self._run, name="visionforge-warmup", daemon=True).start()
+
+    def _run(self):
+        started = time.perf_counter()
+        try:
+            warm_up(self.processor)
+            self.state = 'done'
+        except Exception as e:
+            # Only the first real request is slower; the backend still serves
+            logger.warning("Warm-up failed: %s", e)
+            self.error = str(e)
+            self.state = 'failed'
+        self.seconds = time.perf_counter() - started
+
+    @property
+    def finished(self) -> bool:
+        return self.state not in ('pending', 'running')
+
+    def status(self) -> Dict[str, Any]:
+        status: Dict[str, Any] = {"state": self.state}
+        if self.seconds is not None:
+            status["ms"] = round(self.seconds * 1000, 1)
+        if self.error:
+            status["error"] = self.error
+        return status
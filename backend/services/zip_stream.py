@@ -0,0 +1,77 @@
+import time
+import zipfile
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Formats whose payload is already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.zip'}
+
+EntryData = Union[bytes, Callable[[], Optional[bytes]]]
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object that collects what ZipFile writes"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _compress_type(name: str) -> int:
+    dot = name.rfind('.')
+    ext = name[dot:].lower() if dot >= 0 else ''
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries: Iterable[Tuple[str, EntryData]], chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """
+    Build a ZIP archive incrementally and yield it in chunks.
+
+    ``entries`` yields ``(name, data)`` where ``data`` is bytes or a callable that
+    returns bytes (or None to skip the entry); callables are only invoked when the
+    entry is written, so at most one payload is held in memory at a time. Because
+    the sink is unseekable, ZipFile writes data descriptors after each entry and the
+    central directory at the end instead of seeking back.
+    """
+    sink = _ChunkSink()
+    used_names = set()
+    with zipfile.ZipFile(sink, mode="w") as zipf:
+        for name, data in entries:
+            payload = data() if callable(data) else data
+            if payload is None:
+                continue
+            # Keep duplicate names from shadowing each other in the archive
+            unique = name
+            counter = 1
+            while unique in used_names:
+                dot = name.rfind('.')
+                stem, ext = (name[:dot], name[dot:]) if dot > 0 else (name, '')
+                unique = f"{stem}_{counter}{ext}"
+                counter += 1
+            used_names.add(unique)
+
+            info = zipfile.ZipInfo(unique, date_time=time.localtime()[:6])
+            info.compress_type = _compress_type(unique)
+            with zipf.open(info, mode="w") as entry:
+                view = memoryview(payload)
+                for offset in range(0, len(view), chunk_size):
+                    entry.write(view[offset:offset + chunk_size])
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
@@ -3,14 +3,9 @@
 Startup script for VisionForge backend
 """
 import uvicorn
-# Force inclusion of key deps when freezing with PyInstaller
-try:  # noqa: F401
-    import fastapi  # type: ignore
-    import starlette  # type: ignore
-    import pydantic  # type: ignore
-except Exception:
-    # If running in a normal python env, this import is fine; if missing, the app will fail later anyway.
-    pass
+# FastAPI, OpenCV and the app modules are not imported here: asgi.py loads them in
+# the background once the server is listening, and visionforge_backend.spec lists
+# them for PyInstaller (collect_all and datas)
 import os
 try:
     from dotenv import load_dotenv
@@ -22,6 +17,10 @@ except Exception:  # allow running without python-dotenv when frozen
 load_dotenv()
 
 if __name__ == "__main__":
+    # Needed for BATCH_EXECUTOR=process when frozen with PyInstaller
+    import multiprocessing
+    multiprocessing.freeze_support()
+
     port = int(os.getenv("PORT", 8000))
     host = os.getenv("HOST", "0.0.0.0")
     # Honor Electron override to prevent orphan processes
@@ -33,7 +32,7 @@ if __name__ == "__main__":
     print(f"Reload mode: {reload}")
     
     uvicorn.run(
-        "main:app",
+        "asgi:app",
         host=host,
         port=port,
         reload=reload,
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Tests import the backend modules the way main.py does (``config``, ``services.*``)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Keep the app's on-disk state out of the user's folders and skip the start-up warm-up
+os.environ["JOBS_DIR"] = tempfile.mkdtemp(prefix="visionforge-test-jobs-")
+os.environ["RESULT_CACHE_DIR"] = ""
+os.environ["WARMUP"] = "false"
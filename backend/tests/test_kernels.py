@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import pytest
+
+from config import MORPH_DECOMPOSE_MIN_SIZE
+from services.kernels import ellipse_kernel, morph_ellipse
+
+OPERATIONS = {"erode": (cv2.MORPH_ERODE, cv2.erode), "dilate": (cv2.MORPH_DILATE, cv2.dilate)}
+
+# Odd sizes (the only ones the control plan produces) on both sides of the default threshold
+SIZES = sorted({3, 5, 9, 15, 21, 23, 25, 31, 45} | {MORPH_DECOMPOSE_MIN_SIZE + d for d in (-2, 0, 2)})
+
+
+def shapes(size):
+    """Images from larger than the element down to thinner than it, where borders dominate"""
+    return (
+        (4 * size, 4 * size + 3, 3),
+        (size + 3, 2 * size + 1, 3),
+        (7, 3 * size, 3),
+        (3 * size, 5),
+        (size // 2 + 1, size // 2 + 2),
+        (1, size),
+    )
+
+
+@pytest.mark.parametrize("name", OPERATIONS)
+@pytest.mark.parametrize("iterations", [1, 2, 3])
+@pytest.mark.parametrize("size", [s for s in SIZES if s > 1 and s % 2 == 1])
+def test_decomposed_ellipse_matches_opencv(name, iterations, size):
+    op, fn = OPERATIONS[name]
+    rng = np.random.default_rng(size * 10 + iterations)
+    for shape in shapes(size):
+        image = rng.integers(0, 256, size=shape, dtype=np.uint8)
+        expected = fn(image, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size)), iterations=iterations)
+        decomposed = morph_ellipse(op, image, size, iterations, decompose=True)
+        assert decomposed.shape == expected.shape and decomposed.dtype == expected.dtype
+        assert np.array_equal(decomposed, expected), f"{name} size {size} x{iterations} on {shape}"
+
+
+@pytest.mark.parametrize("name", OPERATIONS)
+def test_direct_path_uses_the_full_ellipse(name):
+    op, fn = OPERATIONS[name]
+    image = np.random.default_rng(0).integers(0, 256, size=(40, 50, 3), dtype=np.uint8)
+    expected = fn(image, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (11, 11)), iterations=2)
+    assert np.array_equal(morph_ellipse(op, image, 11, 2, decompose=False), expected)
+    assert np.array_equal(ellipse_kernel(11), cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (11, 11)))
+
+
+def test_input_is_not_modified():
+    image = np.random.default_rng(1).integers(0, 256, size=(30, 30), dtype=np.uint8)
+    original = image.copy()
+    morph_ellipse(cv2.MORPH_ERODE, image, 25, 2, decompose=True)
+    assert np.array_equal(image, original)
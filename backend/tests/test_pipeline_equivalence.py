@@ -0,0 +1,111 @@
+import cv2
+import numpy as np
+import pytest
+
+from services.control_plan import compile_plan
+from services.image_processor import ImageProcessor, create_stage_cache
+from services.tiling import MIN_BAND_ROWS
+
+# Tiling, stage memoization and fused point-operation LUTs must not change a single pixel
+
+
+def image(seed=0, height=5 * MIN_BAND_ROWS + 17, width=150):
+    """Smooth colour gradients plus noise, so every stage has something to change"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(6, 9, 3), dtype=np.uint8)
+    base = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.add(base, rng.integers(0, 24, size=base.shape, dtype=np.uint8))
+
+
+def random_controls(rng):
+    """A random mix of active stages, weighted towards the point operations that fuse"""
+    controls = {}
+    if rng.random() < 0.3:
+        controls["grayscaleAmount"] = float(rng.uniform(0, 1))
+    if rng.random() < 0.2:
+        controls["colorSpace"] = str(rng.choice(["HSV", "LAB", "YCrCb"]))
+    if rng.random() < 0.2:
+        controls.update(rotate=float(rng.uniform(-20, 20)), scale=float(rng.choice([0.8, 1.0, 1.3])))
+    if rng.random() < 0.4:
+        controls["blur"] = {"method": str(rng.choice(["gaussian", "median", "bilateral", "box"])),
+                            "ksize": int(rng.choice([3, 5, 9]))}
+    if rng.random() < 0.3:
+        controls["sharpenStrength"] = float(rng.uniform(0.1, 1))
+    if rng.random() < 0.25:
+        controls["edges"] = {"method": str(rng.choice(["Canny", "Sobel"])), "sobel_ksize": int(rng.choice([3, 5]))}
+    if rng.random() < 0.4:
+        controls["bitwise"] = {"operation": str(rng.choice(["NOT", "NOT", "AND", "OR", "XOR"])),
+                               "maskThreshold": int(rng.integers(0, 256))}
+    if rng.random() < 0.2:
+        controls["adaptiveThreshold"] = {"mode": "Adaptive", "method": str(rng.choice(["mean", "gaussian"])),
+                                         "blockSize": int(rng.choice([5, 11, 25])), "c": int(rng.integers(-5, 6))}
+    if rng.random() < 0.3:
+        controls["morphology"] = {"kernelSize": int(rng.choice([3, 5, 9])), "iterations": int(rng.integers(1, 3)),
+                                  "operation": str(rng.choice(["erode", "dilate", "open", "close", "gradient"]))}
+    if rng.random() < 0.6:
+        controls["colorBoost"] = {
+            "saturation": float(rng.choice([0.0, rng.uniform(-0.5, 0.5)])),
+            "hueShift": float(rng.choice([0.0, rng.uniform(-20, 20)])),
+            "rgbGains": {channel: float(rng.uniform(0.7, 1.3)) for channel in "rgb"},
+            "contrast": float(rng.uniform(-0.3, 0.3)),
+            "brightness": float(rng.uniform(-20, 20)),
+        }
+    if rng.random() < 0.2:
+        controls["drawItems"] = [{"type": "rect", "xywh": [5, 5, 60, 40], "thickness": 3},
+                                 {"type": "line", "xyxy": [0, 0, 140, 300]}]
+    if rng.random() < 0.5:
+        controls["brightness"] = float(rng.uniform(-30, 30))
+    if rng.random() < 0.2:
+        controls["blendAlpha"] = float(rng.uniform(0.1, 0.9))
+    return controls
+
+
+def plans(seed, count=40):
+    rng = np.random.default_rng(seed)
+    return [compile_plan(random_controls(rng)) for _ in range(count)]
+
+
+class UnfusedProcessor(ImageProcessor):
+    """Runs every stage through its own method instead of composed lookup tables"""
+
+    def _point_lut(self, stage, plan):
+        return None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_tiled_output_matches_untiled(seed):
+    source = image(seed)
+    untiled = ImageProcessor()
+    tiled = ImageProcessor(tile_pixels=1, tile_min_pixels=0, tile_workers=2)
+    try:
+        for plan in plans(seed):
+            expected = untiled.process_image(source, plan)
+            assert np.array_equal(tiled.process_image(source, plan), expected), plan
+    finally:
+        tiled.shutdown()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_memoized_output_matches_fresh(seed):
+    source = image(seed)
+    source.flags.writeable = False
+    fresh = ImageProcessor()
+    memoized = ImageProcessor(stage_cache=create_stage_cache(64 * 1024 * 1024))
+    reused = 0
+    # Revisit earlier plans and vary one control at a time, as an editing session does
+    sequence = plans(seed, 20)
+    sequence += sequence[::-1] + [plan._replace(final=sequence[0].final) for plan in sequence]
+    for plan in sequence:
+        output, info = memoized.run(source, plan, image_key=f"image-{seed}")
+        reused += info["reused_stages"]
+        assert np.array_equal(output, fresh.process_image(source, plan)), plan
+    assert reused > 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fused_luts_match_stage_by_stage(seed):
+    source = image(seed)
+    fused = ImageProcessor()
+    unfused = UnfusedProcessor()
+    for plan in plans(seed):
+        assert np.array_equal(fused.process_image(source, plan), unfused.process_image(source, plan)), plan
@@ -0,0 +1,73 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from services.control_plan import compile_plan
+
+CONTROLS = {"scale": 0.5, "scaleInterpolation": "area", "grayscaleAmount": 0.3}
+
+
+@pytest.fixture(scope="module")
+def app_client():
+    # One app lifespan per module: shutdown closes the job store for good
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture()
+def client(app_client):
+    main.result_cache.memory.clear()
+    return app_client
+
+
+def jpeg(seed=0, size=(96, 128)):
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(size[0] // 8, size[1] // 8, 3), dtype=np.uint8)
+    image = cv2.resize(small, (size[1], size[0]), interpolation=cv2.INTER_CUBIC)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+
+def full_decode_render(data, controls):
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return main.image_processor.process_image(image, compile_plan(controls))
+
+
+def decode_png(content):
+    return cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def test_reduced_decode_result_is_not_served_for_registered_image(client):
+    data = jpeg()
+    controls = json.dumps(CONTROLS)
+    uploaded = client.post("/process-image", files={"image": ("a.jpg", data, "image/jpeg")},
+                           data={"controls": controls, "response_format": "binary"})
+    assert uploaded.status_code == 200 and uploaded.headers["X-Result-Cache"] == "miss"
+
+    image_id = client.post("/register-image", files={"image": ("a.jpg", data, "image/jpeg")}).json()["image_id"]
+    registered = client.post("/process-cached-image",
+                             data={"image_id": image_id, "controls": controls, "response_format": "binary"})
+    assert registered.status_code == 200 and registered.headers["X-Result-Cache"] == "miss"
+    expected = full_decode_render(data, CONTROLS)
+    assert np.array_equal(decode_png(registered.content), expected)
+
+    # Each path is still answered from its own entry
+    again = client.post("/process-image", files={"image": ("a.jpg", data, "image/jpeg")},
+                        data={"controls": controls, "response_format": "binary"})
+    assert again.headers["X-Result-Cache"] == "hit" and again.content == uploaded.content
+
+
+def test_full_size_decodes_share_entries(client):
+    # A PNG is always decoded at full size, so both endpoints may share a result
+    data = cv2.imencode(".png", cv2.imdecode(np.frombuffer(jpeg(1), np.uint8), cv2.IMREAD_COLOR))[1].tobytes()
+    controls = json.dumps(CONTROLS)
+    client.post("/process-image", files={"image": ("a.png", data, "image/png")},
+                data={"controls": controls, "response_format": "binary"})
+    image_id = client.post("/register-image", files={"image": ("a.png", data, "image/png")}).json()["image_id"]
+    registered = client.post("/process-cached-image",
+                             data={"image_id": image_id, "controls": controls, "response_format": "binary"})
+    assert registered.headers["X-Result-Cache"] == "hit"
+    assert np.array_equal(decode_png(registered.content), full_decode_render(data, CONTROLS))
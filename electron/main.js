@@ -1,11 +1,19 @@
-const { app, BrowserWindow, Menu, dialog } = require('electron');
+const { app, BrowserWindow, Menu, dialog, session } = require('electron');
 const path = require('path');
+const crypto = require('crypto');
 const { spawn } = require('child_process');
 const isDev = process.env.NODE_ENV === 'development';
 
 let mainWindow;
 let backendProcess;
 let shutdownWatchdogInterval = null;
+// Per-launch secret for the backend's local-disk endpoints (see backend LOCAL_BATCH_TOKEN).
+// Only requests from this app's windows get it, so other web pages cannot use them
+const localBatchToken = crypto.randomBytes(32).toString('hex');
+const LOCAL_BATCH_URLS = ['localhost', '127.0.0.1'].flatMap((host) => [
+  `http://${host}:8000/process-batch-local*`,
+  `http://${host}:8000/process-video*`
+]);
 
 async function startBackend() {
   console.log('Starting backend server...');
@@ -16,6 +24,10 @@ async function startBackend() {
   const { app: electronApp } = require('electron');
   const logsDir = path.join(electronApp.getPath('userData'), 'logs');
   try { if (!fs.existsSync(logsDir)) fs.mkdirSync(logsDir, { recursive: true }); } catch (_) {}
+  // Encoded results persist here between launches (see backend RESULT_CACHE_DIR)
+  const resultCacheDir = path.join(electronApp.getPath('userData'), 'result-cache');
+  // Background batch jobs and their outputs survive restarts here (see backend JOBS_DIR)
+  const jobsDir = path.join(electronApp.getPath('userData'), 'jobs');
   const logFile = path.join(logsDir, `backend-${Date.now()}.log`);
   const logStream = fs.createWriteStream(logFile, { flags: 'a' });
   
@@ -32,7 +44,10 @@ async function startBackend() {
           env: {
             ...process.env,
             ELECTRON: '1',
-            RELOAD: 'false'
+            RELOAD: 'false',
+            RESULT_CACHE_DIR: process.env.RESULT_CACHE_DIR || resultCacheDir,
+            JOBS_DIR: process.env.JOBS_DIR || jobsDir,
+            LOCAL_BATCH_TOKEN: localBatchToken
           }
         });
 
@@ -84,7 +99,10 @@ async function startBackend() {
     env: {
       ...process.env,
       ELECTRON: '1',
-      RELOAD: 'false'
+      RELOAD: 'false',
+      RESULT_CACHE_DIR: process.env.RESULT_CACHE_DIR || resultCacheDir,
+      JOBS_DIR: process.env.JOBS_DIR || jobsDir,
+      LOCAL_BATCH_TOKEN: localBatchToken
     }
   });
 
@@ -129,7 +147,10 @@ async function startBackend() {
         env: {
           ...process.env,
           ELECTRON: '1',
-          RELOAD: 'false'
+          RELOAD: 'false',
+          RESULT_CACHE_DIR: process.env.RESULT_CACHE_DIR || resultCacheDir,
+          JOBS_DIR: process.env.JOBS_DIR || jobsDir,
+          LOCAL_BATCH_TOKEN: localBatchToken
         }
       });
       backendProcess.stdout.on('data', (data) => { console.log(`Backend: ${data}`); try { logStream.write(data); } catch (_) {} });
@@ -155,9 +176,10 @@ async function waitForBackendReady(timeoutMs = 15000) {
     } catch (_) {
       // ignore until ready
     }
-    // wait 300ms between attempts
+    // /health answers as soon as the server listens, before OpenCV is loaded;
+    // requests sent earlier than /ready simply wait for it
     // eslint-disable-next-line no-await-in-loop
-    await new Promise((r) => setTimeout(r, 300));
+    await new Promise((r) => setTimeout(r, 100));
   }
   return false;
 }
@@ -287,6 +309,10 @@ function createWindow() {
 
 // This method will be called when Electron has finished initialization
 app.whenReady().then(() => {
+  session.defaultSession.webRequest.onBeforeSendHeaders({ urls: LOCAL_BATCH_URLS }, (details, callback) => {
+    callback({ requestHeaders: { ...details.requestHeaders, 'X-VisionForge-Token': localBatchToken } });
+  });
+
   // Start backend server first, then wait until it's ready
   startBackend()
     .then(() => waitForBackendReady())
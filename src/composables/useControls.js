@@ -16,7 +16,7 @@ const getInitialState = () => ({
   cropAspect: 'None',
 
   // Filters
-  blur: { method: 'gaussian', ksize: 3 },
+  blur: { method: 'gaussian', ksize: 3, accuracy: 'exact' },
   sharpenStrength: 0,
 
   // Edges
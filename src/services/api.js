@@ -1,5 +1,16 @@
 const API_BASE_URL = 'http://localhost:8000';
 
+// Top-level control entries whose value changed; nested objects are sent whole
+const diffControls = (previous, next) => {
+  const delta = {};
+  for (const [key, value] of Object.entries(next)) {
+    if (JSON.stringify(previous[key]) !== JSON.stringify(value)) {
+      delta[key] = value;
+    }
+  }
+  return delta;
+};
+
 class ApiService {
   constructor() {
     this.baseURL = API_BASE_URL;
@@ -59,6 +70,72 @@ class ApiService {
     }
   }
 
+  async registerImage(imageData) {
+    try {
+      const formData = new FormData();
+      if (imageData instanceof File) {
+        formData.append('image', imageData);
+      } else {
+        formData.append('image_data', imageData);
+      }
+
+      const response = await fetch(`${this.baseURL}/register-image`, {
+        method: 'POST',
+        body: formData,
+      });
+
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+
+      const result = await response.json();
+      return result;
+    } catch (error) {
+      console.error('Error registering image:', error);
+      throw error;
+    }
+  }
+
+  async processCachedImage(imageId, controls, options = {}) {
+    const { previewMaxSize = null, responseFormat = 'json', encoding = 'png', quality = null } = options;
+    const formData = new FormData();
+    formData.append('image_id', imageId);
+    formData.append('controls', JSON.stringify(controls));
+    if (previewMaxSize) {
+      // Render on a downscaled proxy for interactive preview
+      formData.append('preview_max_size', String(previewMaxSize));
+    }
+    formData.append('response_format', responseFormat);
+    formData.append('encoding', encoding);
+    if (quality !== null) {
+      formData.append('quality', String(quality));
+    }
+
+    const response = await fetch(`${this.baseURL}/process-cached-image`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const error = new Error(`HTTP error! status: ${response.status}`);
+      error.status = response.status;
+      throw error;
+    }
+
+    if (responseFormat === 'binary') {
+      // Raw image bytes; metadata travels in X- headers
+      const blob = await response.blob();
+      return {
+        success: true,
+        processed_image: URL.createObjectURL(blob),
+        original_size: response.headers.get('X-Original-Size')?.split(',').map(Number),
+        processed_size: response.headers.get('X-Processed-Size')?.split(',').map(Number),
+      };
+    }
+
+    return await response.json();
+  }
+
   async uploadImage(file) {
     try {
       const formData = new FormData();
@@ -82,6 +159,242 @@ class ApiService {
     }
   }
 
+  // Sends all images in one request; onResult is called for each NDJSON line as images complete
+  async processBatch(images, controls, onResult, signal = undefined) {
+    const formData = new FormData();
+    for (const image of images) {
+      const blob = await (await fetch(image.dataUrl)).blob();
+      formData.append('images', blob, image.name);
+    }
+    formData.append('controls', JSON.stringify(controls));
+
+    const response = await fetch(`${this.baseURL}/process-batch`, {
+      method: 'POST',
+      body: formData,
+      signal,
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return this.readBatchStream(response, onResult);
+  }
+
+  // Queue the batch as a background job; returns the job description with its job_id.
+  // Progress is then read with getJob/watchJob, independent of this request.
+  async submitJob(images, controls, options = {}) {
+    const formData = new FormData();
+    for (const image of images) {
+      const blob = await (await fetch(image.dataUrl)).blob();
+      formData.append('images', blob, image.name);
+    }
+    formData.append('controls', JSON.stringify(controls));
+    if (options.encoding) formData.append('encoding', options.encoding);
+    if (options.quality !== undefined) formData.append('quality', String(options.quality));
+
+    const response = await fetch(`${this.baseURL}/jobs`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return await response.json();
+  }
+
+  // Job state and counts, with the items changed since the `seq` of an earlier call (all items when null)
+  async getJob(jobId, since = null) {
+    const query = since === null ? '' : `?since=${since}`;
+    const response = await fetch(`${this.baseURL}/jobs/${jobId}${query}`);
+    if (!response.ok) {
+      const error = new Error(`HTTP error! status: ${response.status}`);
+      error.status = response.status;
+      throw error;
+    }
+    return await response.json();
+  }
+
+  // Subscribe to a job: onUpdate receives the job with its newly changed items until it stops
+  // running. Resolves with the last update.
+  async watchJob(jobId, onUpdate, since = null, signal = undefined) {
+    const query = since === null ? '' : `?since=${since}`;
+    const response = await fetch(`${this.baseURL}/jobs/${jobId}/events${query}`, { signal });
+    if (!response.ok) {
+      const error = new Error(`HTTP error! status: ${response.status}`);
+      error.status = response.status;
+      throw error;
+    }
+    let last = null;
+    await this.readBatchStream(response, (update) => {
+      last = update;
+      onUpdate(update);
+    });
+    return last;
+  }
+
+  async cancelJob(jobId) {
+    const response = await fetch(`${this.baseURL}/jobs/${jobId}/cancel`, { method: 'POST' });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return await response.json();
+  }
+
+  async resumeJob(jobId) {
+    const response = await fetch(`${this.baseURL}/jobs/${jobId}/resume`, { method: 'POST' });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return await response.json();
+  }
+
+  // URL of a finished job item's output, served from the backend's disk
+  jobOutputUrl(jobId, index) {
+    return `${this.baseURL}/jobs/${jobId}/items/${index}/output`;
+  }
+
+  // Desktop only: process images already on disk and write results to outputDir.
+  // `source` is a directory path or an array of file paths; no pixels cross HTTP.
+  async processBatchLocal(source, outputDir, controls, onResult, options = {}, signal = undefined) {
+    const formData = new FormData();
+    if (Array.isArray(source)) {
+      formData.append('input_paths', JSON.stringify(source));
+    } else {
+      formData.append('input_dir', source);
+    }
+    formData.append('output_dir', outputDir);
+    formData.append('controls', JSON.stringify(controls));
+    if (options.encoding) formData.append('encoding', options.encoding);
+    if (options.quality !== undefined) formData.append('quality', String(options.quality));
+    if (options.overwrite) formData.append('overwrite', 'true');
+
+    const response = await fetch(`${this.baseURL}/process-batch-local`, {
+      method: 'POST',
+      body: formData,
+      signal,
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return this.readBatchStream(response, onResult);
+  }
+
+  // Desktop only: apply controls to every frame of a local video file or frame directory.
+  // outputPath ending in .mp4/.mov/.avi/.mkv is written as a video, anything else as a
+  // directory of numbered frames. onProgress receives progress and failed-frame lines.
+  async processVideoLocal(source, outputPath, controls, onProgress, options = {}, signal = undefined) {
+    const formData = new FormData();
+    formData.append('source', source);
+    formData.append('output_path', outputPath);
+    formData.append('controls', JSON.stringify(controls));
+    if (options.fourcc) formData.append('fourcc', options.fourcc);
+    if (options.fps) formData.append('fps', String(options.fps));
+    if (options.encoding) formData.append('encoding', options.encoding);
+    if (options.quality !== undefined) formData.append('quality', String(options.quality));
+    if (options.overwrite) formData.append('overwrite', 'true');
+
+    const response = await fetch(`${this.baseURL}/process-video`, {
+      method: 'POST',
+      body: formData,
+      signal,
+    });
+
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    return this.readBatchStream(response, onProgress);
+  }
+
+  // Live preview of a registered image over a WebSocket. send() streams each control
+  // state as a delta against the previous one; the server renders only the newest
+  // state and answers with binary frames tagged with the version they render.
+  openPreviewSocket(imageId, options = {}, handlers = {}) {
+    const { previewMaxSize = null, encoding = 'jpeg', quality = null } = options;
+    const { onFrame, onError, onClose } = handlers;
+    const params = new URLSearchParams({ encoding });
+    if (previewMaxSize) params.set('preview_max_size', String(previewMaxSize));
+    if (quality !== null) params.set('quality', String(quality));
+
+    const socket = new WebSocket(`${this.baseURL.replace(/^http/, 'ws')}/ws/preview/${imageId}?${params}`);
+    socket.binaryType = 'arraybuffer';
+    let mediaType = 'image/jpeg';
+    let version = 0;
+    let lastSent = null;
+    let resolveReady;
+    let rejectReady;
+    const ready = new Promise((resolve, reject) => {
+      resolveReady = resolve;
+      rejectReady = reject;
+    });
+
+    socket.onmessage = (event) => {
+      if (typeof event.data === 'string') {
+        const message = JSON.parse(event.data);
+        if (message.type === 'ready') {
+          mediaType = message.media_type;
+          resolveReady();
+        } else if (message.type === 'error') {
+          onError?.(message);
+        }
+        return;
+      }
+      // 4-byte big-endian control version, then the encoded image
+      const frameVersion = new DataView(event.data).getUint32(0);
+      const blob = new Blob([event.data.slice(4)], { type: mediaType });
+      onFrame?.({ version: frameVersion, latest: frameVersion === version, url: URL.createObjectURL(blob) });
+    };
+    socket.onclose = (event) => {
+      const error = new Error(`Preview socket closed: ${event.code} ${event.reason}`);
+      error.status = event.code === 4404 ? 404 : event.code;
+      rejectReady(error);
+      onClose?.(event);
+    };
+
+    return {
+      imageId,
+      ready,
+      isOpen: () => socket.readyState === WebSocket.OPEN,
+      send(controls) {
+        const snapshot = JSON.parse(JSON.stringify(controls));
+        version += 1;
+        const message = lastSent
+          ? { version, delta: diffControls(lastSent, snapshot) }
+          : { version, controls: snapshot };
+        lastSent = snapshot;
+        socket.send(JSON.stringify(message));
+        return version;
+      },
+      close: () => socket.close(),
+    };
+  }
+
+  // Read a newline-delimited JSON batch stream, reporting each result and returning the summary line
+  async readBatchStream(response, onResult) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    let summary = null;
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffered += decoder.decode(value, { stream: true });
+      const lines = buffered.split('\n');
+      buffered = lines.pop();
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const result = JSON.parse(line);
+        if (result.done) {
+          summary = result;
+        } else {
+          onResult(result);
+        }
+      }
+    }
+    return summary;
+  }
+
   async healthCheck() {
     try {
       const response = await fetch(`${this.baseURL}/health`);